@@ -1,112 +1,182 @@
 import json
+import logging
 import os
+import re
 import sys
-import traceback
+import time
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler
 from typing import Dict, Any
 from io import BytesIO
-
-# Add debug logging
-print("=== Debug Information ===")
-print("Python Version:", sys.version)
-print("Current Directory:", os.getcwd())
-print("Directory Contents:", os.listdir())
-print("Python Path:", sys.path)
-print("Environment Variables:", {k: v for k, v in os.environ.items() if not k.startswith(('AWS_', 'OPENAI_'))})
-print("=== Module Information ===")
-print("Current module:", __name__)
-print("Module dict:", globals().keys())
-print("======================")
+from urllib.parse import urlparse, parse_qs
 
 # Add project root to Python path haha 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from src.backend.profiling import get_profiler, profiles_response, DEBUG_HEADER
+from src.backend.structured_logging import get_logger, log_duration
+from src.backend.responses import (
+    API_HEADERS, API_HEADER_BLOCK, encode_header_block, http_response_bytes, json_body
+)
+from src.backend.response_ingest import get_ingestor, InvalidResponse, QuotaExceeded, TOKEN_HEADER
+from src.backend.response_screening import request_fingerprint
+from src.backend.response_archive import ArchiveUnavailable
+from src.backend.survey_definitions import SurveyNotFound, definition_response, get_definition_cache, load_definition
+from src.backend.survey_responses import load_survey_responses, responses_csv, require_owner, NotSurveyOwner
+from src.backend.answer_clusters import get_answer_clusterer
+from src.backend.text_scoring import get_text_insights
+from src.backend.filter_cube import get_filter_cube, DAY_PATTERN
+from src.backend.survey_translation import get_survey_translator, InvalidLanguage, TranslationUnavailable
+from src.backend.survey_summaries import list_survey_summaries, InvalidCursor
+from src.backend.supabase_rest import get_client
+from src.backend.idempotency import (
+    get_idempotency_store, IdempotencyConflict, InvalidIdempotencyKey, IDEMPOTENCY_HEADER, REPLAYED_HEADER
+)
+
+logger = get_logger('api.index')
+profiler = get_profiler()
+
+# /api/surveys/<id>/responses and /api/surveys/<id>/responses/draft
+RESPONSES_PATH = re.compile(r'^/api/surveys/([^/]+)/responses(/draft)?$')
+# /api/surveys/<id>/definition
+DEFINITION_PATH = re.compile(r'^/api/surveys/([^/]+)/definition$')
+# Owner analytics: /api/surveys/<id>/answer-clusters
+ANALYTICS_PATH = re.compile(r'^/api/surveys/([^/]+)/(answer-clusters|text-insights)$')
+# /api/surveys/<id>/quarantine, .../quarantine/<qid> and .../quarantine/<qid>/release
+QUARANTINE_PATH = re.compile(r'^/api/surveys/([^/]+)/quarantine(?:/([^/]+?)(/release)?)?$')
+BREAKDOWN_PATH = re.compile(r'^/api/surveys/([^/]+)/breakdown$')
+TRANSLATIONS_PATH = re.compile(r'^/api/surveys/([^/]+)/translations$')
+ANALYTICS = {'answer-clusters': get_answer_clusterer, 'text-insights': get_text_insights}
+
+# Cold-start debug information
+logger.debug("Module loaded", extra={
+    'python_version': sys.version,
+    'cwd': os.getcwd(),
+    'sys_path': sys.path,
+    'env_keys': sorted(k for k in os.environ if not k.startswith(('AWS_', 'OPENAI_'))),
+    'module': __name__,
+})
+
 class handler(BaseHTTPRequestHandler):
     """
     Handler class for Vercel serverless deployment.
     Must inherit from BaseHTTPRequestHandler as required by Vercel.
     """
-    def __init__(self, *args, **kwargs):
-        print("=== Handler Initialization ===")
-        print("Args:", args)
-        print("Kwargs:", {k: v for k, v in kwargs.items() if not k.startswith(('AWS_', 'OPENAI_'))})
-        super().__init__(*args, **kwargs)
-    
+    def log_message(self, format, *args):
+        """Route the default access log through the structured logger"""
+        logger.debug(format % args)
+
     def log_request_info(self):
         """Log detailed request information"""
-        print("\n=== Request Information ===")
-        print(f"Path: {self.path}")
-        print(f"Command: {self.command}")
-        print(f"Request version: {self.request_version}")
-        print(f"Headers: {dict(self.headers)}")
-        print("========================\n")
+        self._started = time.perf_counter()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Request received", extra={
+                'path': self.path,
+                'command': self.command,
+                'request_version': self.request_version,
+                'headers': dict(self.headers),
+            })
+
+    def _log_response(self, status_code: int, body):
+        """Log the response status, timing and (at debug level) body"""
+        log_duration(logger, "Request handled", getattr(self, '_started', time.perf_counter()),
+                     path=self.path, command=self.command, status=int(status_code))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response body", extra={'path': self.path, 'body': body})
 
     def _send_response(self, status_code: int, body: Dict[str, Any], headers: Dict[str, str] = None):
         """Helper method to send responses with logging"""
-        print(f"\n=== Sending Response ===")
-        print(f"Status Code: {status_code}")
-        print(f"Headers: {headers}")
-        print(f"Body: {body}")
-        print("=====================\n")
-
-        if headers is None:
-            headers = {}
-            
-        # Default CORS headers
-        default_headers = {
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Content-Type': 'application/json'
-        }
-        
-        # Merge default headers with provided headers
-        headers = {**default_headers, **headers}
-        
+        self._log_response(status_code, body)
+        self._status_code = status_code
         try:
-            # Send response
-            self.send_response(status_code)
-            for key, value in headers.items():
-                self.send_header(key, value)
-            self.end_headers()
-            
-            # Send body if present
-            if body:
-                response = json.dumps(body).encode('utf-8')
-                self.wfile.write(response)
-        except Exception as e:
-            print(f"Error sending response: {e}")
-            print(f"Traceback: {traceback.format_exc()}")
+            # Default CORS headers are pre-encoded; only merge when overridden
+            header_block = None
+            if headers:
+                header_block = encode_header_block({**API_HEADERS, **headers})
+            self._write(status_code, json_body(body) if body else b'', header_block)
+        except Exception:
+            logger.exception("Error sending response")
             raise
 
+    def _send_raw(self, status_code: int, data, content_type: str, headers: Dict[str, str] = None):
+        """Send a non-JSON response body"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._log_response(status_code, data)
+        self._status_code = status_code
+        self._write(status_code, data, encode_header_block({
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': content_type,
+            **(headers or {}),
+        }))
+
+    def _write(self, status_code: int, body: bytes, header_block: bytes = None):
+        """Write status line, headers and body with a single write"""
+        self.log_request(int(status_code))
+        self.wfile.write(http_response_bytes(self.protocol_version, status_code, body, header_block or API_HEADER_BLOCK))
+
+    def _profiled(self, handle):
+        """Run a request handler, profiling it if the request is sampled"""
+        if not profiler.enabled:
+            return handle()
+        self._status_code = None
+        session = profiler.start(self.command, self.path, self.headers.get(DEBUG_HEADER))
+        try:
+            return handle()
+        finally:
+            profiler.stop(session, self._status_code)
+
+    def _send_profiles(self):
+        """Serve captured request profiles to an authorized admin"""
+        url = urlparse(self.path)
+        profile_id = url.path[len('/api/admin/profiles'):].strip('/') or None
+        fmt = parse_qs(url.query).get('format', [None])[0]
+        status, body, content_type = profiles_response(
+            profiler, self.headers.get('Authorization'), profile_id, fmt
+        )
+        if isinstance(body, dict):
+            self._send_response(status, body)
+        else:
+            self._send_raw(status, body, content_type)
+
     def do_OPTIONS(self):
         """Handle OPTIONS requests for CORS"""
         self.log_request_info()
-        print("Handling OPTIONS request")
         self._send_response(HTTPStatus.OK, {})
 
     def do_GET(self):
         """Handle GET requests"""
+        self._profiled(self._handle_get)
+
+    def _handle_get(self):
         self.log_request_info()
         try:
             if self.path == "/api/test":
-                print("Handling test endpoint")
                 self._send_response(
                     HTTPStatus.OK,
                     {"message": "API is working!"}
                 )
+            elif self.path.startswith("/api/admin/profiles"):
+                self._send_profiles()
+            elif urlparse(self.path).path == '/api/surveys':
+                self._handle_list_surveys()
+            elif DEFINITION_PATH.match(urlparse(self.path).path):
+                self._handle_definition()
+            elif ANALYTICS_PATH.match(urlparse(self.path).path):
+                self._handle_analytics()
+            elif BREAKDOWN_PATH.match(urlparse(self.path).path):
+                self._handle_breakdown()
+            elif QUARANTINE_PATH.match(urlparse(self.path).path):
+                self._handle_quarantine()
+            elif RESPONSES_PATH.match(urlparse(self.path).path):
+                self._handle_responses(None)
             else:
-                print(f"Invalid path requested: {self.path}")
                 self._send_response(
                     HTTPStatus.NOT_FOUND,
                     {"error": "Invalid endpoint", "requested_path": self.path}
                 )
         except Exception as e:
-            print("=== Handler Error ===")
-            print(f"Error type: {type(e)}")
-            print(f"Error message: {str(e)}")
-            print(f"Full traceback: {traceback.format_exc()}")
+            logger.exception("Handler error", extra={'path': self.path, 'error_type': str(type(e))})
             self._send_response(
                 HTTPStatus.INTERNAL_SERVER_ERROR,
                 {
@@ -116,17 +186,273 @@ class handler(BaseHTTPRequestHandler):
                 }
             )
 
+    def _caller_token(self):
+        """The caller's Supabase JWT from the Authorization header, if any"""
+        auth = self.headers.get('Authorization', '')
+        return auth[7:] if auth.startswith('Bearer ') else None
+
+    def _handle_list_surveys(self):
+        """Dashboard list (GET /api/surveys): counts only, paged by a (created_at, id) cursor"""
+        token = self._caller_token()
+        if not token:
+            self._send_response(HTTPStatus.UNAUTHORIZED, {'error': 'Unauthorized'})
+            return
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            page = list_survey_summaries(
+                get_client().as_user(token), query.get('limit', [None])[0], query.get('cursor', [None])[0]
+            )
+        except InvalidCursor as e:
+            self._send_response(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+            return
+        self._send_response(HTTPStatus.OK, page)
+
+    def _owner_client(self, survey_id):
+        """The caller's client if they own the survey; otherwise sends 401/403/404 and returns None"""
+        token = self._caller_token()
+        if not token:
+            self._send_response(HTTPStatus.UNAUTHORIZED, {'error': 'Unauthorized'})
+            return None
+        try:
+            return require_owner(survey_id, token)
+        except SurveyNotFound:
+            self._send_response(HTTPStatus.NOT_FOUND, {'error': 'Survey not found'})
+        except NotSurveyOwner:
+            self._send_response(HTTPStatus.FORBIDDEN, {'error': 'Forbidden'})
+        return None
+
+    def _handle_analytics(self):
+        """Analytics of a survey's responses for its owner (GET .../answer-clusters, .../text-insights)"""
+        survey_id, kind = ANALYTICS_PATH.match(urlparse(self.path).path).groups()
+        client = self._owner_client(survey_id)
+        if client is None:
+            return
+        try:
+            questions, responses = load_survey_responses(survey_id, client)
+        except ArchiveUnavailable as e:
+            logger.error("Archived responses unavailable", extra={'survey_id': survey_id, 'error': str(e)})
+            self._send_response(HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(e)})
+            return
+        # Only responses added since the last call are processed; state is cached per instance
+        result = ANALYTICS[kind]().update(survey_id, questions, responses)
+        self._send_response(HTTPStatus.OK, {'surveyId': survey_id, 'questions': result})
+
+    def _handle_quarantine(self):
+        """Held responses (GET .../quarantine), release (POST .../<qid>/release) and discard (DELETE .../<qid>)"""
+        url = urlparse(self.path)
+        survey_id, quarantine_id, release = QUARANTINE_PATH.match(url.path).groups()
+        # GET lists, POST needs /release, DELETE must not have it
+        if (self.command == 'GET') != (quarantine_id is None) or (self.command == 'POST') != bool(release):
+            self._send_response(HTTPStatus.NOT_FOUND, {'error': 'Invalid endpoint', 'requested_path': self.path})
+            return
+        token = self._caller_token()
+        if not token:
+            self._send_response(HTTPStatus.UNAUTHORIZED, {'error': 'Unauthorized'})
+            return
+        # The quarantine table is only visible to the survey's owner (RLS)
+        client = get_client().as_user(token)
+        ingestor = get_ingestor()
+        try:
+            if self.command == 'GET':
+                query = parse_qs(url.query)
+                result = ingestor.quarantined(
+                    client, survey_id, query.get('limit', [None])[0], query.get('cursor', [None])[0]
+                )
+            elif self.command == 'POST':
+                result = ingestor.release(client, survey_id, quarantine_id)
+            else:
+                result = ingestor.discard(client, survey_id, quarantine_id)
+        except InvalidResponse as e:
+            self._send_response(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+            return
+        except QuotaExceeded:
+            self._send_response(HTTPStatus.PAYMENT_REQUIRED, {'error': 'This survey has reached its response limit'})
+            return
+        except SurveyNotFound:
+            error = 'Survey not found' if quarantine_id is None else 'Quarantined response not found'
+            self._send_response(HTTPStatus.NOT_FOUND, {'error': error})
+            return
+        self._send_response(HTTPStatus.OK, result)
+
+    def _handle_breakdown(self):
+        """Choice counts for a date range and filter (GET .../breakdown), from the per-instance cube"""
+        url = urlparse(self.path)
+        survey_id = BREAKDOWN_PATH.match(url.path).group(1)
+        query = parse_qs(url.query)
+        since, until = query.get('since', [None])[0], query.get('until', [None])[0]
+        if any(day and not DAY_PATTERN.match(day) for day in (since, until)):
+            self._send_response(HTTPStatus.BAD_REQUEST, {'error': 'since and until must be YYYY-MM-DD'})
+            return
+        client = self._owner_client(survey_id)
+        if client is None:
+            return
+        cube = get_filter_cube()
+        rows = client.select('survey_response_counters', 'response_count', {'survey_id': f"eq.{survey_id}"}, limit=1)
+        count = rows[0]['response_count'] if rows else 0
+        # Responses are only reloaded when submits reached other instances since the last load
+        if not cube.fresh(survey_id, count):
+            try:
+                questions, responses = load_survey_responses(survey_id, client)
+            except ArchiveUnavailable as e:
+                logger.error("Archived responses unavailable", extra={'survey_id': survey_id, 'error': str(e)})
+                self._send_response(HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(e)})
+                return
+            cube.update(survey_id, questions, responses, count)
+        result = cube.query(
+            survey_id, since, until, query.get('filterQuestion', [None])[0], query.get('filterChoice', [None])[0]
+        )
+        self._send_response(HTTPStatus.OK, {'surveyId': survey_id, 'days': cube.days(survey_id), **result})
+
+    def _handle_translations(self, data):
+        """Translate a survey for its owner (POST .../translations); phrases are cached per instance"""
+        survey_id = TRANSLATIONS_PATH.match(urlparse(self.path).path).group(1)
+        client = self._owner_client(survey_id)
+        if client is None:
+            return
+        try:
+            translations = get_survey_translator().translate_many(
+                load_definition(survey_id, client), data.get('languages')
+            )
+        except InvalidLanguage as e:
+            self._send_response(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+            return
+        except SurveyNotFound:
+            self._send_response(HTTPStatus.NOT_FOUND, {'error': 'Survey not found'})
+            return
+        except TranslationUnavailable as e:
+            self._send_response(HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(e)})
+            return
+        self._send_response(HTTPStatus.OK, {'surveyId': survey_id, 'translations': translations})
+
+    def _handle_definition(self):
+        """Questions of a survey for respondents, cached per instance, with ETag/304 and compression"""
+        survey_id = DEFINITION_PATH.match(urlparse(self.path).path).group(1)
+        try:
+            status, body, headers = definition_response(
+                get_definition_cache(), survey_id,
+                self.headers.get('If-None-Match'), self.headers.get('Accept-Encoding')
+            )
+        except SurveyNotFound:
+            self._send_response(HTTPStatus.NOT_FOUND, {'error': 'Survey not found'})
+            return
+        self._log_response(status, body)
+        self._status_code = status
+        self._write(status, body, encode_header_block({'Access-Control-Allow-Origin': '*', **headers}))
+
+    def _handle_export(self, survey_id):
+        """All responses of a survey for its owner (GET .../responses), archived ones first; ?format=csv"""
+        # Archived segments are read without row level security
+        client = self._owner_client(survey_id)
+        if client is None:
+            return
+        try:
+            questions, responses = load_survey_responses(survey_id, client)
+        except SurveyNotFound:
+            self._send_response(HTTPStatus.NOT_FOUND, {'error': 'Survey not found'})
+            return
+        except ArchiveUnavailable as e:
+            logger.error("Archived responses unavailable", extra={'survey_id': survey_id, 'error': str(e)})
+            self._send_response(HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(e)})
+            return
+        if parse_qs(urlparse(self.path).query).get('format', [None])[0] == 'csv':
+            self._send_raw(HTTPStatus.OK, responses_csv(questions, responses), 'text/csv', {
+                'Content-Disposition': f'attachment; filename="survey-{survey_id}-responses.csv"'
+            })
+            return
+        self._send_response(HTTPStatus.OK, {'surveyId': survey_id, 'responses': responses})
+
+    def _handle_responses(self, data, raw_body=None):
+        """Drafts (GET/POST .../responses/draft), submits (POST .../responses) and the export (GET .../responses)"""
+        survey_id, draft = RESPONSES_PATH.match(urlparse(self.path).path).groups()
+        token = self.headers.get(TOKEN_HEADER)
+        ingestor = get_ingestor()
+        if data is not None and not draft:
+            self._handle_submit(ingestor, survey_id, token, data, raw_body)
+            return
+        if data is None and not draft:
+            self._handle_export(survey_id)
+            return
+        try:
+            if data is None:
+                if not token:
+                    raise InvalidResponse("Missing respondent token")
+                result = ingestor.load_draft(survey_id, token)
+            else:
+                result = ingestor.save_draft(survey_id, token, data.get('seq'), data.get('answers'))
+            self._send_response(HTTPStatus.OK, result)
+        except InvalidResponse as e:
+            self._send_response(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+        except SurveyNotFound:
+            self._send_response(HTTPStatus.NOT_FOUND, {'error': 'Survey not found'})
+
+    def _handle_submit(self, ingestor, survey_id, token, data, raw_body):
+        """Submit a response; retries with the same Idempotency-Key get the first result"""
+        def work():
+            try:
+                # Suspicious submits are held in the quarantine table (response_screening)
+                return HTTPStatus.OK, ingestor.submit(
+                    survey_id, token, data.get('answers'),
+                    fingerprint=request_fingerprint(self.headers, self.client_address[0]),
+                    elapsed_ms=data.get('elapsedMs'),
+                )
+            except InvalidResponse as e:
+                return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+            except QuotaExceeded:
+                return HTTPStatus.PAYMENT_REQUIRED, {'error': 'This survey has reached its response limit'}
+            except SurveyNotFound:
+                return HTTPStatus.NOT_FOUND, {'error': 'Survey not found'}
+
+        try:
+            status, payload, replayed = get_idempotency_store().run(
+                f"responses:{survey_id}", self.headers.get(IDEMPOTENCY_HEADER), raw_body, work
+            )
+        except InvalidIdempotencyKey as e:
+            self._send_response(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+            return
+        except IdempotencyConflict as e:
+            self._send_response(HTTPStatus.CONFLICT, {'error': str(e)})
+            return
+        self._send_response(status, payload, {REPLAYED_HEADER: 'true'} if replayed else None)
+
     def do_POST(self):
         """Handle POST requests"""
+        self._profiled(self._handle_post)
+
+    def do_DELETE(self):
+        """Handle DELETE requests"""
+        self._profiled(self._handle_delete)
+
+    def _handle_delete(self):
+        self.log_request_info()
+        try:
+            if QUARANTINE_PATH.match(urlparse(self.path).path):
+                self._handle_quarantine()
+            else:
+                self._send_response(
+                    HTTPStatus.NOT_FOUND,
+                    {"error": "Invalid endpoint", "requested_path": self.path}
+                )
+        except Exception as e:
+            logger.exception("Handler error", extra={'path': self.path, 'error_type': str(type(e))})
+            self._send_response(
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                {
+                    "error": "Internal server error",
+                    "details": str(e),
+                    "type": str(type(e))
+                }
+            )
+
+    def _handle_post(self):
         self.log_request_info()
         try:
             # Read request body
             content_length = int(self.headers.get('Content-Length', 0))
             body = self.rfile.read(content_length) if content_length else b'{}'
-            print(f"Request body: {body.decode('utf-8')}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Request body", extra={'path': self.path, 'body': body})
 
             if self.path == '/api/survey-agent/start':
-                print("Handling survey start endpoint")
                 try:
                     from src.backend.langgraph_survey_agent import LangGraphSurveyAgent
                     
@@ -143,23 +469,24 @@ class handler(BaseHTTPRequestHandler):
                         {'question': first_question}
                     )
                 except Exception as e:
-                    print(f"Error in survey start: {str(e)}")
-                    print(f"Survey start traceback: {traceback.format_exc()}")
+                    logger.exception("Error in survey start")
                     self._send_response(
                         HTTPStatus.INTERNAL_SERVER_ERROR,
                         {'error': str(e)}
                     )
+            elif RESPONSES_PATH.match(urlparse(self.path).path):
+                self._handle_responses(json.loads(body or b'{}'), body)
+            elif TRANSLATIONS_PATH.match(urlparse(self.path).path):
+                self._handle_translations(json.loads(body or b'{}'))
+            elif QUARANTINE_PATH.match(urlparse(self.path).path):
+                self._handle_quarantine()
             else:
-                print(f"Invalid path requested: {self.path}")
                 self._send_response(
                     HTTPStatus.NOT_FOUND,
                     {"error": "Invalid endpoint", "requested_path": self.path}
                 )
         except Exception as e:
-            print("=== Handler Error ===")
-            print(f"Error type: {type(e)}")
-            print(f"Error message: {str(e)}")
-            print(f"Full traceback: {traceback.format_exc()}")
+            logger.exception("Handler error", extra={'path': self.path, 'error_type': str(type(e))})
             self._send_response(
                 HTTPStatus.INTERNAL_SERVER_ERROR,
                 {
@@ -1,29 +1,59 @@
+import base64
 import json
 import os
+import logging
 import sys
-import traceback
 from urllib.parse import parse_qs
 
 # Add project root directory to Python path to ensure backend modules can be imported
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from src.backend.structured_logging import get_logger
+from src.backend.responses import json_response, CORS_PREFLIGHT_HEADERS
+
+logger = get_logger('api.survey_agent')
+
 # Debug information
-print("Current directory:", os.getcwd())
-print("Python path:", sys.path)
+logger.debug("Module loaded", extra={'cwd': os.getcwd(), 'sys_path': sys.path})
 
 # Try to import LangGraph agent
 try:
     from src.backend.langgraph_survey_agent import LangGraphSurveyAgent
-    print("Successfully imported LangGraphSurveyAgent")
+    from src.backend.survey_templates import generate_with_fallback
+    from src.backend.profiling import get_profiler, profiles_response, DEBUG_HEADER
+    from src.backend.session_store import get_session_store
+    from src.backend.question_edits import get_question_editor, InvalidEdit
+    from src.backend.session_recording import maybe_record
+    from src.backend.chat_history import get_chat_history, InvalidCursor
+    from src.backend.supabase_rest import get_client
+    from src.backend.token_usage import get_usage_ledger, meter_agent, BudgetExceeded
+    from src.backend.session_memory import maybe_compact, session_memory, store_memory, DEFAULT_SAMPLE
+    from src.backend.idempotency import get_idempotency_store, IdempotencyConflict, InvalidIdempotencyKey, IDEMPOTENCY_HEADER, REPLAYED_HEADER
+    logger.debug("Successfully imported LangGraphSurveyAgent")
 except ImportError as e:
-    print(f"Failed to import LangGraphSurveyAgent: {e}")
-    traceback.print_exc()
+    logger.exception("Failed to import LangGraphSurveyAgent")
 
-# Global variable to store agent instances (Note: this may reset between calls in serverless environments)
-agent_instances = {}
+# Agent instances by session (Note: the default in-memory backend may reset between calls in serverless environments)
+agent_instances = get_session_store()
+
+profiler = get_profiler()
 
 def handler(request):
-    """Vercel serverless function handler - unified handler for all survey-agent routes"""
+    """Vercel serverless function handler - profiles sampled requests when enabled"""
+    if not profiler.enabled or not isinstance(request, dict):
+        return route_request(request)
+
+    headers = request.get('headers', {})
+    session = profiler.start(request.get('httpMethod', 'GET'), request.get('path', ''), headers.get(DEBUG_HEADER.lower()))
+    response = None
+    try:
+        response = route_request(request)
+        return response
+    finally:
+        profiler.stop(session, response.get('statusCode') if response else None)
+
+def route_request(request):
+    """Unified handler for all survey-agent routes"""
     try:
         # Get request data
         if isinstance(request, dict):
@@ -32,181 +62,268 @@ def handler(request):
             headers = request.get('headers', {})
             body = request.get('body', '{}')
         else:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': 'Invalid request format'}),
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                }
-            }
+            return json_response(400, {'error': 'Invalid request format'})
         
-        print(f"Processing request: {path} ({method})")
+        logger.debug("Processing request", extra={'path': path, 'method': method})
         
         # Handle CORS preflight requests
         if method == 'OPTIONS':
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                    'Access-Control-Allow-Headers': 'Content-Type, x-session-id'
-                },
-                'body': json.dumps({})
-            }
+            return json_response(200, {}, CORS_PREFLIGHT_HEADERS)
+        
+        # Profile downloads don't need an agent instance
+        if '/admin/profiles' in path and method == 'GET':
+            query = request.get('queryStringParameters') or {}
+            profile_id = path.split('/admin/profiles', 1)[1].strip('/') or None
+            return handle_profiles(headers.get('authorization'), profile_id, query.get('format'))
+        
+        if path.endswith('/admin/metrics') and method == 'GET':
+            return handle_metrics(headers.get('authorization'))
+        if '/admin/sessions' in path and path.endswith('/memory') and method == 'GET':
+            query = request.get('queryStringParameters') or {}
+            session_id = path.split('/admin/sessions', 1)[1][:-len('/memory')].strip('/') or None
+            return handle_memory(headers.get('authorization'), session_id, query.get('sample'))
         
         # Get or create agent instance
         session_id = headers.get('x-session-id', 'default_session')
         
-        if session_id not in agent_instances:
-            print(f"Creating new agent instance for session {session_id}")
+        if path.endswith('/usage') and method == 'GET':
+            return json_response(200, get_usage_ledger().session(session_id))
+        if path.endswith('/history') and method == 'GET':
+            query = request.get('queryStringParameters') or {}
+            return handle_history(session_id, bearer_token(headers), query.get('limit'), query.get('cursor'))
+        
+        agent = agent_instances.get(session_id)
+        if agent is None:
+            logger.info("Creating new agent instance", extra={'session_id': session_id})
             # Check for API key in environment variables
             openai_api_key = os.environ.get('OPENAI_API_KEY')
             if not openai_api_key:
-                print("Warning: OPENAI_API_KEY environment variable not found")
+                logger.warning("OPENAI_API_KEY environment variable not found")
                 
-            agent_instances[session_id] = LangGraphSurveyAgent(api_key=openai_api_key)
-        
-        agent = agent_instances[session_id]
+            # Sampled sessions are recorded for replay_sessions.py (SESSION_RECORD_RATE)
+            agent = maybe_record(LangGraphSurveyAgent(api_key=openai_api_key), session_id)
+        # Charge the agent's model calls to the session (restored agents rebuild their model client)
+        agent = meter_agent(agent, session_id)
         
         # Handle different operations based on path and method
         if path.endswith('/start') and method == 'POST':
-            return handle_start(agent)
+            response = handle_start(agent)
         elif path.endswith('/process') and method == 'POST':
-            return handle_process(agent, {'body': body})
+            response = handle_idempotent(
+                f"process:{session_id}", headers, body, lambda: handle_process(agent, {'body': body})
+            )
         elif path.endswith('/survey') and method == 'GET':
-            return handle_survey(agent)
+            response, agent = handle_survey(agent, session_id)
+        else:
+            response = None
+        if response is not None:
+            # Save the updated conversation state for the next request (compacted with TRANSCRIPT_MODE=compact)
+            agent_instances.put(session_id, maybe_compact(agent))
+            if response['statusCode'] == 200 and not path.endswith('/survey'):
+                persist_turn(session_id, agent, bearer_token(headers))
+            return response
+
+        if '/questions/' in path and method == 'POST':
+            return handle_question_edit(agent, session_id, path.rsplit('/questions/', 1)[1], body)
+        elif path.endswith('/jobs') or '/jobs/' in path:
+            return handle_jobs()
         elif path.endswith('/test') and method == 'GET':
-            return {
-                'statusCode': 200,
-                'body': json.dumps({'message': 'Survey API is working!'}),
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                }
-            }
+            return json_response(200, {'message': 'Survey API is working!'})
             
         # Default 404 response
-        return {
-            'statusCode': 404,
-            'body': json.dumps({'error': 'Not found', 'path': path, 'method': method}),
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            }
-        }
+        return json_response(404, {'error': 'Not found', 'path': path, 'method': method})
         
     except Exception as e:
-        print(f"Unhandled error: {e}")
-        traceback.print_exc()
-        return {
-            'statusCode': 500,
-            'body': json.dumps({'error': str(e)}),
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            }
-        }
+        logger.exception("Unhandled error")
+        return json_response(500, {'error': str(e)})
 
 # Handle start conversation request
 def handle_start(agent):
     """Handle start conversation request"""
     try:
         first_question = agent.start_conversation()
-        return {
-            'statusCode': 200,
-            'body': json.dumps({'question': first_question}),
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            }
-        }
+        return json_response(200, {'question': first_question})
     except Exception as e:
-        print(f"Error starting conversation: {e}")
-        traceback.print_exc()
-        return {
-            'statusCode': 500,
-            'body': json.dumps({'error': f"Failed to start conversation: {str(e)}"}),
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            }
-        }
+        logger.exception("Error starting conversation")
+        return json_response(500, {'error': f"Failed to start conversation: {str(e)}"})
 
 # Handle user response
 def handle_process(agent, event):
     """Handle user response request"""
     try:
         body_str = event.get('body', '{}')
-        print(f"Received request body: {body_str}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received request body", extra={'body': body_str})
         
         # Parse request body
         body = json.loads(body_str) if isinstance(body_str, str) else body_str
         user_response = body.get('userResponse', '')
         
         if not user_response:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': "Missing userResponse parameter"}),
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                }
-            }
+            return json_response(400, {'error': "Missing userResponse parameter"})
         
         # Process response
         next_question, is_complete = agent.process_response(user_response)
         
-        return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'question': next_question,
-                'isComplete': is_complete
-            }),
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            }
-        }
+        return json_response(200, {
+            'question': next_question,
+            'isComplete': is_complete
+        })
+    except BudgetExceeded as e:
+        return json_response(429, {'error': str(e), 'usage': e.usage})
     except Exception as e:
-        print(f"Error processing response: {e}")
-        traceback.print_exc()
-        return {
-            'statusCode': 500,
-            'body': json.dumps({'error': f"Failed to process response: {str(e)}"}),
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            }
-        }
+        logger.exception("Error processing response")
+        return json_response(500, {'error': f"Failed to process response: {str(e)}"})
+
+# The caller's Supabase JWT, if signed in
+def bearer_token(headers):
+    """Access token from the Authorization header, or None"""
+    auth = headers.get('authorization') or headers.get('Authorization') or ''
+    return auth[7:] if auth.startswith('Bearer ') else None
+
+# Write the turn's new messages to the chats/messages tables
+def persist_turn(session_id, agent, access_token=None):
+    """Persist new chat messages for the signed-in caller; the function may be frozen after responding, so write them now"""
+    history = get_chat_history()
+    if history is None:
+        return
+    try:
+        history.record(session_id, agent, flush=True, access_token=access_token)
+    except Exception:
+        logger.exception("Error persisting chat turn")
+
+# Get one page of the persisted chat, newest page first
+def handle_history(session_id, access_token, limit=None, cursor=None):
+    """Handle chat history request; read with the caller's JWT, so only their own chats are returned"""
+    if not access_token:
+        return json_response(401, {'error': 'Unauthorized'})
+    history = get_chat_history()
+    if history is None:
+        return json_response(503, {'error': 'Chat history is not configured'})
+    try:
+        return json_response(200, history.page(session_id, get_client().as_user(access_token), limit, cursor))
+    except InvalidCursor as e:
+        return json_response(400, {'error': str(e)})
+    except Exception as e:
+        logger.exception("Error getting chat history")
+        return json_response(500, {'error': f"Failed to get chat history: {str(e)}"})
+
+# Run a handler at most once per Idempotency-Key
+def handle_idempotent(scope, headers, body, handle):
+    """Retries with the same Idempotency-Key get the first result instead of running again"""
+    def work():
+        response = handle()
+        return response['statusCode'], json.loads(response['body'])
+
+    try:
+        status, payload, replayed = get_idempotency_store().run(
+            scope, headers.get(IDEMPOTENCY_HEADER.lower()), body, work
+        )
+    except InvalidIdempotencyKey as e:
+        return json_response(400, {'error': str(e)})
+    except IdempotencyConflict as e:
+        return json_response(409, {'error': str(e)})
+    response = json_response(status, payload)
+    if replayed:
+        response['headers'][REPLAYED_HEADER] = 'true'
+    return response
+
+# Generate survey questions with unique IDs
+def generate_questions(agent):
+    survey_questions = agent.generate_survey_questions()
+
+    # Ensure each question has a unique ID
+    for i, question in enumerate(survey_questions):
+        if 'id' not in question:
+            question['id'] = f"q_{i+1}"
+    return survey_questions
 
 # Get generated survey
-def handle_survey(agent):
-    """Handle get survey request"""
+def handle_survey(agent, session_id):
+    """Handle get survey request; returns the response and the agent to save for the session"""
     try:
-        survey_questions = agent.generate_survey_questions()
+        # Fall back to the template survey when the model is slow or failing; generation runs on a
+        # copy of the agent, so an abandoned call cannot change the saved conversation
+        survey_questions, degraded, agent = generate_with_fallback(
+            lambda copy: generate_questions(meter_agent(copy, session_id)), agent
+        )
         
-        # Ensure each question has a unique ID
-        for i, question in enumerate(survey_questions):
-            if 'id' not in question:
-                question['id'] = f"q_{i+1}"
-        
-        return {
-            'statusCode': 200,
-            'body': json.dumps({'questions': survey_questions}),
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            }
-        }
+        return json_response(200, {'questions': survey_questions, 'degraded': degraded}), agent
     except Exception as e:
-        print(f"Error getting survey: {e}")
-        traceback.print_exc()
+        logger.exception("Error getting survey")
+        return json_response(500, {'error': f"Failed to get survey: {str(e)}"}), agent
+
+# Regenerate, rephrase or add a single question
+def handle_question_edit(agent, session_id, action, body_str):
+    """Handle single-question edit request; repeated requests are served from cached alternatives"""
+    try:
+        body = json.loads(body_str) if isinstance(body_str, str) else body_str
+        result = get_question_editor().edit(
+            session_id, agent, body.get('questions'), action,
+            question_id=body.get('questionId'), instruction=body.get('instruction')
+        )
+        return json_response(200, result)
+    except InvalidEdit as e:
+        return json_response(400, {'error': str(e)})
+    except BudgetExceeded as e:
+        return json_response(429, {'error': str(e), 'usage': e.usage})
+    except Exception as e:
+        logger.exception("Error editing question")
+        return json_response(500, {'error': f"Failed to edit question: {str(e)}"})
+
+# Background jobs are not available here: a serverless instance may be frozen
+# as soon as the response is returned, so a job thread would never finish,
+# and no instance here ever holds a job to report on or cancel. Clients fall
+# back to GET /api/survey-agent/survey; the long-running Flask server
+# (src/backend/api.py) serves the job API.
+def handle_jobs():
+    """Handle job submit, status and cancel requests"""
+    return json_response(501, {
+        'error': "Background survey jobs are not supported in the serverless deployment; use GET /api/survey-agent/survey"
+    })
+
+# Model token usage in the Prometheus text format
+def handle_metrics(authorization):
+    """Handle admin metrics request; uses the profile download token"""
+    if not profiler.is_authorized(authorization):
+        return json_response(401, {'error': 'Unauthorized'})
+    return {
+        'statusCode': 200,
+        'body': get_usage_ledger().metrics_text(),
+        'headers': {'Content-Type': 'text/plain; version=0.0.4', 'Access-Control-Allow-Origin': '*'}
+    }
+
+# Memory held by sessions, by transcript, requirements and graph state
+def handle_memory(authorization, session_id=None, sample=None):
+    """Handle admin session memory request; one session, or the average over recent ones"""
+    if not profiler.is_authorized(authorization):
+        return json_response(401, {'error': 'Unauthorized'})
+    try:
+        if session_id is None:
+            return json_response(200, store_memory(agent_instances, int(sample or DEFAULT_SAMPLE)))
+        agent = agent_instances.get(session_id)
+        if agent is None:
+            return json_response(404, {'error': 'Session not found'})
+        return json_response(200, session_memory(agent))
+    except ValueError as e:
+        return json_response(400, {'error': str(e)})
+    except Exception as e:
+        logger.exception("Error measuring session memory")
+        return json_response(500, {'error': f"Failed to measure session memory: {str(e)}"})
+
+# Download request profiles captured by the profiler
+def handle_profiles(authorization, profile_id=None, fmt=None):
+    """Handle admin profile download request"""
+    status, body, content_type = profiles_response(profiler, authorization, profile_id, fmt)
+    if isinstance(body, dict):
+        return json_response(status, body)
+
+    headers = {'Content-Type': content_type, 'Access-Control-Allow-Origin': '*'}
+    if isinstance(body, bytes):
         return {
-            'statusCode': 500,
-            'body': json.dumps({'error': f"Failed to get survey: {str(e)}"}),
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            }
-        }
\ No newline at end of file
+            'statusCode': status,
+            'body': base64.b64encode(body).decode('ascii'),
+            'isBase64Encoded': True,
+            'headers': headers
+        }
+    return {'statusCode': status, 'body': body, 'headers': headers}
@@ -0,0 +1,425 @@
+# src/backend/agent_socket.py
+"""WebSocket channel for survey-agent conversations.
+
+Over HTTP every intake turn is a POST to /api/survey-agent/process that
+parses headers, looks the session up, unpickles the agent and stores it
+again. Here a client opens one connection per conversation and the
+agent stays resident in the connection for as long as it is open:
+
+    ws://<host>/api/survey-agent/ws?sessionId=<id>[&accessToken=<Supabase JWT>]
+
+Messages are JSON text frames. The client sends
+
+    {"type": "start"}                          new conversation
+    {"type": "message", "turn": 1, "text": ...} an answer, like userResponse
+    {"type": "cancel", "turn": 1}              stop that turn (or the current one)
+
+and the server answers with
+
+    {"type": "ready", "sessionId": ..., "resumed": true}
+    {"type": "question", "text": ..., "isComplete": false}   reply to start
+    {"type": "token", "turn": 1, "text": ...}  assistant text as the model produces it
+    {"type": "done", "turn": 1, "question": ..., "isComplete": false}
+    {"type": "cancelled", "turn": 1}
+    {"type": "error", "turn": 1, "status": 429, "error": ..., "usage": ...}
+
+Turns run one at a time in the order they arrive. A cancelled turn
+leaves the conversation as it was before the turn. After each turn the
+agent is saved to the session store (SESSION_BACKEND, sqlite by default
+here) and its messages go to the chat history, so the HTTP endpoints
+can continue a conversation the socket started and the other way round.
+
+    cd src/backend && SURVEY_AGENT_STUB=1 python agent_socket.py   # AGENT_SOCKET_BIND, default 0.0.0.0:8081
+"""
+import base64
+import hashlib
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Sessions must outlive this process and be visible to the HTTP workers
+os.environ.setdefault('SESSION_BACKEND', 'sqlite')
+
+try:
+    from .agent_streaming import TurnCancelled, TurnStream, stream_agent, streaming_to
+    from .chat_history import get_chat_history
+    from .responses import json_body
+    from .session_memory import maybe_compact
+    from .session_recording import maybe_record
+    from .session_store import get_session_store
+    from .structured_logging import get_logger
+    from .token_usage import BudgetExceeded, meter_agent
+except ImportError:
+    from agent_streaming import TurnCancelled, TurnStream, stream_agent, streaming_to
+    from chat_history import get_chat_history
+    from responses import json_body
+    from session_memory import maybe_compact
+    from session_recording import maybe_record
+    from session_store import get_session_store
+    from structured_logging import get_logger
+    from token_usage import BudgetExceeded, meter_agent
+
+logger = get_logger('agent_socket')
+
+# SURVEY_AGENT_STUB=1 selects the agent that never calls a model, as in api.py
+if os.environ.get('SURVEY_AGENT_STUB'):
+    from stub_agent import StubSurveyAgent as AgentClass
+else:
+    from langgraph_survey_agent import LangGraphSurveyAgent as AgentClass
+
+SOCKET_PATH = '/api/survey-agent/ws'
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_MESSAGE_BYTES = 64 * 1024
+
+CONTINUATION, TEXT, BINARY, CLOSE, PING, PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+# Close codes (RFC 6455 section 7.4.1)
+NORMAL, PROTOCOL_ERROR, UNSUPPORTED, INVALID_DATA, TOO_BIG, SERVER_ERROR = 1000, 1002, 1003, 1007, 1009, 1011
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+class ProtocolError(Exception):
+    def __init__(self, code, reason):
+        super().__init__(reason)
+        self.code = code
+
+
+def accept_key(key):
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def apply_mask(payload, mask):
+    if not payload:
+        return payload
+    n = len(payload)
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(n, 'big')
+
+
+def encode_frame(opcode, payload=b'', mask=None):
+    """One unfragmented frame; clients must pass a 4-byte mask, servers none."""
+    length = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, mask_bit | length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, mask_bit | 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, mask_bit | 127, length)
+    if mask:
+        return header + mask + apply_mask(payload, mask)
+    return header + payload
+
+
+def _read_exact(rfile, n):
+    data = rfile.read(n)
+    if len(data) < n:
+        raise ConnectionClosed()
+    return data
+
+
+def read_frame(rfile, require_mask=True):
+    """(fin, opcode, payload) of the next frame."""
+    first, second = _read_exact(rfile, 2)
+    fin, opcode, masked, length = first & 0x80, first & 0x0F, second & 0x80, second & 0x7F
+    if first & 0x70:
+        raise ProtocolError(PROTOCOL_ERROR, "Reserved bits set")
+    if require_mask and not masked:
+        raise ProtocolError(PROTOCOL_ERROR, "Client frames must be masked")
+    if length == 126:
+        length, = struct.unpack('!H', _read_exact(rfile, 2))
+    elif length == 127:
+        length, = struct.unpack('!Q', _read_exact(rfile, 8))
+    if opcode >= CLOSE and (length > 125 or not fin):
+        raise ProtocolError(PROTOCOL_ERROR, "Invalid control frame")
+    if length > MAX_MESSAGE_BYTES:
+        raise ProtocolError(TOO_BIG, "Message too big")
+    mask = _read_exact(rfile, 4) if masked else None
+    payload = _read_exact(rfile, length)
+    return fin, opcode, apply_mask(payload, mask) if mask else payload
+
+
+class WebSocket:
+    """Server side of an upgraded connection: text messages in, JSON messages out."""
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        self._send_lock = threading.Lock()
+        self.closed = False
+
+    def _write(self, frame):
+        with self._send_lock:
+            if self.closed:
+                raise ConnectionClosed()
+            try:
+                self.wfile.write(frame)
+                self.wfile.flush()
+            except OSError:
+                self.closed = True
+                raise ConnectionClosed()
+
+    def send_json(self, payload):
+        self._write(encode_frame(TEXT, json_body(payload)))
+
+    def close(self, code=NORMAL, reason=''):
+        try:
+            self._write(encode_frame(CLOSE, struct.pack('!H', code) + reason.encode('utf-8')[:120]))
+        except ConnectionClosed:
+            pass
+        self.closed = True
+
+    def receive(self):
+        """The next text message, or None once the client has closed the connection."""
+        parts, size, message_opcode = [], 0, None
+        while True:
+            fin, opcode, payload = read_frame(self.rfile)
+            if opcode == PING:
+                self._write(encode_frame(PONG, payload))
+                continue
+            if opcode == PONG:
+                continue
+            if opcode == CLOSE:
+                self.close(struct.unpack('!H', payload[:2])[0] if len(payload) >= 2 else NORMAL)
+                return None
+            if opcode == CONTINUATION:
+                if message_opcode is None:
+                    raise ProtocolError(PROTOCOL_ERROR, "Unexpected continuation frame")
+            elif message_opcode is not None:
+                raise ProtocolError(PROTOCOL_ERROR, "Expected a continuation frame")
+            else:
+                message_opcode = opcode
+            size += len(payload)
+            if size > MAX_MESSAGE_BYTES:
+                raise ProtocolError(TOO_BIG, "Message too big")
+            parts.append(payload)
+            if fin:
+                break
+        if message_opcode != TEXT:
+            raise ProtocolError(UNSUPPORTED, "Only text messages are accepted")
+        try:
+            return b''.join(parts).decode('utf-8')
+        except UnicodeDecodeError:
+            raise ProtocolError(INVALID_DATA, "Messages must be UTF-8")
+
+
+class Conversation:
+    """One connection's conversation: the resident agent and a worker running its turns in order."""
+
+    def __init__(self, session_id, websocket, store=None, access_token=None):
+        self.session_id = session_id
+        self.websocket = websocket
+        # Chats are recorded as the signed-in caller's, so only they can read them back
+        self.access_token = access_token
+        self.store = store or get_session_store()
+        self.agent = self._load()
+        self._turns = queue.Queue()
+        self._lock = threading.Lock()
+        self._stream = None
+        self._current = None
+        self._cancelled = set()
+        self._worker = threading.Thread(target=self._run, name=f"conversation-{session_id}", daemon=True)
+        self._worker.start()
+
+    def _load(self):
+        return self._prepare(self.store.get(self.session_id))
+
+    def _prepare(self, agent):
+        # Streaming goes under the metering wrapper, so budgets still see one call per model request
+        return meter_agent(stream_agent(agent), self.session_id)
+
+    def handle(self, message):
+        """Act on one client message."""
+        try:
+            data = json.loads(message)
+        except ValueError:
+            self.websocket.send_json({"type": "error", "status": 400, "error": "Messages must be JSON"})
+            return
+        kind = data.get('type') if isinstance(data, dict) else None
+        if kind == 'cancel':
+            self.cancel(data.get('turn'))
+        elif kind == 'start':
+            self._turns.put(('start', None, None))
+        elif kind == 'message':
+            self._turns.put(('message', data.get('turn'), str(data.get('text') or '')))
+        else:
+            self.websocket.send_json({"type": "error", "status": 400, "error": f"Unknown message type: {kind}"})
+
+    def cancel(self, turn=None):
+        with self._lock:
+            if turn is not None and turn != self._current:
+                # Not started yet: drop it when its time comes
+                self._cancelled.add(turn)
+            elif self._stream is not None:
+                self._stream.cancel()
+
+    def stop(self):
+        self.cancel()
+        self._turns.put(None)
+        self._worker.join()
+
+    def _run(self):
+        while True:
+            item = self._turns.get()
+            # Turns still queued when the client went away are dropped
+            if item is None or self.websocket.closed:
+                return
+            kind, turn, text = item
+            try:
+                if kind == 'start':
+                    self._start()
+                else:
+                    self._turn(turn, text)
+            except Exception as e:
+                if self.websocket.closed:
+                    return
+                logger.exception("Error in conversation turn", extra={'session_id': self.session_id})
+                try:
+                    self.websocket.send_json({"type": "error", "turn": turn, "status": 500, "error": str(e)})
+                except Exception:
+                    return
+
+    def _save(self):
+        self.agent = maybe_compact(self.agent)
+        self.store.put(self.session_id, self.agent)
+        history = get_chat_history()
+        if history is None:
+            return
+        try:
+            history.record(self.session_id, self.agent, access_token=self.access_token)
+        except Exception:
+            logger.exception("Error persisting chat turn", extra={'session_id': self.session_id})
+
+    def _start(self):
+        self.agent = self._prepare(maybe_record(AgentClass(), self.session_id))
+        question = self.agent.start_conversation()
+        self.websocket.send_json({"type": "question", "text": question, "isComplete": False})
+        self._save()
+
+    def _turn(self, turn, text):
+        if self.agent is None:
+            self.websocket.send_json({"type": "error", "turn": turn, "status": 400, "error": "Conversation not started"})
+            return
+        with self._lock:
+            if turn is not None and turn in self._cancelled:
+                self._cancelled.discard(turn)
+                stream = None
+            else:
+                stream = self._stream = TurnStream(
+                    lambda piece: self.websocket.send_json({"type": "token", "turn": turn, "text": piece}))
+                self._current = turn
+        if stream is None:
+            self.websocket.send_json({"type": "cancelled", "turn": turn})
+            return
+        try:
+            with streaming_to(stream):
+                question, is_complete = self.agent.process_response(text)
+        except TurnCancelled:
+            # The agent may have stopped part-way through the turn; go back to the last saved state
+            self.agent = self._load()
+            self.websocket.send_json({"type": "cancelled", "turn": turn})
+            return
+        except BudgetExceeded as e:
+            self.websocket.send_json({"type": "error", "turn": turn, "status": 429, "error": str(e), "usage": e.usage})
+            return
+        finally:
+            with self._lock:
+                self._stream = self._current = None
+        self.websocket.send_json({"type": "done", "turn": turn, "question": question, "isComplete": is_complete})
+        self._save()
+
+
+class AgentSocketHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _refuse(self, status, error, headers=None):
+        body = json_body({"error": error})
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != SOCKET_PATH:
+            return self._refuse(HTTPStatus.NOT_FOUND, "Invalid endpoint")
+        key = self.headers.get('Sec-WebSocket-Key')
+        if self.headers.get('Upgrade', '').lower() != 'websocket' or not key:
+            return self._refuse(HTTPStatus.UPGRADE_REQUIRED, "WebSocket upgrade required", {'Upgrade': 'websocket'})
+        if self.headers.get('Sec-WebSocket-Version') != '13':
+            return self._refuse(HTTPStatus.UPGRADE_REQUIRED, "Unsupported WebSocket version",
+                                {'Sec-WebSocket-Version': '13'})
+        query = parse_qs(url.query)
+        session_id = (query.get('sessionId') or [None])[0] or self.headers.get('x-session-id', 'default_session')
+        # Browsers cannot set headers on a WebSocket, so the JWT may also come as ?accessToken=
+        auth = self.headers.get('Authorization', '')
+        access_token = auth[7:] if auth.startswith('Bearer ') else (query.get('accessToken') or [None])[0]
+
+        self.send_response(HTTPStatus.SWITCHING_PROTOCOLS)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept_key(key))
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+        # Tokens are small writes; send each one now rather than wait for more
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.serve(session_id, WebSocket(self.rfile, self.wfile), access_token)
+
+    def serve(self, session_id, websocket, access_token=None):
+        conversation = Conversation(session_id, websocket, access_token=access_token)
+        logger.info("Conversation connected", extra={'session_id': session_id, 'resumed': conversation.agent is not None})
+        try:
+            websocket.send_json({"type": "ready", "sessionId": session_id, "resumed": conversation.agent is not None})
+            while True:
+                message = websocket.receive()
+                if message is None:
+                    break
+                conversation.handle(message)
+        except ProtocolError as e:
+            websocket.close(e.code, str(e))
+        except (ConnectionClosed, OSError):
+            pass
+        finally:
+            websocket.closed = True
+            conversation.stop()
+            logger.info("Conversation closed", extra={'session_id': session_id})
+
+
+class AgentSocketServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def make_server(bind=None):
+    host, _, port = (bind or os.environ.get('AGENT_SOCKET_BIND', '0.0.0.0:8081')).rpartition(':')
+    return AgentSocketServer((host or '0.0.0.0', int(port)), AgentSocketHandler)
+
+
+def main():
+    server = make_server()
+    logger.info("Agent socket listening", extra={'address': '%s:%d' % server.server_address[:2]})
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import contextvars
+import re
+import threading
+from contextlib import contextmanager
+
+try:
+    from .session_recording import model_attributes
+except ImportError:
+    from session_recording import model_attributes
+
+# Stream the current turn's model output goes to (see streaming_to); None outside streaming turns
+current_stream = contextvars.ContextVar('turn_stream', default=None)
+
+# Words with their leading whitespace, roughly how chat models emit tokens
+TOKEN_PATTERN = re.compile(r'\s*\S+|\s+$')
+
+
+class TurnCancelled(Exception):
+    """The client cancelled the turn while the model was generating."""
+
+
+class TurnStream:
+    """Where one turn's tokens go, and whether the client has asked to stop.
+
+    `send` is called with each piece of assistant text as the model
+    produces it. cancel() may be called from any thread; the generating
+    thread notices at its next token and raises TurnCancelled.
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self._cancelled = threading.Event()
+        self.tokens = 0
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise TurnCancelled()
+
+    def sleep(self, seconds):
+        """Wait like time.sleep(), but raise TurnCancelled as soon as the turn is cancelled."""
+        if self._cancelled.wait(seconds):
+            raise TurnCancelled()
+
+    def emit(self, text):
+        self.check()
+        if text:
+            self.tokens += 1
+            self.send(text)
+
+
+@contextmanager
+def streaming_to(stream):
+    token = current_stream.set(stream)
+    try:
+        yield stream
+    finally:
+        current_stream.reset(token)
+
+
+def split_tokens(text):
+    return TOKEN_PATTERN.findall(text or '')
+
+
+def check_cancelled():
+    """Raise TurnCancelled if the current turn's client has cancelled it."""
+    stream = current_stream.get()
+    if stream is not None:
+        stream.check()
+
+
+class StreamingModel:
+    """Wraps a chat model so invoke() streams when the turn has a TurnStream.
+
+    The reply is built from the model's stream() chunks while each
+    chunk's text goes to the client, so the agent still gets one message
+    back. Outside a streaming turn, or for models without stream(), this
+    is a plain invoke().
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def invoke(self, messages, *args, **kwargs):
+        stream = current_stream.get()
+        if stream is None or not callable(getattr(self.model, 'stream', None)):
+            return self.model.invoke(messages, *args, **kwargs)
+        stream.check()
+        reply = None
+        for chunk in self.model.stream(messages, *args, **kwargs):
+            content = getattr(chunk, 'content', chunk)
+            stream.emit(content if isinstance(content, str) else '')
+            reply = chunk if reply is None else reply + chunk
+        return reply
+
+    def __getattr__(self, name):
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+def _wrapped(model):
+    # Recording and metering wrappers keep the model they wrap in 'model'
+    inner = vars(model).get('model') if hasattr(model, '__dict__') else None
+    return inner if callable(getattr(inner, 'invoke', None)) else None
+
+
+def stream_agent(agent):
+    """Make the agent's model calls stream to the current turn's TurnStream; returns the agent.
+
+    The streaming wrapper goes innermost, under any metering or recording
+    wrappers, so those still see one invoke() per model call.
+    """
+    if agent is None:
+        return None
+    inner = vars(agent).get('agent', agent)
+    for name in model_attributes(inner):
+        holder, attribute = inner, name
+        model = getattr(holder, attribute)
+        while not isinstance(model, StreamingModel) and _wrapped(model) is not None:
+            holder, attribute, model = model, 'model', _wrapped(model)
+        if not isinstance(model, StreamingModel):
+            setattr(holder, attribute, StreamingModel(model))
+    return agent
@@ -0,0 +1,94 @@
+import pickle
+import threading
+import time
+
+try:
+    from .storage import connect
+except ImportError:
+    from storage import connect
+
+
+class SurveyStateTable:
+    """Pickled per-survey analytics state in the local SQLite database.
+
+    `responses_seen` records how many entries of surveys.responses are
+    already folded into the state, so callers only process the tail.
+    """
+
+    def __init__(self, table, db_name='analytics'):
+        self.table = table
+        self._conn = connect(db_name)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    survey_id TEXT PRIMARY KEY,
+                    responses_seen INTEGER NOT NULL,
+                    state BLOB NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def load(self, survey_id):
+        """Return (responses_seen, state dict); (0, {}) for an unknown survey."""
+        row = self._conn.execute(
+            f"SELECT responses_seen, state FROM {self.table} WHERE survey_id = ?", (survey_id,)
+        ).fetchone()
+        if row is None:
+            return 0, {}
+        return row['responses_seen'], pickle.loads(row['state'])
+
+    def save(self, survey_id, responses_seen, state):
+        self._conn.execute(
+            f"INSERT INTO {self.table} (survey_id, responses_seen, state, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(survey_id) DO UPDATE SET responses_seen = excluded.responses_seen, "
+            "state = excluded.state, updated_at = excluded.updated_at",
+            (survey_id, responses_seen, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), time.time())
+        )
+
+    def read(self, survey_id):
+        with self._lock:
+            return self.load(survey_id)
+
+    def transaction(self, work):
+        """Run `work()` holding the database write lock; it may call load() and save()."""
+        # BEGIN IMMEDIATE serializes read-modify-write across worker processes
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work()
+                self._conn.execute('COMMIT')
+                return result
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def fold_new_responses(self, survey_id, responses, add):
+        """Pass the responses not seen yet to `add(state, new_responses)` and save the state.
+
+        Starts over if responses were deleted, since positions no longer line up.
+        """
+        def work():
+            seen, state = self.load(survey_id)
+            if len(responses) < seen:
+                seen, state = 0, {}
+            if len(responses) > seen:
+                add(state, responses[seen:])
+                self.save(survey_id, len(responses), state)
+            return state
+        return self.transaction(work)
+
+    def fold_appended(self, survey_id, responses, position, add):
+        """Fold `responses` that were just appended, ending at 1-based `position`.
+
+        Only applies when the state is caught up to just before them;
+        otherwise the next full update picks them up. Returns True if folded.
+        """
+        def work():
+            seen, state = self.load(survey_id)
+            if seen != position - len(responses):
+                return False
+            add(state, responses)
+            self.save(survey_id, position, state)
+            return True
+        return self.transaction(work)
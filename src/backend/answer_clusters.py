@@ -0,0 +1,292 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+try:
+    from langchain_openai import ChatOpenAI
+except ImportError:
+    ChatOpenAI = None
+
+try:
+    from .analytics_store import SurveyStateTable
+    from .structured_logging import get_logger, log_duration
+    from .survey_responses import text_columns
+    from .text_features import HashingTfidf, tokenize
+    from .token_usage import MeteredModel
+except ImportError:
+    from analytics_store import SurveyStateTable
+    from structured_logging import get_logger, log_duration
+    from survey_responses import text_columns
+    from text_features import HashingTfidf, tokenize
+    from token_usage import MeteredModel
+
+logger = get_logger('answer_clusters')
+
+# Answers kept per cluster as examples and as the model's labeling input
+REPRESENTATIVES = 5
+# Per-cluster term counts are trimmed to this many terms
+MAX_TERMS = 50
+
+
+class QuestionClusters:
+    """Incremental clustering of the free-text answers to one question.
+
+    Answers are vectorized in mini-batches and assigned to the nearest
+    centroid by cosine similarity. An answer less similar than
+    `threshold` to every centroid opens a new cluster until
+    `max_clusters` exist. Centroids are running means of their members
+    (mini-batch k-means with per-centroid learning rates), so adding
+    answers never revisits old ones.
+    """
+
+    def __init__(self, dim=4096, max_clusters=20, threshold=0.25):
+        self.tfidf = HashingTfidf(dim)
+        self.max_clusters = max_clusters
+        self.threshold = threshold
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.representatives = []
+        self.terms = []
+        self.labels = []
+        self.labeled_sizes = []
+        self.total = 0
+        self.unclustered = 0
+
+    def add(self, texts, batch_size=512):
+        for start in range(0, len(texts), batch_size):
+            self._add_batch(texts[start:start + batch_size])
+
+    def _open_cluster(self):
+        self.centroids = np.vstack([self.centroids, np.zeros((1, self.tfidf.dim), dtype=np.float32)])
+        self.counts = np.append(self.counts, 0)
+        self.representatives.append([])
+        self.terms.append(Counter())
+        self.labels.append(None)
+        self.labeled_sizes.append(0)
+        return len(self.counts) - 1
+
+    def _add_batch(self, texts):
+        x = self.tfidf.transform(texts)
+        valid = x.any(axis=1)
+        self.total += len(texts)
+        self.unclustered += int((~valid).sum())
+
+        if len(self.counts):
+            sims = x @ self.centroids.T
+            assigned = sims.argmax(axis=1)
+            best = sims[np.arange(len(texts)), assigned]
+        else:
+            assigned = np.zeros(len(texts), dtype=np.int64)
+            best = np.zeros(len(texts), dtype=np.float32)
+
+        # Answers unlike every existing cluster; usually few once the clusters settle
+        opened, opened_vectors = [], []
+        for i in np.flatnonzero(valid & (best < self.threshold)):
+            if opened:
+                new_sims = np.asarray(opened_vectors) @ x[i]
+                j = int(new_sims.argmax())
+                if new_sims[j] >= max(self.threshold, best[i]):
+                    assigned[i] = opened[j]
+                    continue
+            if len(self.counts) < self.max_clusters:
+                assigned[i] = self._open_cluster()
+                opened.append(assigned[i])
+                opened_vectors.append(x[i])
+
+        members = np.flatnonzero(valid)
+        k = len(self.counts)
+        sums = np.zeros((k, self.tfidf.dim), dtype=np.float32)
+        np.add.at(sums, assigned[members], x[members])
+        batch_counts = np.bincount(assigned[members], minlength=k)
+        total_counts = self.counts + batch_counts
+        self.centroids = (self.centroids * self.counts[:, None] + sums) / np.maximum(total_counts, 1)[:, None]
+        self.counts = total_counts
+        norms = np.linalg.norm(self.centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.centroids /= norms
+
+        for i in members:
+            cluster = assigned[i]
+            self.representatives[cluster].append(texts[i])
+            terms = self.terms[cluster]
+            terms.update(tokenize(texts[i]))
+            if len(terms) > 4 * MAX_TERMS:
+                self.terms[cluster] = Counter(dict(terms.most_common(MAX_TERMS)))
+        self._rescore_representatives()
+
+    def _rescore_representatives(self):
+        # Keep the distinct answers closest to each (moved) centroid
+        for cluster, candidates in enumerate(self.representatives):
+            unique = list({text.lower(): text for text in candidates}.values())
+            if len(unique) <= REPRESENTATIVES:
+                self.representatives[cluster] = unique
+                continue
+            sims = self.tfidf.transform(unique, update=False) @ self.centroids[cluster]
+            self.representatives[cluster] = [unique[i] for i in np.argsort(-sims)[:REPRESENTATIVES]]
+
+    def needs_label(self, cluster):
+        # Relabel when a cluster has doubled since it was last labeled
+        return self.labels[cluster] is None or self.counts[cluster] >= 2 * self.labeled_sizes[cluster]
+
+    def keywords(self, cluster, n=3):
+        return [term for term, _ in self.terms[cluster].most_common(n)]
+
+    def summary(self):
+        order = np.argsort(-self.counts, kind='stable')
+        clustered = int(self.counts.sum())
+        return {
+            'total': self.total,
+            'unclustered': self.unclustered,
+            'clusters': [
+                {
+                    'id': int(c),
+                    'label': self.labels[c] or ', '.join(self.keywords(c)),
+                    'size': int(self.counts[c]),
+                    'share': round(int(self.counts[c]) / clustered, 4) if clustered else 0.0,
+                    'keywords': self.keywords(c, 5),
+                    'examples': self.representatives[c],
+                }
+                for c in order if self.counts[c]
+            ],
+        }
+
+
+def keyword_labels(groups):
+    """Local fallback: name each cluster after its most frequent terms."""
+    return [', '.join(group['keywords'][:3]) or 'Other' for group in groups]
+
+
+# Same for every labeling call, so it forms a cacheable prompt prefix
+LABEL_PROMPT = '\n'.join([
+    "Each numbered group holds similar answers to a survey question.",
+    "Give every group a short theme label of at most five words.",
+    "Reply with only a JSON array of strings, one per group, in group order.",
+])
+
+
+class ModelLabeler:
+    """Labels every pending cluster of a survey in a single chat completion."""
+
+    def __init__(self, api_key=None, model=None):
+        self.llm = MeteredModel(ChatOpenAI(
+            model_name=model or os.environ.get('CLUSTER_LABEL_MODEL', 'gpt-3.5-turbo'),
+            openai_api_key=api_key or os.environ.get('OPENAI_API_KEY'),
+            temperature=0,
+        ))
+
+    def __call__(self, groups):
+        lines = [f"{len(groups)} groups:"]
+        for i, group in enumerate(groups, 1):
+            lines.append(f"Group {i} (question: {group['question']}):")
+            lines.extend(f"- {example}" for example in group['examples'])
+        reply = self.llm.invoke([('system', LABEL_PROMPT), ('user', '\n'.join(lines))]).content
+        labels = json.loads(reply[reply.find('['):reply.rfind(']') + 1])
+        if not isinstance(labels, list) or len(labels) != len(groups):
+            raise ValueError("Label reply does not match the number of groups")
+        return [str(label).strip()[:80] for label in labels]
+
+
+class AnswerClusterer:
+    """Per-survey clustering of open-ended answers, cached in SQLite.
+
+    Each call to update() clusters only the responses appended since the
+    previous call, then sends the representatives of new or grown clusters
+    to the labeler in one batch. Model cost therefore follows the number of
+    clusters, not the number of responses.
+    """
+
+    def __init__(self, labeler=None, db_name='analytics', dim=4096, max_clusters=20, threshold=0.25,
+                 batch_size=512):
+        self.labeler = labeler or keyword_labels
+        self.dim = dim
+        self.max_clusters = max_clusters
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.table = SurveyStateTable('answer_clusters', db_name)
+
+    def get(self, survey_id):
+        """Cached summary without looking at new responses."""
+        _, state = self.table.read(survey_id)
+        return {question_id: clusters.summary() for question_id, clusters in state.items()}
+
+    def _folder(self, questions):
+        def add(state, new_responses):
+            for question_id, texts in text_columns(questions, new_responses).items():
+                if texts:
+                    if question_id not in state:
+                        state[question_id] = QuestionClusters(self.dim, self.max_clusters, self.threshold)
+                    state[question_id].add(texts, self.batch_size)
+        return add
+
+    def ingest(self, survey_id, questions, responses, position):
+        """Assign newly submitted responses ending at `position`; labeling waits for the next update()."""
+        return self.table.fold_appended(survey_id, responses, position, self._folder(questions))
+
+    def update(self, survey_id, questions, responses):
+        """Cluster responses not seen yet, label new clusters and return the summary per question."""
+        started = time.perf_counter()
+        state = self.table.fold_new_responses(survey_id, responses, self._folder(questions))
+
+        question_text = {q.get('id'): q.get('question_text') or q.get('text') or '' for q in questions or []}
+        pending = [
+            (question_id, cluster) for question_id, clusters in state.items()
+            for cluster in range(len(clusters.counts))
+            if clusters.counts[cluster] and clusters.needs_label(cluster)
+        ]
+        if pending:
+            labels = self._label(pending, question_text, state)
+            state = self.table.transaction(lambda: self._apply_labels(survey_id, pending, labels))
+
+        log_duration(logger, "Clustered survey answers", started,
+                     survey_id=survey_id, responses=len(responses), labeled=len(pending))
+        return {question_id: clusters.summary() for question_id, clusters in state.items()}
+
+    def _label(self, pending, question_text, state):
+        groups = [
+            {
+                'question': question_text.get(question_id, ''),
+                'examples': state[question_id].representatives[cluster],
+                'keywords': state[question_id].keywords(cluster),
+            }
+            for question_id, cluster in pending
+        ]
+        try:
+            return self.labeler(groups)
+        except Exception:
+            logger.exception("Cluster labeling failed; using keyword labels")
+            return keyword_labels(groups)
+
+    def _apply_labels(self, survey_id, pending, labels):
+        # Another worker may have added answers meanwhile; clusters are only ever appended
+        responses_seen, latest = self.table.load(survey_id)
+        for (question_id, cluster), label in zip(pending, labels):
+            clusters = latest.get(question_id)
+            if clusters is not None and cluster < len(clusters.counts):
+                clusters.labels[cluster] = label
+                clusters.labeled_sizes[cluster] = int(clusters.counts[cluster])
+        self.table.save(survey_id, responses_seen, latest)
+        return latest
+
+
+_clusterer = None
+_clusterer_lock = threading.Lock()
+
+
+def get_answer_clusterer():
+    """Return the process-wide clusterer; labels with the model when OPENAI_API_KEY is set."""
+    global _clusterer
+    with _clusterer_lock:
+        if _clusterer is None:
+            labeler = None
+            if ChatOpenAI is not None and os.environ.get('OPENAI_API_KEY'):
+                labeler = ModelLabeler()
+            _clusterer = AnswerClusterer(
+                labeler=labeler,
+                max_clusters=int(os.environ.get('CLUSTER_MAX_PER_QUESTION', 20)),
+                threshold=float(os.environ.get('CLUSTER_SIMILARITY', 0.25)),
+            )
+        return _clusterer
@@ -1,9 +1,32 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, g, Response
 from flask_cors import CORS
+import json
 import os
 import sys
-import traceback
-from langgraph_survey_agent import LangGraphSurveyAgent
+import time
+from survey_jobs import get_job_queue, QueueFullError
+from survey_templates import generate_with_fallback
+from profiling import get_profiler, profiles_response, DEBUG_HEADER
+from structured_logging import get_logger, log_duration
+from responses import json_body
+from survey_definitions import get_definition_cache, definition_response, changed_survey_id, load_definition, SurveyNotFound
+from session_store import get_session_store, SessionBusy
+from supabase_rest import get_client
+from survey_responses import load_survey_responses, responses_csv, require_owner, NotSurveyOwner
+from response_archive import ArchiveUnavailable
+from answer_clusters import get_answer_clusterer
+from text_scoring import get_text_insights
+from filter_cube import get_filter_cube, DAY_PATTERN
+from survey_summaries import list_survey_summaries, InvalidCursor
+from response_ingest import get_ingestor, InvalidResponse, QuotaExceeded, TOKEN_HEADER
+from response_screening import get_response_screen, request_fingerprint
+from question_edits import get_question_editor, InvalidEdit
+from survey_translation import get_survey_translator, InvalidLanguage, TranslationUnavailable
+from session_recording import maybe_record
+from token_usage import get_usage_ledger, meter_agent, BudgetExceeded
+from session_memory import maybe_compact, session_memory, store_memory, DEFAULT_SAMPLE as MEMORY_SAMPLE
+from chat_history import get_chat_history, InvalidCursor as InvalidHistoryCursor
+from idempotency import get_idempotency_store, IdempotencyConflict, InvalidIdempotencyKey, IDEMPOTENCY_HEADER, REPLAYED_HEADER
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
@@ -12,83 +35,580 @@ if current_dir not in sys.path:
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-# 创建一个全局的 agent 实例
-survey_agent = None
+def json_reply(payload):
+    # 与 serverless 入口共用同一个 JSON 编码器，直接返回 bytes
+    return Response(json_body(payload), mimetype='application/json')
+
+# 会话状态保存在共享存储中（SESSION_BACKEND），任何 worker 进程都可以继续同一个对话
+sessions = get_session_store()
+
+# SURVEY_AGENT_STUB=1 时使用不调用模型的 stub agent（压测/本地开发）
+if os.environ.get('SURVEY_AGENT_STUB'):
+    from stub_agent import StubSurveyAgent as AgentClass
+else:
+    from langgraph_survey_agent import LangGraphSurveyAgent as AgentClass
+
+def get_session_id():
+    return request.headers.get('x-session-id', 'default_session')
+
+def load_agent(session_id):
+    # 从存储恢复的 agent 会重建模型客户端，每次都重新挂上按会话计费的包装
+    return meter_agent(sessions.get(session_id), session_id)
+
+def persist_turn(session_id, agent):
+    # 新增的对话消息排队后分批写入 chats/messages 表；写入失败不影响对话本身
+    history = get_chat_history()
+    if history is None:
+        return
+    try:
+        # 登录用户的 JWT 决定对话归属，只有本人能读回历史
+        history.record(session_id, agent, access_token=caller_token())
+    except Exception:
+        logger.exception("Error persisting chat turn")
+
+def budget_reply(e):
+    return {"error": str(e), "usage": e.usage}
+
+logger = get_logger('api')
+profiler = get_profiler()
+ingestor = get_ingestor()
+
+def fold_into_analytics(survey_id, responses, position):
+    # 新提交的回答按问卷分批计入文本分析缓存，下次查看时无需重新处理
+    questions = json.loads(get_definition_cache().get(survey_id).body).get('questions') or []
+    get_text_insights().ingest(survey_id, questions, responses, position)
+    get_answer_clusterer().ingest(survey_id, questions, responses, position)
+    get_filter_cube().ingest(survey_id, questions, responses, position)
+
+ingestor.after_submit.append(fold_into_analytics)
+
+def idempotent_reply(scope, work):
+    # 带 Idempotency-Key 的重试直接返回第一次的结果，不会再次调用模型或重复计入回答
+    try:
+        status, payload, replayed = get_idempotency_store().run(
+            scope, request.headers.get(IDEMPOTENCY_HEADER), request.get_data(), work
+        )
+    except InvalidIdempotencyKey as e:
+        return json_reply({"error": str(e)}), 400
+    except IdempotencyConflict as e:
+        return json_reply({"error": str(e)}), 409
+    reply = json_reply(payload)
+    if replayed:
+        reply.headers[REPLAYED_HEADER] = 'true'
+    return reply, status
+
+@app.before_request
+def start_profile():
+    g.started = time.perf_counter()
+    # 未配置 PROFILE_ADMIN_TOKEN 时不做任何采样
+    if profiler.enabled:
+        g.profile_session = profiler.start(request.method, request.path, request.headers.get(DEBUG_HEADER))
+
+@app.after_request
+def record_profile(response):
+    log_duration(logger, "Request handled", g.get('started', time.perf_counter()),
+                 path=request.path, method=request.method, status=response.status_code)
+    if profiler.enabled:
+        profiler.stop(g.pop('profile_session', None), response.status_code)
+    return response
+
+@app.teardown_request
+def stop_profile(exc):
+    # 请求异常时 after_request 不会执行
+    if profiler.enabled:
+        profiler.stop(g.pop('profile_session', None))
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def download_profiles(profile_id=None):
+    status, body, content_type = profiles_response(
+        profiler, request.headers.get('Authorization'), profile_id, request.args.get('format')
+    )
+    if isinstance(body, dict):
+        return json_reply(body), status
+    return Response(body, status=status, content_type=content_type)
+
+@app.route('/api/admin/metrics', methods=['GET'])
+def model_metrics():
+    # Prometheus 文本格式的模型用量；与 profile 下载共用 PROFILE_ADMIN_TOKEN
+    if not profiler.is_authorized(request.headers.get('Authorization')):
+        return json_reply({"error": "Unauthorized"}), 401
+    text = get_usage_ledger().metrics_text()
+    screen = get_response_screen()
+    if screen is not None:
+        text += screen.metrics_text()
+    return Response(text, content_type='text/plain; version=0.0.4')
+
+@app.route('/api/admin/sessions/memory', methods=['GET'])
+@app.route('/api/admin/sessions/<session_id>/memory', methods=['GET'])
+def get_session_memory(session_id=None):
+    # 会话内存占用（对话记录/需求/图状态），用于估算容器能容纳的会话数
+    if not profiler.is_authorized(request.headers.get('Authorization')):
+        return json_reply({"error": "Unauthorized"}), 401
+    try:
+        if session_id is None:
+            return json_reply(store_memory(sessions, int(request.args.get('sample', MEMORY_SAMPLE))))
+        survey_agent = sessions.get(session_id)
+        if survey_agent is None:
+            return json_reply({"error": "Session not found"}), 404
+        return json_reply(session_memory(survey_agent))
+    except ValueError as e:
+        return json_reply({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error in get_session_memory")
+        return json_reply({"error": str(e)}), 500
 
 @app.route('/api/test', methods=['GET'])
 def test_api():
-    return jsonify({"message": "API is working!"})
+    return json_reply({"message": "API is working!"})
 
 @app.route('/api/survey-agent/start', methods=['POST'])
 def start_conversation():
     try:
-        global survey_agent
-        survey_agent = LangGraphSurveyAgent()
+        # SESSION_RECORD_RATE 抽样记录部分会话，用于 replay_sessions.py 回放
+        survey_agent = meter_agent(maybe_record(AgentClass(), get_session_id()), get_session_id())
         first_question = survey_agent.start_conversation()
-        return jsonify({"question": first_question})
+        with sessions.locked(get_session_id()):
+            sessions.put(get_session_id(), maybe_compact(survey_agent))
+        persist_turn(get_session_id(), survey_agent)
+        return json_reply({"question": first_question})
+    except SessionBusy as e:
+        return json_reply({"error": str(e)}), 409
     except Exception as e:
-        print(f"Error in start_conversation: {e}")
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("Error in start_conversation")
+        return json_reply({"error": str(e)}), 500
 
 @app.route('/api/survey-agent/process', methods=['POST'])
 def process_response():
-    try:
-        global survey_agent
-        if not survey_agent:
-            return jsonify({"error": "Conversation not started"}), 400
+    session_id = get_session_id()
+
+    def work():
+        # 同一会话的请求依次执行（跨 worker 进程），避免并发的轮次互相覆盖
+        with sessions.locked(session_id):
+            survey_agent = load_agent(session_id)
+            if not survey_agent:
+                return 400, {"error": "Conversation not started"}
         
-        data = request.json
-        user_response = data.get('userResponse', '')
+            data = request.json
+            user_response = data.get('userResponse', '')
         
-        # 处理用户响应
-        next_question, is_complete = survey_agent.process_response(user_response)
+            # 处理用户响应；会话超出 SESSION_TOKEN_BUDGET 时不再调用模型
+            try:
+                next_question, is_complete = survey_agent.process_response(user_response)
+            except BudgetExceeded as e:
+                return 429, budget_reply(e)
+            # TRANSCRIPT_MODE=compact 时较早的对话轮次压缩保存
+            sessions.put(session_id, maybe_compact(survey_agent))
+            persist_turn(session_id, survey_agent)
         
-        return jsonify({
-            "question": next_question,
-            "isComplete": is_complete
-        })
+            return 200, {
+                "question": next_question,
+                "isComplete": is_complete
+            }
+
+    try:
+        return idempotent_reply(f"process:{session_id}", work)
+    except SessionBusy as e:
+        return json_reply({"error": str(e)}), 409
     except Exception as e:
-        print(f"Error in process_response: {e}")
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("Error in process_response")
+        return json_reply({"error": str(e)}), 500
 
 @app.route('/api/survey-agent/survey', methods=['GET'])
 def get_survey():
     try:
-        global survey_agent
+        session_id = get_session_id()
+        with sessions.locked(session_id):
+            survey_agent = load_agent(session_id)
+            if not survey_agent:
+                return json_reply({"error": "Conversation not started"}), 400
+
+            # 超出延迟预算时使用模板问卷，并标记为降级；生成在 agent 副本上进行，超时的调用不会改动会话
+            questions, degraded, survey_agent = generate_with_fallback(
+                lambda agent: generate_questions(meter_agent(agent, session_id)), survey_agent
+            )
+            sessions.put(session_id, survey_agent)
+        return json_reply({"questions": questions, "degraded": degraded})
+    except SessionBusy as e:
+        return json_reply({"error": str(e)}), 409
+    except Exception as e:
+        logger.exception("Error in get_survey")
+        return json_reply({"error": str(e)}), 500
+
+def generate_questions(agent):
+    # 生成调查问题
+    questions = agent.generate_survey_questions()
+
+    # 确保每个问题都有一个唯一ID
+    for i, q in enumerate(questions):
+        if 'id' not in q:
+            q['id'] = f"q_{i}"
+    return questions
+
+@app.route('/api/survey-agent/jobs', methods=['POST'])
+def submit_survey_job():
+    try:
+        session_id = get_session_id()
+        survey_agent = load_agent(session_id)
         if not survey_agent:
-            return jsonify({"error": "Conversation not started"}), 400
-        
-        # 生成调查问题
-        questions = survey_agent.generate_survey_questions()
-        
-        # 确保每个问题都有一个唯一ID
-        for i, q in enumerate(questions):
-            if 'id' not in q:
-                q['id'] = f"q_{i}"
-        
-        return jsonify({"questions": questions})
+            return json_reply({"error": "Conversation not started"}), 400
+
+        # 在后台生成调查问题，立即返回任务ID；任务开始时才读取会话，生成期间锁住会话，不会覆盖提交后新增的轮次
+        def run_job():
+            with sessions.locked(session_id):
+                agent = load_agent(session_id)
+                questions = generate_questions(agent)
+                sessions.put(session_id, agent)
+            return {"questions": questions}
+
+        job = get_job_queue().submit(session_id, run_job)
+        return json_reply(job), 202
+    except QueueFullError as e:
+        return json_reply({"error": str(e)}), 429
+    except Exception as e:
+        logger.exception("Error in submit_survey_job")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/survey-agent/jobs/<job_id>', methods=['GET'])
+def get_survey_job(job_id):
+    try:
+        # ?wait=N 表示长轮询，最多等待 N 秒
+        wait = request.args.get('wait', type=float)
+        queue = get_job_queue()
+        job = queue.wait(job_id, wait) if wait else queue.get(job_id)
+        if job is None:
+            return json_reply({"error": "Job not found"}), 404
+        return json_reply(job)
+    except Exception as e:
+        logger.exception("Error in get_survey_job")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/survey-agent/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_survey_job(job_id):
+    try:
+        job = get_job_queue().cancel(job_id)
+        if job is None:
+            return json_reply({"error": "Job not found"}), 404
+        return json_reply(job)
+    except Exception as e:
+        logger.exception("Error in cancel_survey_job")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/survey-agent/questions/<action>', methods=['POST'])
+def edit_question(action):
+    try:
+        session_id = get_session_id()
+        survey_agent = load_agent(session_id)
+        if not survey_agent:
+            return json_reply({"error": "Conversation not started"}), 400
+
+        # 只重新生成/改写/新增一个问题，其余问题作为精简上下文；“换一个”直接读缓存
+        data = request.json or {}
+        result = get_question_editor().edit(
+            session_id, survey_agent, data.get('questions'), action,
+            question_id=data.get('questionId'), instruction=data.get('instruction')
+        )
+        return json_reply(result)
+    except BudgetExceeded as e:
+        return json_reply(budget_reply(e)), 429
+    except InvalidEdit as e:
+        return json_reply({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error in edit_question")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/survey-agent/history', methods=['GET'])
+def get_chat_history_page():
+    # 按 seq 游标倒序分页：重新打开长对话时只读取最后一页
+    # 用调用者的 JWT 读取，RLS 只放行本人的对话
+    token = caller_token()
+    if not token:
+        return json_reply({"error": "Unauthorized"}), 401
+    history = get_chat_history()
+    if history is None:
+        return json_reply({"error": "Chat history is not configured"}), 503
+    try:
+        return json_reply(history.page(
+            get_session_id(), get_client().as_user(token), request.args.get('limit'), request.args.get('cursor')
+        ))
+    except InvalidHistoryCursor as e:
+        return json_reply({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error in get_chat_history_page")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/survey-agent/usage', methods=['GET'])
+def get_session_usage():
+    # 当前会话的 prompt/completion/缓存 token 数、估算费用和剩余预算
+    try:
+        return json_reply(get_usage_ledger().session(get_session_id()))
     except Exception as e:
-        print(f"Error in get_survey: {e}")
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("Error in get_session_usage")
+        return json_reply({"error": str(e)}), 500
 
 @app.route('/api/survey-agent/finalize', methods=['POST'])
 def finalize_survey():
+    def work():
+        try:
+            data = request.json
+            selected_questions = data.get('selectedQuestions', [])
+            # 这里可以添加保存调查到数据库的逻辑
+            return 200, {"success": True, "message": "Survey finalized successfully"}
+        except (ValueError, KeyError, TypeError) as e:
+            logger.exception("Error in finalize_survey")
+            return 400, {"error": str(e)}
+
     try:
-        data = request.json
-        selected_questions = data.get('selectedQuestions', [])
-        # 这里可以添加保存调查到数据库的逻辑
-        return jsonify({"success": True, "message": "Survey finalized successfully"})
-    except (ValueError, KeyError, TypeError) as e:
-        print(f"Error in finalize_survey: {e}")
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 400
+        return idempotent_reply(f"finalize:{get_session_id()}", work)
     except RuntimeError as e:
-        print(f"Runtime error in finalize_survey: {e}")
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("Runtime error in finalize_survey")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/surveys', methods=['GET'])
+def list_surveys():
+    # 仪表盘列表：只返回计数，不读取 questions/responses；按 (created_at, id) 游标分页
+    token = caller_token()
+    if not token:
+        return json_reply({"error": "Unauthorized"}), 401
+    try:
+        page = list_survey_summaries(
+            get_client().as_user(token), request.args.get('limit'), request.args.get('cursor')
+        )
+        return json_reply(page)
+    except InvalidCursor as e:
+        return json_reply({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error in list_surveys")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/surveys/<survey_id>/definition', methods=['GET'])
+def get_survey_definition(survey_id):
+    try:
+        # 只返回问卷题目定义，不包含 responses；命中缓存时不访问数据库
+        status, body, headers = definition_response(
+            get_definition_cache(), survey_id,
+            request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding')
+        )
+        return Response(body, status=status, headers=headers)
+    except SurveyNotFound:
+        return json_reply({"error": "Survey not found"}), 404
+    except Exception as e:
+        logger.exception("Error in get_survey_definition")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/surveys/<survey_id>/responses/draft', methods=['GET', 'POST'])
+def response_draft(survey_id):
+    # 答题过程中自动保存：每次只追加改动过的答案
+    token = request.headers.get(TOKEN_HEADER)
+    try:
+        if request.method == 'GET':
+            if not token:
+                return json_reply({"error": "Missing respondent token"}), 400
+            return json_reply(ingestor.load_draft(survey_id, token))
+        data = request.get_json(silent=True) or {}
+        return json_reply(ingestor.save_draft(survey_id, token, data.get('seq'), data.get('answers')))
+    except InvalidResponse as e:
+        return json_reply({"error": str(e)}), 400
+    except SurveyNotFound:
+        return json_reply({"error": "Survey not found"}), 404
+    except Exception as e:
+        logger.exception("Error in response_draft")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/surveys/<survey_id>/responses', methods=['POST'])
+def submit_response(survey_id):
+    def work():
+        try:
+            data = request.get_json(silent=True) or {}
+            # 可疑提交（同一客户端短时间大量提交、重复/近似重复回答、完成过快）进入隔离表
+            return 200, ingestor.submit(
+                survey_id, request.headers.get(TOKEN_HEADER), data.get('answers'),
+                fingerprint=request_fingerprint(request.headers, request.remote_addr),
+                elapsed_ms=data.get('elapsedMs'),
+            )
+        except InvalidResponse as e:
+            return 400, {"error": str(e)}
+        except QuotaExceeded:
+            # 问卷所有者的套餐回答数已满
+            return 402, {"error": "This survey has reached its response limit"}
+        except SurveyNotFound:
+            return 404, {"error": "Survey not found"}
+
+    try:
+        return idempotent_reply(f"responses:{survey_id}", work)
+    except Exception as e:
+        logger.exception("Error in submit_response")
+        return json_reply({"error": str(e)}), 500
+
+def caller_token():
+    auth = request.headers.get('Authorization', '')
+    return auth[7:] if auth.startswith('Bearer ') else None
+
+@app.route('/api/surveys/<survey_id>/responses', methods=['GET'])
+def list_responses(survey_id):
+    # 已关闭问卷的回答可能已归档到本地列式分段文件；这里返回归档与表中的全部回答
+    token = caller_token()
+    if not token:
+        return json_reply({"error": "Unauthorized"}), 401
+    try:
+        # 归档分段不经过 RLS，必须先确认调用者是问卷所有者
+        questions, responses = load_survey_responses(survey_id, require_owner(survey_id, token))
+        if request.args.get('format') == 'csv':
+            return Response(responses_csv(questions, responses), mimetype='text/csv', headers={
+                'Content-Disposition': f'attachment; filename="survey-{survey_id}-responses.csv"'
+            })
+        return json_reply({"surveyId": survey_id, "responses": responses})
+    except SurveyNotFound:
+        return json_reply({"error": "Survey not found"}), 404
+    except NotSurveyOwner:
+        return json_reply({"error": "Forbidden"}), 403
+    except ArchiveUnavailable as e:
+        # 归档文件不在这台机器上
+        return json_reply({"error": str(e)}), 503
+    except Exception as e:
+        logger.exception("Error in list_responses")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/surveys/<survey_id>/quarantine', methods=['GET'])
+def list_quarantined_responses(survey_id):
+    # 被筛查拦下的回答，仅问卷所有者可见（RLS）；按 id 游标分页
+    token = caller_token()
+    if not token:
+        return json_reply({"error": "Unauthorized"}), 401
+    try:
+        page = ingestor.quarantined(
+            get_client().as_user(token), survey_id, request.args.get('limit'), request.args.get('cursor')
+        )
+        return json_reply(page)
+    except InvalidResponse as e:
+        return json_reply({"error": str(e)}), 400
+    except SurveyNotFound:
+        return json_reply({"error": "Survey not found"}), 404
+    except Exception as e:
+        logger.exception("Error in list_quarantined_responses")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/surveys/<survey_id>/quarantine/<quarantine_id>/release', methods=['POST'])
+@app.route('/api/surveys/<survey_id>/quarantine/<quarantine_id>', methods=['DELETE'])
+def resolve_quarantined_response(survey_id, quarantine_id):
+    # 所有者放行（按原样提交，计入套餐回答数）或丢弃被隔离的回答
+    token = caller_token()
+    if not token:
+        return json_reply({"error": "Unauthorized"}), 401
+    try:
+        client = get_client().as_user(token)
+        if request.method == 'DELETE':
+            return json_reply(ingestor.discard(client, survey_id, quarantine_id))
+        return json_reply(ingestor.release(client, survey_id, quarantine_id))
+    except InvalidResponse as e:
+        return json_reply({"error": str(e)}), 400
+    except QuotaExceeded:
+        return json_reply({"error": "This survey has reached its response limit"}), 402
+    except SurveyNotFound:
+        return json_reply({"error": "Quarantined response not found"}), 404
+    except Exception as e:
+        logger.exception("Error in resolve_quarantined_response")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/surveys/<survey_id>/answer-clusters', methods=['GET'])
+def get_answer_clusters(survey_id):
+    # 问卷对所有人可读（分享链接），所以先确认调用者是问卷所有者，再读取回答并调用模型
+    token = caller_token()
+    if not token:
+        return json_reply({"error": "Unauthorized"}), 401
+    try:
+        questions, responses = load_survey_responses(survey_id, require_owner(survey_id, token))
+        # 只对新增的回答做聚类，结果按问卷缓存
+        clusters = get_answer_clusterer().update(survey_id, questions, responses)
+        return json_reply({"surveyId": survey_id, "questions": clusters})
+    except SurveyNotFound:
+        return json_reply({"error": "Survey not found"}), 404
+    except NotSurveyOwner:
+        return json_reply({"error": "Forbidden"}), 403
+    except Exception as e:
+        logger.exception("Error in get_answer_clusters")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/surveys/<survey_id>/text-insights', methods=['GET'])
+def get_text_insights_route(survey_id):
+    token = caller_token()
+    if not token:
+        return json_reply({"error": "Unauthorized"}), 401
+    try:
+        questions, responses = load_survey_responses(survey_id, require_owner(survey_id, token))
+        # 本地词典打分，不调用模型；只处理新增的回答
+        insights = get_text_insights().update(survey_id, questions, responses)
+        return json_reply({"surveyId": survey_id, "questions": insights})
+    except SurveyNotFound:
+        return json_reply({"error": "Survey not found"}), 404
+    except NotSurveyOwner:
+        return json_reply({"error": "Forbidden"}), 403
+    except Exception as e:
+        logger.exception("Error in get_text_insights_route")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/surveys/<survey_id>/breakdown', methods=['GET'])
+def get_survey_breakdown(survey_id):
+    token = caller_token()
+    if not token:
+        return json_reply({"error": "Unauthorized"}), 401
+    since, until = request.args.get('since'), request.args.get('until')
+    if any(day and not DAY_PATTERN.match(day) for day in (since, until)):
+        return json_reply({"error": "since and until must be YYYY-MM-DD"}), 400
+    try:
+        # 计数器只有所有者可读；其他用户会读到 0，每次都要重新读取全部回答
+        client = require_owner(survey_id, token)
+        cube = get_filter_cube()
+        # 提交时已增量计入；只有计数器自上次读取后变化了（例如其他实例收到的提交）才读取全部回答
+        rows = client.select('survey_response_counters', 'response_count', {'survey_id': f"eq.{survey_id}"}, limit=1)
+        count = rows[0]['response_count'] if rows else 0
+        if not cube.fresh(survey_id, count):
+            questions, responses = load_survey_responses(survey_id, client)
+            cube.update(survey_id, questions, responses, count)
+        result = cube.query(survey_id, since, until, request.args.get('filterQuestion'), request.args.get('filterChoice'))
+        return json_reply({"surveyId": survey_id, "days": cube.days(survey_id), **result})
+    except SurveyNotFound:
+        return json_reply({"error": "Survey not found"}), 404
+    except NotSurveyOwner:
+        return json_reply({"error": "Forbidden"}), 403
+    except Exception as e:
+        logger.exception("Error in get_survey_breakdown")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/surveys/<survey_id>/translations', methods=['POST'])
+def translate_survey(survey_id):
+    token = caller_token()
+    if not token:
+        return json_reply({"error": "Unauthorized"}), 401
+    try:
+        data = request.get_json(silent=True) or {}
+        # 只有问卷所有者可以翻译：翻译会调用付费模型
+        survey = load_definition(survey_id, require_owner(survey_id, token))
+        # 所有语言共用短语缓存：重复的选项只翻译一次，修改问卷后只翻译改动的文字
+        translations = get_survey_translator().translate_many(survey, data.get('languages'))
+        return json_reply({"surveyId": survey_id, "translations": translations})
+    except InvalidLanguage as e:
+        return json_reply({"error": str(e)}), 400
+    except SurveyNotFound:
+        return json_reply({"error": "Survey not found"}), 404
+    except NotSurveyOwner:
+        return json_reply({"error": "Forbidden"}), 403
+    except TranslationUnavailable as e:
+        return json_reply({"error": str(e)}), 503
+    except Exception as e:
+        logger.exception("Error in translate_survey")
+        return json_reply({"error": str(e)}), 500
+
+@app.route('/api/surveys/cache/invalidate', methods=['POST'])
+def invalidate_survey_definition():
+    # 由 Supabase 数据库 webhook 或更新问卷的服务调用
+    secret = os.environ.get('SURVEY_CACHE_WEBHOOK_SECRET')
+    if not secret or request.headers.get('Authorization') != f"Bearer {secret}":
+        return json_reply({"error": "Unauthorized"}), 401
+    survey_id = changed_survey_id(request.get_json(silent=True) or {})
+    if survey_id:
+        get_definition_cache().invalidate(survey_id)
+    return json_reply({"invalidated": survey_id})
 
 if __name__ == '__main__':
     print("Starting Flask server on port 8080...")
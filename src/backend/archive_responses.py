@@ -0,0 +1,150 @@
+# src/backend/archive_responses.py
+"""Move the responses of closed surveys out of surveys.responses.
+
+For every survey that is not active, has responses in its array and was
+last updated more than --min-idle-days ago, the responses are written to
+a compressed columnar segment on local disk (response_archive.py), read
+back and compared, and only then removed from the table by
+archive_survey_responses(). That call fails if the survey was reopened
+or got new responses in the meantime; the segment is deleted and the
+survey is left for the next run. It also fails, and the run counts the
+survey as failed, while the normalized response rows (the copy every
+host can read) are missing any of its responses, or when earlier
+segments of the survey are not on this host. Reads through
+load_survey_responses() (analytics, export) put the archived responses
+back in front, from the segments or, on hosts without them, the rows.
+
+The run prints the hot storage sizes and the latency of a probe append
+to open surveys before and after. GIN indexes only give the space back
+after `REINDEX INDEX CONCURRENTLY idx_surveys_responses` (and a VACUUM of
+surveys), which the service role cannot run through the REST API.
+
+Needs SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY, and the archive
+directory (RESPONSE_ARCHIVE_DIR) on the host that serves the API:
+
+    python archive_responses.py --min-idle-days 30
+    python archive_responses.py --dry-run
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+try:
+    from .response_archive import ArchiveError, get_response_archive
+    from .structured_logging import get_logger
+    from .supabase_rest import SupabaseError, get_client
+except ImportError:
+    from response_archive import ArchiveError, get_response_archive
+    from structured_logging import get_logger
+    from supabase_rest import SupabaseError, get_client
+
+logger = get_logger('archive_responses')
+
+PROBE_SAMPLES = 50
+
+
+def candidates(client, min_idle_days, page_size=200):
+    """Ids of closed surveys idle for min_idle_days, in id order, a page at a time."""
+    idle_since = (datetime.now(timezone.utc) - timedelta(days=min_idle_days)).isoformat()
+    after = None
+    while True:
+        filters = {'is_active': 'eq.false', 'updated_at': f"lt.{idle_since}"}
+        if after:
+            filters['id'] = f"gt.{after}"
+        rows = client.select('surveys', 'id', filters, order='id.asc', limit=page_size)
+        for row in rows:
+            yield str(row['id'])
+        if len(rows) < page_size:
+            return
+        after = rows[-1]['id']
+
+
+def archive_survey(client, archive, survey_id):
+    """Archive one survey's hot responses; returns (responses, json bytes, segment bytes), or None if skipped."""
+    rows = client.select('surveys', 'id,responses,responses_archived', {'id': f"eq.{survey_id}"}, limit=1)
+    responses = rows[0].get('responses') if rows else None
+    if not isinstance(responses, list) or not responses:
+        return None
+    archived = rows[0].get('responses_archived') or 0
+    # Segments continue the ones on this host; a survey archived elsewhere raises ArchiveUnavailable
+    archive.segments(survey_id, archived)
+    path, size = archive.write(survey_id, archived + 1, responses)
+    try:
+        client.rpc('archive_survey_responses', {'p_survey_id': survey_id, 'p_count': len(responses)})
+    except (SupabaseError, OSError) as e:
+        # The call may have committed before the connection failed; keep the segment if it did
+        rows = client.select('surveys', 'responses_archived', {'id': f"eq.{survey_id}"}, limit=1)
+        if not rows or rows[0]['responses_archived'] != archived + len(responses):
+            archive.remove(path)
+            if isinstance(e, SupabaseError) and e.status == 400:
+                # The rows table is missing responses; archiving would leave the segment as the only copy
+                raise ArchiveError(str(e)) from e
+            logger.warning("Survey not archived", extra={'survey_id': survey_id, 'error': str(e)})
+            return None
+    return len(responses), len(json.dumps(responses, separators=(',', ':')).encode('utf-8')), size
+
+
+def snapshot(client):
+    return client.rpc('hot_storage_sizes'), client.rpc('probe_response_append', {'p_samples': PROBE_SAMPLES})
+
+
+def print_report(before, after, out):
+    (sizes_before, probe_before), (sizes_after, probe_after) = before, after
+    for key in ('surveysTable', 'responsesIndex', 'questionsIndex', 'responseRows', 'responsesColumn',
+                'hotResponses', 'archivedResponses'):
+        unit = '' if key.endswith('Responses') else ' bytes'
+        print(f"{key:<18} {sizes_before[key]:>14,}{unit:<6} -> {sizes_after[key]:>14,}{unit}", file=out)
+    for key in ('p50Ms', 'p95Ms'):
+        if probe_before.get(key) is None or probe_after.get(key) is None:
+            continue
+        print(f"append {key:<11} {probe_before[key]:>14.3f}{'':<6} -> {probe_after[key]:>14.3f}", file=out)
+
+
+def run(client, archive, min_idle_days, dry_run=False, report=True, out=sys.stdout):
+    before = snapshot(client) if report else None
+    started = time.monotonic()
+    surveys = responses = json_bytes = segment_bytes = failed = 0
+    for survey_id in candidates(client, min_idle_days):
+        if dry_run:
+            print(f"would archive {survey_id}", file=out)
+            continue
+        try:
+            result = archive_survey(client, archive, survey_id)
+        except ArchiveError as e:
+            failed += 1
+            logger.error("Survey could not be archived", extra={'survey_id': survey_id, 'error': str(e)})
+            continue
+        if result is None:
+            continue
+        surveys += 1
+        responses += result[0]
+        json_bytes += result[1]
+        segment_bytes += result[2]
+
+    print(f"archived {responses} responses of {surveys} surveys in {time.monotonic() - started:.1f}s"
+          f" ({failed} failed)", file=out)
+    if segment_bytes:
+        print(f"segments {segment_bytes:,} bytes for {json_bytes:,} bytes of JSON"
+              f" (x{json_bytes / segment_bytes:.1f} smaller)", file=out)
+    if report:
+        print_report(before, snapshot(client), out)
+        if surveys:
+            print("Index sizes drop after REINDEX INDEX CONCURRENTLY idx_surveys_responses"
+                  " and VACUUM surveys", file=out)
+    return {'surveys': surveys, 'responses': responses, 'failed': failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--min-idle-days', type=float, default=30, help='days since a closed survey last changed')
+    parser.add_argument('--dry-run', action='store_true', help='list the surveys that would be archived')
+    parser.add_argument('--no-report', action='store_true', help='skip the storage sizes and probe appends')
+    args = parser.parse_args()
+    result = run(get_client(), get_response_archive(), args.min_idle_days, args.dry_run, not args.no_report)
+    return 1 if result['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# src/backend/backfill_responses.py
+"""Copy surveys.responses arrays into one row per response.
+
+Runs the database function backfill_response_rows() step by step. Each
+step copies at most --batch-rows responses with multi-row INSERTs inside
+the database, so neither this process nor a single statement ever holds
+more than one batch. The cursor (survey id, position) is checkpointed in
+the local SQLite data directory after every step; an interrupted run
+continues where it stopped, and re-running over copied data inserts
+nothing (rows are unique per survey and position).
+
+Responses submitted while the backfill runs are written to both models
+by the surveys_mirror_responses trigger, so readers can switch to the
+rows table once a run reports done.
+
+Needs SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
+
+    python backfill_responses.py --batch-rows 5000
+    python backfill_responses.py --restart   # start over from the first survey
+"""
+import argparse
+import sys
+import time
+
+try:
+    from .storage import connect
+    from .structured_logging import get_logger
+    from .supabase_rest import SupabaseError, get_client
+except ImportError:
+    from storage import connect
+    from structured_logging import get_logger
+    from supabase_rest import SupabaseError, get_client
+
+logger = get_logger('backfill_responses')
+
+MAX_RETRIES = 5
+
+
+class Checkpoints:
+    """Backfill cursors by run name, in the local SQLite database."""
+
+    def __init__(self, db_name='backfill'):
+        self._conn = connect(db_name)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                name TEXT PRIMARY KEY,
+                survey_id TEXT,
+                position INTEGER NOT NULL,
+                scanned INTEGER NOT NULL,
+                inserted INTEGER NOT NULL,
+                done INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    def load(self, name):
+        row = self._conn.execute("SELECT * FROM checkpoints WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return {'survey_id': None, 'position': 0, 'scanned': 0, 'inserted': 0, 'done': False}
+        return {
+            'survey_id': row['survey_id'], 'position': row['position'], 'scanned': row['scanned'],
+            'inserted': row['inserted'], 'done': bool(row['done']),
+        }
+
+    def save(self, name, checkpoint):
+        self._conn.execute(
+            "INSERT INTO checkpoints (name, survey_id, position, scanned, inserted, done, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET survey_id = excluded.survey_id, "
+            "position = excluded.position, scanned = excluded.scanned, inserted = excluded.inserted, "
+            "done = excluded.done, updated_at = excluded.updated_at",
+            (name, checkpoint['survey_id'], checkpoint['position'], checkpoint['scanned'],
+             checkpoint['inserted'], int(checkpoint['done']), time.time())
+        )
+
+    def reset(self, name):
+        self._conn.execute("DELETE FROM checkpoints WHERE name = ?", (name,))
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return '?'
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds // 60 % 60:02d}m{seconds % 60:02d}s"
+
+
+def step(client, checkpoint, batch_rows, max_surveys):
+    """Run one backfill step, retrying transient failures with backoff."""
+    args = {
+        'p_after_survey': checkpoint['survey_id'], 'p_after_position': checkpoint['position'],
+        'p_max_rows': batch_rows, 'p_max_surveys': max_surveys,
+    }
+    for attempt in range(MAX_RETRIES):
+        try:
+            return client.rpc('backfill_response_rows', args)
+        except (SupabaseError, OSError) as e:
+            # Client errors will not go away on retry
+            if isinstance(e, SupabaseError) and 400 <= e.status < 500 and e.status != 429:
+                raise
+            delay = min(2 ** attempt, 30)
+            logger.warning("Backfill step failed, retrying", extra={'error': str(e), 'delay_s': delay})
+            time.sleep(delay)
+    return client.rpc('backfill_response_rows', args)
+
+
+def run(client, checkpoints, name, batch_rows, max_surveys, report_every, max_seconds=None, out=sys.stdout):
+    checkpoint = checkpoints.load(name)
+    if checkpoint['done']:
+        print(f"{name}: already done ({checkpoint['scanned']} responses). Use --restart to run again.", file=out)
+        return checkpoint
+
+    total = client.rpc('response_backfill_total')
+    started = last_report = time.monotonic()
+    scanned_at_start = checkpoint['scanned']
+    print(f"{name}: {total} responses in total, resuming at {checkpoint['scanned']}", file=out)
+
+    while not checkpoint['done']:
+        result = step(client, checkpoint, batch_rows, max_surveys)
+        checkpoint = {
+            'survey_id': result['survey'], 'position': result['position'],
+            'scanned': checkpoint['scanned'] + result['scanned'],
+            'inserted': checkpoint['inserted'] + result['inserted'],
+            'done': result['done'],
+        }
+        checkpoints.save(name, checkpoint)
+
+        now = time.monotonic()
+        if checkpoint['done'] or now - last_report >= report_every:
+            last_report = now
+            rate = (checkpoint['scanned'] - scanned_at_start) / max(now - started, 1e-9)
+            remaining = max(total - checkpoint['scanned'], 0)
+            eta = remaining / rate if rate > 0 else None
+            print(
+                f"{checkpoint['scanned']:>12}/{total} responses  {checkpoint['inserted']:>12} inserted  "
+                f"{rate:10.0f} rows/s  ETA {format_eta(0 if checkpoint['done'] else eta)}",
+                file=out, flush=True
+            )
+        if max_seconds is not None and now - started >= max_seconds:
+            print(f"{name}: stopping after {max_seconds:.0f}s; run again to continue", file=out)
+            break
+
+    if checkpoint['done']:
+        print(f"{name}: done in {time.monotonic() - started:.1f}s", file=out)
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--name', default='responses', help='checkpoint name')
+    parser.add_argument('--batch-rows', type=int, default=5000, help='responses copied per step')
+    parser.add_argument('--max-surveys', type=int, default=500, help='surveys looked at per step')
+    parser.add_argument('--report-every', type=float, default=5, help='seconds between progress lines')
+    parser.add_argument('--max-seconds', type=float, default=None, help='stop after this long; resume later')
+    parser.add_argument('--restart', action='store_true', help='forget the checkpoint and start over')
+    args = parser.parse_args()
+
+    checkpoints = Checkpoints()
+    if args.restart:
+        checkpoints.reset(args.name)
+    try:
+        run(get_client(), checkpoints, args.name, args.batch_rows, args.max_surveys, args.report_every,
+            args.max_seconds)
+    except KeyboardInterrupt:
+        print(f"\n{args.name}: interrupted; the last completed step is checkpointed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# src/backend/bench_agent_socket.py
+"""Per-turn overhead of the WebSocket channel against the HTTP endpoints.
+
+Starts the Flask API (werkzeug, threaded) and the agent socket server in
+this process, both with the stub agent and the SQLite session store, and
+runs the same five-answer intake conversations through each:
+
+- http: POST /api/survey-agent/process on a keep-alive connection, as
+  the frontend does; each turn looks up and unpickles the agent.
+- socket: one connection per conversation, agent resident.
+
+With the default model latency of 0 the time per turn is the channel's
+own overhead. A second run paces the stub's reply one word every
+[token ms] to show time to first token, and cancels turns after their
+first token to time cancellation.
+
+Usage: python bench_agent_socket.py [conversations] [token ms]
+"""
+import http.client
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+os.environ['SURVEY_AGENT_STUB'] = '1'
+os.environ['SESSION_BACKEND'] = 'sqlite'
+os.environ.setdefault('STUB_MODEL_LATENCY_MS', '0')
+os.environ.setdefault('STUB_CPU_MS', '0')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('FORMALYZE_DATA_DIR', tempfile.mkdtemp(prefix='bench_agent_socket_'))
+
+from werkzeug.serving import make_server as make_http_server
+
+from agent_socket import SOCKET_PATH, TEXT, encode_frame, make_server, read_frame
+from api import app
+from bench_session_memory import ANSWERS
+
+
+class SocketClient:
+    """Minimal WebSocket client: handshake, masked text frames out, JSON messages in."""
+
+    def __init__(self, port, session_id):
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile('rb')
+        self.sock.sendall((
+            f"GET {SOCKET_PATH}?sessionId={session_id} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+            "Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Version: 13\r\n"
+            "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n"
+        ).encode('ascii'))
+        while self.rfile.readline() not in (b'\r\n', b''):
+            pass
+        self.receive()  # ready
+
+    def send(self, payload):
+        self.sock.sendall(encode_frame(TEXT, json.dumps(payload).encode('utf-8'), mask=os.urandom(4)))
+
+    def receive(self):
+        return json.loads(read_frame(self.rfile, require_mask=False)[2])
+
+    def until(self, *types):
+        while True:
+            message = self.receive()
+            if message['type'] in types:
+                return message
+
+    def close(self):
+        self.sock.close()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.95)]
+
+
+def run_http(port, conversations):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    turns = []
+    for _ in range(conversations):
+        headers = {'Content-Type': 'application/json', 'x-session-id': str(uuid.uuid4())}
+        connection.request('POST', '/api/survey-agent/start', b'{}', headers)
+        connection.getresponse().read()
+        for answer in ANSWERS[:5]:
+            started = time.perf_counter()
+            connection.request('POST', '/api/survey-agent/process', json.dumps({'userResponse': answer}), headers)
+            connection.getresponse().read()
+            turns.append(time.perf_counter() - started)
+    connection.close()
+    return turns
+
+
+def run_socket(port, conversations, cancel=False):
+    turns, first_tokens, cancels = [], [], []
+    for _ in range(conversations):
+        client = SocketClient(port, str(uuid.uuid4()))
+        client.send({'type': 'start'})
+        client.until('question')
+        for turn, answer in enumerate(ANSWERS[:5], 1):
+            started = time.perf_counter()
+            client.send({'type': 'message', 'turn': turn, 'text': answer})
+            message = client.until('token', 'done')
+            if message['type'] == 'token':
+                first_tokens.append(time.perf_counter() - started)
+                if cancel:
+                    cancelled_at = time.perf_counter()
+                    client.send({'type': 'cancel', 'turn': turn})
+                    client.until('cancelled')
+                    cancels.append(time.perf_counter() - cancelled_at)
+                    # Answer again so the conversation moves on
+                    client.send({'type': 'message', 'turn': -turn, 'text': answer})
+                    client.until('done')
+                    continue
+                client.until('done')
+            turns.append(time.perf_counter() - started)
+        client.close()
+    return turns, first_tokens, cancels
+
+
+def report(name, samples):
+    p50, p95 = percentiles(samples)
+    print(f"{name:<22} p50 {p50 * 1000:8.3f} ms   p95 {p95 * 1000:8.3f} ms   {len(samples) / sum(samples):8.0f} turns/s")
+    return p50
+
+
+def main():
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    token_ms = sys.argv[2] if len(sys.argv) > 2 else '20'
+
+    http_server = make_http_server('127.0.0.1', 0, app, threaded=True)
+    socket_server = make_server('127.0.0.1:0')
+    for server in (http_server, socket_server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    http_port, socket_port = http_server.server_port, socket_server.server_address[1]
+
+    # Warm both paths up
+    run_http(http_port, 5)
+    run_socket(socket_port, 5)
+
+    print(f"{conversations} conversations x 5 turns, stub model latency "
+          f"{os.environ['STUB_MODEL_LATENCY_MS']} ms")
+    http_p50 = report('http turn', run_http(http_port, conversations))
+    socket_p50 = report('socket turn', run_socket(socket_port, conversations)[0])
+    print(f"per-turn overhead saved: {(http_p50 - socket_p50) * 1000:.3f} ms (x{http_p50 / socket_p50:.1f})")
+
+    os.environ['STUB_TOKEN_MS'] = token_ms
+    streaming = max(conversations // 10, 5)
+    print(f"\nreplies paced at one word per {token_ms} ms, {streaming} conversations")
+    report('http turn (whole reply)', run_http(http_port, streaming))
+    turns, first_tokens, _ = run_socket(socket_port, streaming)
+    report('socket first token', first_tokens)
+    report('socket turn (done)', turns)
+    _, _, cancels = run_socket(socket_port, streaming, cancel=True)
+    report('cancel -> cancelled', cancels)
+
+    http_server.shutdown()
+    socket_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# src/backend/bench_response_screening.py
+"""Throughput, memory and accuracy of the response screen on a synthetic stream.
+
+Mixes genuine respondents (one submit each, own fingerprint, human
+completion times, varied free text) with three kinds of bot traffic: a
+flood from one client, scripted submits from rotating clients with
+templated near-identical text, and instant submits. Every submit is
+screened in arrival order on one core.
+
+Usage: python bench_response_screening.py [submits] [surveys] [bot share, e.g. 0.2]
+"""
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+from response_screening import ResponseScreen, client_fingerprint
+
+FRAGMENTS = (
+    "the app is really easy to use", "support was slow and not helpful", "love the new dashboard",
+    "pricing is too expensive for small teams", "it crashes when I upload files", "great onboarding",
+    "export to csv would be useful", "not bad but the search is confusing", "fast and reliable",
+    "I don't like the notifications", "checkout never works on mobile", "clean design, good charts",
+)
+# Respondents' own words, so genuine free text varies the way real answers do
+VOCABULARY = (
+    "we our team manager weekly monthly reports invoices clients projects students teachers nurses shifts "
+    "warehouse drivers delivery orders refunds tickets calls meetings calendar reminders tablet laptop browser "
+    "slow quick confusing helpful missing broken intuitive cluttered expensive cheap reliable flaky sync offline "
+    "login password export import spreadsheet integration slack email notifications search filters charts "
+    "because usually sometimes never always after before during morning evening weekend rollout training"
+).split()
+SPAM = "Best deals on crypto and loans visit our site today for a free bonus offer"
+
+
+def genuine(rng, survey_id, now):
+    answers = {'q1': rng.randint(1, 5), 'q2': rng.choice(['yes', 'no']),
+               'q3': ' '.join(rng.sample(FRAGMENTS, rng.randint(1, 2)) + rng.sample(VOCABULARY, rng.randint(4, 12)))}
+    address = f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}"
+    return survey_id, answers, client_fingerprint(address, 'Mozilla/5.0'), rng.uniform(20_000, 600_000)
+
+
+def bot(rng, survey_id, now, kind):
+    if kind == 'flood':
+        answers = {'q1': rng.randint(1, 5), 'q2': 'yes', 'q3': ' '.join(rng.sample(FRAGMENTS, 2))}
+        return survey_id, answers, client_fingerprint('203.0.113.7', 'python-requests/2.31'), rng.uniform(20_000, 60_000)
+    if kind == 'template':
+        answers = {'q1': 5, 'q2': 'yes', 'q3': f"{SPAM} {rng.randint(0, 9)}"}
+        address = f"198.51.{rng.randint(0, 255)}.{rng.randint(0, 255)}"
+        return survey_id, answers, client_fingerprint(address, 'Mozilla/5.0'), rng.uniform(20_000, 60_000)
+    answers = {'q1': rng.randint(1, 5), 'q2': rng.choice(['yes', 'no']), 'q3': rng.choice(FRAGMENTS)}
+    address = f"192.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}"
+    return survey_id, answers, client_fingerprint(address, 'HeadlessChrome'), rng.uniform(50, 900)
+
+
+def make_stream(n, surveys, bot_share, seed=11):
+    rng = random.Random(seed)
+    survey_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(surveys)]
+    # Genuine traffic arrives over an hour; one survey is attacked
+    target = survey_ids[0]
+    stream = []
+    for i in range(n):
+        now = 1_700_000_000 + i * 3600.0 / n
+        if rng.random() < bot_share:
+            kind = rng.choice(('flood', 'template', 'instant'))
+            stream.append((now, True) + bot(rng, target, now, kind))
+        else:
+            stream.append((now, False) + genuine(rng, rng.choice(survey_ids), now))
+    return stream
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    surveys = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    bot_share = float(sys.argv[3]) if len(sys.argv) > 3 else 0.2
+    stream = make_stream(n, surveys, bot_share)
+
+    tracemalloc.start()
+    screen = ResponseScreen()
+    caught = missed = false_positives = genuine_count = 0
+    started = time.perf_counter()
+    for now, is_bot, survey_id, answers, fingerprint, elapsed_ms in stream:
+        # Completion times are measured from the draft's start, stored when the form opened
+        verdict = screen.screen(survey_id, answers, fingerprint, now=now, started=now - elapsed_ms / 1000.0)
+        flagged = bool(verdict.reasons)
+        if is_bot:
+            caught += flagged
+            missed += not flagged
+        else:
+            genuine_count += 1
+            false_positives += flagged
+    seconds = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    bots = caught + missed
+    print(f"{n} submits to {surveys} surveys, {bots} from bots")
+    print(f"throughput  {n / seconds:,.0f} submits/s on one core ({seconds * 1e6 / n:.1f} us per submit)")
+    print(f"memory      {current / 2**20:.1f} MiB held, {peak / 2**20:.1f} MiB peak")
+    print(f"bots        {caught / max(bots, 1):.1%} quarantined")
+    print(f"genuine     {false_positives / max(genuine_count, 1):.2%} quarantined ({false_positives} of {genuine_count})")
+    print(f"by reason   {dict(screen.flagged)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# src/backend/bench_responses.py
+"""Microbenchmark for response serialization on large survey payloads.
+
+Compares the old per-response path (header dict merge + json.dumps +
+encode) with responses.py, for the stdlib and (if installed) orjson.
+
+Usage: python bench_responses.py [questions] [iterations]
+"""
+import json
+import sys
+import time
+
+import responses
+
+
+def make_survey(questions):
+    return {
+        'questions': [
+            {
+                'id': f"q{i + 1}",
+                'question_text': f"How would you rate your experience with feature {i + 1} of our product?",
+                'question_type': 'multiple_choice_single',
+                'required': i % 3 != 0,
+                'order_index': i + 1,
+                'choices': [
+                    {'id': f"c{j + 1}", 'text': label, 'order_index': j + 1}
+                    for j, label in enumerate(('Excellent', 'Good', 'Average', 'Poor', 'Very poor'))
+                ],
+            }
+            for i in range(questions)
+        ],
+        'degraded': False,
+    }
+
+
+def old_path(payload):
+    # api/index.py _send_response before the shared response layer
+    default_headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type',
+        'Content-Type': 'application/json'
+    }
+    headers = {**default_headers, **{}}
+    head = ''.join(f"{k}: {v}\r\n" for k, v in headers.items()).encode('latin-1')
+    return head + json.dumps(payload).encode('utf-8')
+
+
+def new_path(payload):
+    return responses.http_response_bytes('HTTP/1.0', 200, responses.json_body(payload))
+
+
+def measure(fn, payload, iterations):
+    fn(payload)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(payload)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    questions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    payload = make_survey(questions)
+    size = len(responses.json_body(payload))
+    print(f"Payload: {questions} questions, {size / 1024:.1f} KiB")
+
+    print(f"{'old (json.dumps + header merge)':<36} {measure(old_path, payload, iterations):10.1f} us")
+
+    orjson = responses.orjson
+    responses.orjson = None
+    print(f"{'responses.py (stdlib json)':<36} {measure(new_path, payload, iterations):10.1f} us")
+    responses.orjson = orjson
+    if orjson is not None:
+        print(f"{'responses.py (orjson)':<36} {measure(new_path, payload, iterations):10.1f} us")
+    else:
+        print("orjson not installed; skipping the fast backend")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# src/backend/bench_session_memory.py
+"""Memory per conversation, in sessions per GB, with list and compact transcripts.
+
+Builds stub-agent sessions whose transcripts hold the given number of
+messages (survey-design questions and answers of realistic length) and
+measures them two ways: the deep size session_memory reports, and the
+bytes actually allocated per session (tracemalloc). Each length is run
+with plain message-dict lists and with TRANSCRIPT_MODE=compact.
+
+Usage: python bench_session_memory.py [messages per session, e.g. 10,40,120] [sessions]
+"""
+import random
+import sys
+import tracemalloc
+
+from session_memory import GB, compact_transcripts, session_memory
+from stub_agent import INTAKE_QUESTIONS, StubSurveyAgent
+
+ANSWERS = (
+    "We want to understand why customers cancel in their first month",
+    "Mostly small business owners who signed up in the last quarter",
+    "Around twelve questions, the survey should take under five minutes",
+    "Onboarding, pricing, support response times and the mobile app",
+    "A mix of rating scales and a couple of open text questions",
+    "Can you make the second question less leading and add an option for 'not sure'?",
+    "Please translate the wording to be friendlier, our audience is not technical",
+)
+FOLLOW_UPS = (
+    "Thanks, that helps. Should the pricing questions compare us with the tools they used before?",
+    "Got it. Would you like a screening question so only active users answer the app section?",
+    "Understood. I can group onboarding and support into one section to keep the survey short.",
+    "Here is a revised version of the question with a neutral wording and a 'not sure' option.",
+)
+
+
+def make_session(messages, rng):
+    agent = StubSurveyAgent(model_latency_ms=0, cpu_ms=0)
+    agent.start_conversation()
+    for key, _ in INTAKE_QUESTIONS:
+        agent.requirements[key] = rng.choice(ANSWERS)
+    agent.step = len(INTAKE_QUESTIONS)
+    while len(agent.history) < messages:
+        agent.history.append({'role': 'user', 'content': f"{rng.choice(ANSWERS)} ({rng.randint(1, 999)})"})
+        agent.history.append({'role': 'assistant', 'content': rng.choice(FOLLOW_UPS)})
+    return agent
+
+
+def measure(messages, sessions, compact):
+    rng = random.Random(messages)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    agents = []
+    for _ in range(sessions):
+        agent = make_session(messages, rng)
+        agents.append(compact_transcripts(agent) if compact else agent)
+    allocated = (tracemalloc.get_traced_memory()[0] - before) / sessions
+    tracemalloc.stop()
+    report = session_memory(agents[0])
+    return allocated, report
+
+
+def main():
+    lengths = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else '10,40,120').split(',')]
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    print(f"{sessions} sessions per run")
+    print(f"{'messages':>8} {'mode':<8} {'allocated':>10} {'deep':>9} {'transcript':>11} "
+          f"{'pickled':>8} {'sessions/GB':>12}")
+    for messages in lengths:
+        baseline = None
+        for mode in ('list', 'compact'):
+            allocated, report = measure(messages, sessions, mode == 'compact')
+            per_gb = GB / allocated
+            baseline = baseline or per_gb
+            print(f"{messages:>8} {mode:<8} {allocated:>10.0f} {report['totalBytes']:>9} "
+                  f"{report['transcriptBytes']:>11} {report['pickledBytes']:>8} {per_gb:>12,.0f}"
+                  f"  x{per_gb / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# src/backend/bench_text_scoring.py
+"""Throughput of the vectorized sentiment/keyword scorer, in responses per second.
+
+Scores a synthetic column of short answers on a single core (batch by
+batch, as ingestion does) and across a multiprocessing pool.
+
+Usage: python bench_text_scoring.py [answers] [processes]
+"""
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from text_scoring import TextAggregate, score_in_pool
+
+FRAGMENTS = (
+    "the app is really easy to use", "support was slow and not helpful", "love the new dashboard",
+    "pricing is too expensive for small teams", "it crashes when I upload files", "great onboarding",
+    "export to csv would be useful", "not bad but the search is confusing", "fast and reliable",
+    "I don't like the notifications", "checkout never works on mobile", "clean design, good charts",
+)
+
+
+def make_answers(n, seed=7):
+    rng = random.Random(seed)
+    return [' '.join(rng.sample(FRAGMENTS, rng.randint(1, 3))) + f" #{rng.randint(0, 999)}" for _ in range(n)]
+
+
+def single_core(answers, batch_size=5000):
+    aggregate = TextAggregate()
+    for start in range(0, len(answers), batch_size):
+        aggregate.score(answers[start:start + batch_size])
+    return aggregate
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    answers = make_answers(n)
+    print(f"{n} answers, {os.cpu_count()} CPU cores")
+
+    started = time.perf_counter()
+    single = single_core(answers)
+    elapsed = time.perf_counter() - started
+    print(f"single core      {n / elapsed:12.0f} responses/s")
+
+    with multiprocessing.Pool(processes) as pool:
+        pool.map(len, [[]] * processes)  # start the workers before timing
+        started = time.perf_counter()
+        pooled = score_in_pool(pool, answers, chunk_size=max(1000, n // (processes * 4)))
+        elapsed = time.perf_counter() - started
+    print(f"pool ({processes} procs) {n / elapsed:12.0f} responses/s")
+
+    assert pooled.count == single.count and (pooled.polarity == single.polarity).all()
+    print("top keywords:", ', '.join(k['term'] for k in single.summary(5)['keywords']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# src/backend/bench_workers.py
+"""Load test: survey-agent throughput as the number of gunicorn workers grows.
+
+Starts `gunicorn -c gunicorn.conf.py api:app` with the stub agent and the
+SQLite session backend for each worker count, then drives it with closed-loop
+clients running start -> 5x process conversations.
+
+Usage: python bench_workers.py [worker counts, e.g. 1,2,4] [clients] [seconds]
+"""
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PORT = 18080
+
+
+def wait_until_ready(timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=1)
+            conn.request('GET', '/api/test')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def client(stop_at, counts, errors):
+    conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+    while time.time() < stop_at:
+        headers = {'Content-Type': 'application/json', 'x-session-id': uuid.uuid4().hex}
+        steps = [('/api/survey-agent/start', {})]
+        steps += [('/api/survey-agent/process', {'userResponse': f"answer {i}"}) for i in range(5)]
+        for path, body in steps:
+            try:
+                conn.request('POST', path, json.dumps(body), headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status == 200:
+                    counts.append(1)
+                else:
+                    errors.append(response.status)
+            except OSError as e:
+                errors.append(str(e))
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+
+
+def run(workers, clients, seconds):
+    env = dict(
+        os.environ,
+        WEB_WORKERS=str(workers),
+        WEB_BIND=f"127.0.0.1:{PORT}",
+        SESSION_BACKEND='sqlite',
+        SURVEY_AGENT_STUB='1',
+        STUB_MODEL_LATENCY_MS=os.environ.get('STUB_MODEL_LATENCY_MS', '20'),
+        STUB_CPU_MS=os.environ.get('STUB_CPU_MS', '10'),
+        LOG_LEVEL='WARNING',
+        FORMALYZE_DATA_DIR=tempfile.mkdtemp(prefix='formalyze-bench-'),
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'api:app'],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready()
+        counts, errors = [], []
+        stop_at = time.time() + seconds
+        threads = [threading.Thread(target=client, args=(stop_at, counts, errors)) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(counts) / seconds, len(errors)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    worker_counts = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else '1,2,4').split(',')]
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    print(f"{clients} clients, {seconds:g}s per run, {os.cpu_count()} CPU cores")
+
+    baseline = None
+    for workers in worker_counts:
+        throughput, errors = run(workers, clients, seconds)
+        baseline = baseline or throughput
+        print(f"workers={workers:<3} {throughput:8.1f} req/s  x{throughput / baseline:4.2f}  errors={errors}")
+
+
+if __name__ == "__main__":
+    main()
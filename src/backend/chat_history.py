@@ -0,0 +1,268 @@
+import atexit
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+try:
+    from .session_recording import message_content
+    from .storage import connect
+    from .structured_logging import get_logger
+    from .supabase_rest import SupabaseError, get_client
+except ImportError:
+    from session_recording import message_content
+    from storage import connect
+    from structured_logging import get_logger
+    from supabase_rest import SupabaseError, get_client
+
+logger = get_logger('chat_history')
+
+CHATS_TABLE = '680da8fd0ef55179cf75685a_chats'
+MESSAGES_TABLE = '680da8fd0ef55179cf75685a_messages'
+CHAT_TITLE = 'Survey design chat'
+
+DEFAULT_BATCH_ROWS = 200
+DEFAULT_FLUSH_SECONDS = 2.0
+# Rows kept for retry while the database is unreachable; older ones are dropped
+MAX_PENDING_ROWS = 20000
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Access token -> user id lookups are reused for this long
+USER_CACHE_SECONDS = 300
+MAX_CACHED_USERS = 10000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_size(value):
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE)) if value else DEFAULT_PAGE_SIZE
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor("limit must be a number") from e
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    if not cursor.isdigit():
+        raise InvalidCursor("Invalid cursor")
+    return int(cursor)
+
+
+class ChatHistory:
+    """Agent conversations persisted to the chats/messages tables in batches.
+
+    After each turn only the messages the agent added since the previous
+    turn are queued, numbered by their position in the conversation (seq).
+    Queued rows are inserted by a background thread, many per request,
+    every `flush_seconds` or once `batch_rows` are waiting. Positions are
+    tracked per session in the local SQLite database, so every worker
+    process continues the same chat. A chat belongs to the signed-in
+    caller who started it (user_id); turns from another caller under the
+    same session id start a new chat.
+
+    History is read a page at a time, newest first, by seq, with the
+    caller's JWT, so only the owner's chats are visible (row level
+    security). Reopening a long chat costs one index range scan, whatever
+    its length.
+    """
+
+    def __init__(self, client=None, db_name='chat_history', batch_rows=DEFAULT_BATCH_ROWS,
+                 flush_seconds=DEFAULT_FLUSH_SECONDS):
+        self._client = client
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self._conn = connect(db_name)
+        self._lock = threading.Lock()
+        self._pending_chats = []
+        self._pending_messages = []
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._users = {}
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    chat_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(chat_sessions)')}
+            if 'user_id' not in columns:
+                self._conn.execute('ALTER TABLE chat_sessions ADD COLUMN user_id TEXT')
+        atexit.register(self.flush)
+
+    @property
+    def client(self):
+        return self._client or get_client()
+
+    def user_id(self, access_token):
+        """Id of the signed-in user `access_token` belongs to, or None if it is not valid."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._users.get(access_token)
+        if cached and cached[1] > now:
+            return cached[0]
+        try:
+            user_id = self.client.user(access_token).get('id')
+        except SupabaseError as e:
+            if e.status not in (401, 403):
+                raise
+            user_id = None
+        with self._lock:
+            if len(self._users) >= MAX_CACHED_USERS:
+                self._users.clear()
+            self._users[access_token] = (user_id, now + USER_CACHE_SECONDS)
+        return user_id
+
+    def record(self, session_id, agent, flush=False, access_token=None):
+        """Queue the messages `agent` added since the last call; flush=True writes them now.
+
+        `access_token` is the caller's JWT; without a valid one the chat has
+        no owner and its history cannot be read back.
+        """
+        history = [message_content(message) for message in agent.get_conversation_history()]
+        user_id = self.user_id(access_token) if access_token else None
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    "SELECT chat_id, seq, user_id FROM chat_sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                chat_id, seq = (row['chat_id'], row['seq']) if row else (None, 0)
+                if chat_id is None or len(history) < seq or row['user_id'] != user_id:
+                    # New session, the conversation was restarted under the same session id, or another caller
+                    chat_id, seq = str(uuid.uuid4()), 0
+                    self._pending_chats.append({
+                        'id': chat_id, 'session_id': session_id, 'user_id': user_id,
+                        'title': CHAT_TITLE, 'created_at': now,
+                    })
+                self._pending_messages.extend(
+                    {'chat_id': chat_id, 'seq': i, 'role': str(message['role']),
+                     'content': str(message['content']), 'created_at': now}
+                    for i, message in enumerate(history[seq:], seq)
+                )
+                self._conn.execute(
+                    "INSERT INTO chat_sessions (session_id, chat_id, seq, user_id, updated_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET chat_id = excluded.chat_id, seq = excluded.seq, "
+                    "user_id = excluded.user_id, updated_at = excluded.updated_at",
+                    (session_id, chat_id, len(history), user_id, time.time())
+                )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            pending = len(self._pending_messages)
+        if flush or pending >= self.batch_rows:
+            self.flush()
+        else:
+            self._ensure_flusher()
+        return chat_id
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            with self._flush_lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._run_flusher, name='chat-history', daemon=True)
+                    self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def flush(self):
+        """Insert every queued chat and message; on failure they stay queued for the next flush."""
+        with self._flush_lock:
+            with self._lock:
+                chats, messages = self._pending_chats, self._pending_messages
+                self._pending_chats, self._pending_messages = [], []
+            if not chats and not messages:
+                return 0
+            try:
+                if chats:
+                    self.client.insert(CHATS_TABLE, chats, on_conflict='id', ignore_duplicates=True)
+                for start in range(0, len(messages), self.batch_rows):
+                    self.client.insert(MESSAGES_TABLE, messages[start:start + self.batch_rows],
+                                       on_conflict='chat_id,seq', ignore_duplicates=True)
+            except (SupabaseError, OSError) as e:
+                # Chats are re-sent with their messages; both inserts ignore rows already written
+                with self._lock:
+                    self._pending_chats = chats + self._pending_chats
+                    self._pending_messages = (messages + self._pending_messages)[-MAX_PENDING_ROWS:]
+                logger.warning("Failed to persist chat messages", extra={'error': str(e), 'rows': len(messages)})
+                return 0
+            return len(messages)
+
+    def chat_id(self, session_id, client):
+        """The session's newest chat that `client` (the caller's, SupabaseRest.as_user) may read."""
+        with self._lock:
+            unsent = any(chat['session_id'] == session_id for chat in self._pending_chats)
+        if unsent:
+            self.flush()
+        rows = client.select(CHATS_TABLE, 'id', {'session_id': f"eq.{session_id}"},
+                             order='created_at.desc', limit=1)
+        return rows[0]['id'] if rows else None
+
+    def page(self, session_id, client, limit=None, cursor=None):
+        """One page of the session's chat, oldest first; nextCursor fetches the page before it.
+
+        Read with the caller's `client`, so callers only see their own chats.
+        """
+        limit = page_size(limit)
+        before = decode_cursor(cursor)
+        chat_id = self.chat_id(session_id, client)
+        if chat_id is None:
+            return {'chatId': None, 'messages': [], 'nextCursor': None}
+        with self._lock:
+            unsent = any(message['chat_id'] == chat_id for message in self._pending_messages)
+        if unsent:
+            self.flush()
+
+        filters = {'chat_id': f"eq.{chat_id}"}
+        if before is not None:
+            filters['seq'] = f"lt.{before}"
+        rows = client.select(MESSAGES_TABLE, 'seq,role,content,created_at', filters,
+                             order='seq.desc', limit=limit + 1) or []
+        page = rows[:limit][::-1]
+        return {
+            'chatId': chat_id,
+            'messages': [
+                {'seq': row['seq'], 'role': row['role'], 'content': row['content'], 'createdAt': row['created_at']}
+                for row in page
+            ],
+            # One extra row tells whether there are older messages
+            'nextCursor': str(page[0]['seq']) if len(rows) > limit else None,
+        }
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_chat_history():
+    """Return the process-wide history writer, or None without a Supabase project (or with CHAT_HISTORY=0).
+
+    Batching is configured by CHAT_HISTORY_BATCH_ROWS / CHAT_HISTORY_FLUSH_SECONDS.
+    """
+    global _history
+    with _history_lock:
+        if _history is None:
+            if os.environ.get('CHAT_HISTORY') == '0':
+                return None
+            try:
+                get_client()
+            except ValueError:
+                return None
+            _history = ChatHistory(
+                batch_rows=int(os.environ.get('CHAT_HISTORY_BATCH_ROWS', DEFAULT_BATCH_ROWS)),
+                flush_seconds=float(os.environ.get('CHAT_HISTORY_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)),
+            )
+        return _history
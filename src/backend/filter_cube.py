@@ -0,0 +1,249 @@
+import re
+import threading
+import time
+from collections import Counter
+
+try:
+    from .storage import connect
+    from .structured_logging import get_logger, log_duration
+    from .survey_responses import iter_answers, submitted_at, text_question_ids
+except ImportError:
+    from storage import connect
+    from structured_logging import get_logger, log_duration
+    from survey_responses import iter_answers, submitted_at, text_question_ids
+
+logger = get_logger('filter_cube')
+
+# Cells with no filter dimension use '' so they share the primary key
+ANY = ''
+# Responses without a timestamp only count when no date range is requested
+UNDATED = ''
+
+# since/until of a query
+DAY_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+# Answers longer than this are free text, not a choice
+MAX_CHOICE_LENGTH = 200
+MAX_CHOICES_PER_RESPONSE = 100
+
+
+def choice_values(answer):
+    """Choices selected by one answer: each item of a list, or the value itself."""
+    values = answer if isinstance(answer, list) else [answer]
+    choices = []
+    for value in values:
+        if isinstance(value, bool):
+            value = 'Yes' if value else 'No'
+        if isinstance(value, (str, int, float)):
+            value = str(value).strip()
+            if value and len(value) <= MAX_CHOICE_LENGTH:
+                choices.append(value)
+    return choices
+
+
+def response_cells(questions, response):
+    """(day, Counter of cells) for one response.
+
+    A cell is (question_id, choice, filter_question_id, filter_choice):
+    the marginal count of each choice has ANY as its filter, and every
+    pair of choices in the response adds a cross-filter cell, so "who
+    chose X also chose Y" is a single lookup.
+    """
+    text_ids = set(text_question_ids(questions))
+    chosen = []
+    for question_id, answer in iter_answers(response):
+        if str(question_id) in text_ids:
+            continue
+        chosen.extend((str(question_id), choice) for choice in choice_values(answer))
+    chosen = list(dict.fromkeys(chosen))[:MAX_CHOICES_PER_RESPONSE]
+
+    cells = Counter()
+    cells[(ANY, ANY, ANY, ANY)] += 1
+    for question_id, choice in chosen:
+        cells[(question_id, choice, ANY, ANY)] += 1
+        cells[(ANY, ANY, question_id, choice)] += 1
+        for filter_question_id, filter_choice in chosen:
+            if filter_question_id != question_id:
+                cells[(question_id, choice, filter_question_id, filter_choice)] += 1
+    when = submitted_at(response)
+    return (when[:10] if when else UNDATED), cells
+
+
+class FilterCube:
+    """Per-survey response counts by question, choice and day, in the local SQLite database.
+
+    Each response adds one count to the cell of every choice it selected,
+    plus one per pair of choices for cross-filtering. Dashboard filters
+    ("last week", "respondents who chose X") then sum the cells of the
+    requested days instead of scanning surveys.responses, so a query costs
+    the same for a hundred responses as for a million.
+    """
+
+    def __init__(self, db_name='analytics'):
+        self._conn = connect(db_name)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS filter_cube (
+                    survey_id TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    question_id TEXT NOT NULL,
+                    choice TEXT NOT NULL,
+                    filter_question_id TEXT NOT NULL,
+                    filter_choice TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (survey_id, filter_question_id, filter_choice, day, question_id, choice)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS filter_cube_progress (
+                    survey_id TEXT PRIMARY KEY,
+                    responses_seen INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(filter_cube_progress)')}
+            if 'response_count' not in columns:
+                self._conn.execute('ALTER TABLE filter_cube_progress ADD COLUMN response_count INTEGER')
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work()
+                self._conn.execute('COMMIT')
+                return result
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def _seen(self, survey_id):
+        row = self._conn.execute(
+            "SELECT responses_seen FROM filter_cube_progress WHERE survey_id = ?", (survey_id,)
+        ).fetchone()
+        return row['responses_seen'] if row else 0
+
+    def _add(self, survey_id, questions, responses):
+        totals = Counter()
+        for response in responses:
+            day, cells = response_cells(questions, response)
+            for cell, count in cells.items():
+                totals[(day, *cell)] += count
+        self._conn.executemany(
+            "INSERT INTO filter_cube (survey_id, day, question_id, choice, filter_question_id, filter_choice, count) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO UPDATE SET count = count + excluded.count",
+            [(survey_id, *key, count) for key, count in totals.items()]
+        )
+
+    def seen(self, survey_id):
+        with self._lock:
+            return self._seen(survey_id)
+
+    def fresh(self, survey_id, response_count):
+        """True if the cube is up to date with the survey's response counter (survey_response_counters).
+
+        The counter only counts submits, so it can differ from the number
+        of responses (surveys created with responses, responses written
+        before the counter existed). The cube compares it with the counter
+        value of its last update() plus the submits ingested since.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response_count FROM filter_cube_progress WHERE survey_id = ?", (survey_id,)
+            ).fetchone()
+        return row is not None and row['response_count'] == response_count
+
+    def update(self, survey_id, questions, responses, response_count=None):
+        """Fold the responses not counted yet; rebuilds the survey's cube if responses were deleted.
+
+        `response_count` is the survey's response counter, read before
+        loading `responses`, for fresh().
+        """
+        started = time.perf_counter()
+
+        def work():
+            seen = self._seen(survey_id)
+            if len(responses) < seen:
+                self._conn.execute("DELETE FROM filter_cube WHERE survey_id = ?", (survey_id,))
+                seen = 0
+            if len(responses) > seen:
+                self._add(survey_id, questions, responses[seen:])
+            self._conn.execute(
+                "INSERT INTO filter_cube_progress (survey_id, responses_seen, response_count, updated_at) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(survey_id) DO UPDATE SET "
+                "responses_seen = excluded.responses_seen, response_count = excluded.response_count, "
+                "updated_at = excluded.updated_at",
+                (survey_id, len(responses), response_count, time.time())
+            )
+            return len(responses) - seen
+        added = self._transaction(work)
+        log_duration(logger, "Updated filter cube", started, survey_id=survey_id, responses=added)
+        return added
+
+    def ingest(self, survey_id, questions, responses, position):
+        """Count newly submitted responses ending at `position` (see ResponseIngestor.after_submit)."""
+        def work():
+            if self._seen(survey_id) != position - len(responses):
+                return False
+            self._add(survey_id, questions, responses)
+            # Each submit also added one to the survey's response counter
+            self._conn.execute(
+                "INSERT INTO filter_cube_progress (survey_id, responses_seen, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(survey_id) DO UPDATE SET responses_seen = excluded.responses_seen, "
+                "response_count = response_count + ?, updated_at = excluded.updated_at",
+                (survey_id, position, time.time(), len(responses))
+            )
+            return True
+        return self._transaction(work)
+
+    def query(self, survey_id, since=None, until=None, filter_question_id=None, filter_choice=None):
+        """Choice counts per question for responses in [since, until] (YYYY-MM-DD, inclusive).
+
+        With a filter, only respondents who chose `filter_choice` on
+        `filter_question_id` are counted.
+        """
+        if filter_question_id is not None and filter_choice is not None:
+            filters = (str(filter_question_id), str(filter_choice))
+        else:
+            filters = (ANY, ANY)
+        sql = ("SELECT question_id, choice, SUM(count) AS count FROM filter_cube "
+               "WHERE survey_id = ? AND filter_question_id = ? AND filter_choice = ?")
+        params = [survey_id, *filters]
+        if since or until:
+            sql += " AND day >= ? AND day <= ?"
+            params += [since or '0000-00-00', until or '9999-99-99']
+        sql += " GROUP BY question_id, choice"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        questions = {}
+        responses = 0
+        for row in rows:
+            if row['question_id'] == ANY:
+                # The total for a filter is stored as the filter's own (ANY, ANY) cell
+                responses = row['count']
+            else:
+                questions.setdefault(row['question_id'], {})[row['choice']] = row['count']
+        return {'responses': responses, 'questions': questions}
+
+    def days(self, survey_id):
+        """Response counts per day, for the date picker."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, count FROM filter_cube WHERE survey_id = ? AND filter_question_id = ? "
+                "AND filter_choice = ? AND question_id = ? AND choice = ? ORDER BY day",
+                (survey_id, ANY, ANY, ANY, ANY)
+            ).fetchall()
+        return {row['day'] or 'undated': row['count'] for row in rows}
+
+
+_cube = None
+_cube_lock = threading.Lock()
+
+
+def get_filter_cube():
+    global _cube
+    with _cube_lock:
+        if _cube is None:
+            _cube = FilterCube()
+        return _cube
@@ -0,0 +1,28 @@
+# src/backend/gunicorn.conf.py
+"""Production serving mode for the Flask API.
+
+    cd src/backend && gunicorn -c gunicorn.conf.py api:app
+
+Runs WEB_WORKERS processes (default: one per CPU core), each with
+WEB_THREADS threads so model calls that are waiting on the network
+overlap. Session state is shared through SQLite so any worker can
+continue any conversation; requests on the same session take turns
+(session_store.locked).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8080')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+# Survey generation can take a while; the job API avoids holding requests this long
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+keepalive = 5
+
+# In-process session state would pin a conversation to one worker
+if workers > 1:
+    os.environ.setdefault('SESSION_BACKEND', 'sqlite')
+
+accesslog = None
+errorlog = '-'
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+try:
+    from .responses import json_body
+    from .storage import connect
+    from .structured_logging import get_logger
+except ImportError:
+    from responses import json_body
+    from storage import connect
+    from structured_logging import get_logger
+
+logger = get_logger('idempotency')
+
+# Clients send a fresh key per logical operation and reuse it when retrying
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+# Set on responses served from the store instead of running the request
+REPLAYED_HEADER = 'Idempotent-Replayed'
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9_.:-]{8,128}$')
+
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_ENTRIES = 50000
+# How long a retry waits for the first attempt of the same key to finish
+DEFAULT_WAIT = 30.0
+# A pending key older than this belongs to a worker that died mid-request
+PENDING_TIMEOUT = 300.0
+# Counting rows is a scan, so the size bound is enforced every few claims
+EVICT_EVERY = 100
+
+
+class InvalidIdempotencyKey(ValueError):
+    pass
+
+
+class IdempotencyConflict(Exception):
+    """The key is still being processed, or was used for a different request."""
+
+
+def fingerprint(body):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return hashlib.sha256(body or b'').hexdigest()
+
+
+class IdempotencyStore:
+    """Results of completed requests by (scope, idempotency key), in the local SQLite database.
+
+    The first request with a key claims it with a pending row, runs, and
+    stores its status and JSON payload; a retry with the same key and body
+    gets the stored result without running again, or waits while the first
+    attempt is still in flight. Server errors and exceptions release the
+    key so the client can retry for real. Entries expire after `ttl`
+    seconds and the oldest are evicted beyond `max_entries`.
+
+    Every worker process on the host shares the database, like the SQLite
+    session store.
+    """
+
+    def __init__(self, db_name='idempotency', ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, wait=DEFAULT_WAIT):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait = wait
+        self._claims = 0
+        self._conn = connect(db_name)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    scope TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    status INTEGER,
+                    payload BLOB,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (scope, key)
+                )
+            """)
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys(created_at)')
+            self._conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (time.time() - ttl,))
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work()
+                self._conn.execute('COMMIT')
+                return result
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def _claim(self, scope, key, digest):
+        """Claim the key; returns the stored row if another request already has it."""
+        def work():
+            now = time.time()
+            row = self._conn.execute(
+                "SELECT fingerprint, status, payload, created_at FROM idempotency_keys WHERE scope = ? AND key = ?",
+                (scope, key)
+            ).fetchone()
+            expired = row is not None and (
+                now - row['created_at'] > self.ttl
+                or (row['status'] is None and now - row['created_at'] > PENDING_TIMEOUT)
+            )
+            if row is not None and not expired:
+                return row
+            self._conn.execute(
+                "INSERT INTO idempotency_keys (scope, key, fingerprint, status, payload, created_at) "
+                "VALUES (?, ?, ?, NULL, NULL, ?) ON CONFLICT(scope, key) DO UPDATE SET "
+                "fingerprint = excluded.fingerprint, status = NULL, payload = NULL, created_at = excluded.created_at",
+                (scope, key, digest, now)
+            )
+            self._claims += 1
+            if self._claims % EVICT_EVERY == 0:
+                self._evict(now)
+            return None
+        return self._transaction(work)
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - self.ttl,))
+        excess = self._conn.execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM idempotency_keys WHERE rowid IN "
+                "(SELECT rowid FROM idempotency_keys ORDER BY created_at LIMIT ?)", (excess,)
+            )
+
+    def _stored(self, scope, key):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT fingerprint, status, payload, created_at FROM idempotency_keys WHERE scope = ? AND key = ?",
+                (scope, key)
+            ).fetchone()
+
+    def _finish(self, scope, key, status, payload):
+        with self._lock:
+            if status is None:
+                self._conn.execute("DELETE FROM idempotency_keys WHERE scope = ? AND key = ?", (scope, key))
+            else:
+                self._conn.execute(
+                    "UPDATE idempotency_keys SET status = ?, payload = ? WHERE scope = ? AND key = ?",
+                    (status, json_body(payload), scope, key)
+                )
+
+    def run(self, scope, key, body, work):
+        """Run `work()` -> (status, payload) at most once per key; returns (status, payload, replayed).
+
+        Without a key the request simply runs. `body` is the raw request
+        body; reusing a key with a different body is a conflict.
+        """
+        if not key:
+            status, payload = work()
+            return status, payload, False
+        if not KEY_PATTERN.match(key):
+            raise InvalidIdempotencyKey(f"{IDEMPOTENCY_HEADER} must be 8-128 letters, digits or _.:-")
+
+        digest = fingerprint(body)
+        deadline = time.monotonic() + self.wait
+        delay = 0.02
+        row = self._claim(scope, key, digest)
+        while row is not None:
+            if row['fingerprint'] != digest:
+                raise IdempotencyConflict(f"{IDEMPOTENCY_HEADER} was already used for a different request")
+            if row['status'] is not None:
+                logger.info("Replayed idempotent request", extra={'scope': scope})
+                return row['status'], json.loads(row['payload']), True
+            if time.monotonic() >= deadline:
+                raise IdempotencyConflict("A request with this Idempotency-Key is still being processed")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+            row = self._stored(scope, key)
+            if row is None:
+                # The first attempt failed and released the key
+                row = self._claim(scope, key, digest)
+
+        try:
+            status, payload = work()
+        except BaseException:
+            self._finish(scope, key, None, None)
+            raise
+        # Server errors are not remembered, so a retry runs again
+        self._finish(scope, key, status if status < 500 else None, payload)
+        return status, payload, False
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store():
+    """Return the process-wide store, configured by IDEMPOTENCY_TTL / IDEMPOTENCY_MAX_ENTRIES."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = IdempotencyStore(
+                ttl=float(os.environ.get('IDEMPOTENCY_TTL', DEFAULT_TTL)),
+                max_entries=int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+            )
+        return _store
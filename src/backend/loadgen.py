@@ -0,0 +1,259 @@
+# src/backend/loadgen.py
+"""Open-loop load generator for the /api/survey-agent/* conversation flow.
+
+Each virtual user runs start -> 5x process -> survey -> finalize with its own
+x-session-id, using the same request bodies as the frontend. Users arrive as a
+Poisson process at the offered rate regardless of how fast the server answers,
+so latency under overload is measured instead of hidden.
+
+Run the backend with the stubbed model, e.g.:
+
+    SURVEY_AGENT_STUB=1 STUB_MODEL_LATENCY_MS=800 STUB_LATENCY_SIGMA=0.5 \\
+    STUB_GENERATE_LATENCY_MS=6000 gunicorn -c gunicorn.conf.py api:app
+
+then:
+
+    python loadgen.py --url http://127.0.0.1:8080 --rates 1,2,5,10,20 --duration 60
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlparse
+
+STEPS = ('start', 'process', 'survey', 'finalize')
+
+# Answers to the five intake questions, as a user would type them
+ANSWERS = (
+    "Customer satisfaction with our mobile app",
+    "Existing customers who used the app in the last month",
+    "8 questions",
+    "Ease of use, performance, support and pricing",
+    "Mostly rating scales and multiple choice, one open-ended question",
+)
+
+# Histogram buckets in milliseconds (upper bounds)
+BUCKETS_MS = [2 ** i for i in range(0, 17)]
+
+
+class HttpConnection:
+    """Minimal keep-alive HTTP/1.1 client on asyncio streams."""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None, headers=None):
+        return await asyncio.wait_for(self._request(method, path, body, headers), self.timeout)
+
+    async def _request(self, method, path, body, headers):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                 f"Content-Length: {len(payload)}", "Content-Type: application/json"]
+        lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            response_headers[key.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding') == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            data = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            data = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            data = await self.reader.read()
+            response_headers['connection'] = 'close'
+
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.sessions_started = 0
+        self.sessions_completed = 0
+        self.dropped = 0
+
+    def record(self, step, started, ok, error=None):
+        self.latencies[step].append((time.perf_counter() - started) * 1000)
+        if not ok:
+            self.errors[(step, error)] += 1
+
+
+async def virtual_user(url, stats, timeout, think_ms):
+    conn = HttpConnection(url.hostname, url.port or 80, timeout)
+    headers = {'x-session-id': uuid.uuid4().hex}
+    session_started = time.perf_counter()
+    stats.sessions_started += 1
+
+    async def call(step, method, path, body=None):
+        started = time.perf_counter()
+        try:
+            status, data = await conn.request(method, path, body, headers)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            conn.close()
+            stats.record(step, started, False, type(e).__name__)
+            return None
+        if status >= 400:
+            stats.record(step, started, False, status)
+            return None
+        stats.record(step, started, True)
+        return json.loads(data) if data else {}
+
+    try:
+        if await call('start', 'POST', '/api/survey-agent/start', {}) is None:
+            return
+        for answer in ANSWERS:
+            if think_ms:
+                await asyncio.sleep(random.expovariate(1000.0 / think_ms))
+            if await call('process', 'POST', '/api/survey-agent/process', {'userResponse': answer}) is None:
+                return
+        survey = await call('survey', 'GET', '/api/survey-agent/survey')
+        if survey is None:
+            return
+        selected = survey.get('questions', [])
+        if await call('finalize', 'POST', '/api/survey-agent/finalize', {'selectedQuestions': selected}) is None:
+            return
+        stats.sessions_completed += 1
+        stats.record('session', session_started, True)
+    finally:
+        conn.close()
+
+
+async def run_rate(url, rate, duration, timeout, think_ms, max_active):
+    """Offer `rate` new conversations per second for `duration` seconds."""
+    stats = Stats()
+    tasks = set()
+    started = time.perf_counter()
+    next_arrival = started
+    while next_arrival - started < duration:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) >= max_active:
+            stats.dropped += 1
+        else:
+            task = asyncio.create_task(virtual_user(url, stats, timeout, think_ms))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        next_arrival += random.expovariate(rate)
+    if tasks:
+        await asyncio.wait(tasks)
+    return stats, time.perf_counter() - started
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(math.ceil(q * len(ordered))) - 1)]
+
+
+def histogram(values, width=40):
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for value in values:
+        for i, bound in enumerate(BUCKETS_MS):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    peak = max(counts) or 1
+    lines = []
+    for i, count in enumerate(counts):
+        if not count:
+            continue
+        label = f"<= {BUCKETS_MS[i]} ms" if i < len(BUCKETS_MS) else f"> {BUCKETS_MS[-1]} ms"
+        lines.append(f"    {label:>12} {count:7d} {'#' * max(1, round(count / peak * width))}")
+    return '\n'.join(lines)
+
+
+def report(rate, stats, elapsed, show_histograms):
+    requests = sum(len(stats.latencies[step]) for step in STEPS)
+    errors = sum(stats.errors.values())
+    error_rate = errors / requests if requests else 0.0
+    print(f"\n=== offered {rate:g} conversations/s for {elapsed:.0f}s ===")
+    print(f"  conversations: started={stats.sessions_started} completed={stats.sessions_completed} "
+          f"dropped(client limit)={stats.dropped}")
+    print(f"  requests={requests} ({requests / elapsed:.1f}/s) errors={errors} ({error_rate:.2%})")
+    for step in STEPS + ('session',):
+        values = stats.latencies.get(step, [])
+        if not values:
+            continue
+        print(f"  {step:<9} n={len(values):<6} p50={percentile(values, .5):8.1f} ms  "
+              f"p90={percentile(values, .9):8.1f} ms  p99={percentile(values, .99):8.1f} ms  "
+              f"max={max(values):8.1f} ms")
+        if show_histograms:
+            print(histogram(values))
+    for (step, error), count in sorted(stats.errors.items(), key=lambda item: -item[1]):
+        print(f"  error {step}: {error} x{count}")
+    return error_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--rates', default='1,2,5,10', help='offered conversations/s, comma separated')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of arrivals per rate')
+    parser.add_argument('--timeout', type=float, default=60, help='per-request timeout in seconds')
+    parser.add_argument('--think-ms', type=float, default=0, help='mean user think time between turns')
+    parser.add_argument('--max-active', type=int, default=5000, help='client-side cap on live conversations')
+    parser.add_argument('--slo-ms', type=float, default=2000, help='p99 latency SLO for process requests')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--histograms', action='store_true', help='print latency histograms per step')
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    saturation = None
+    for rate in [float(r) for r in args.rates.split(',')]:
+        stats, elapsed = asyncio.run(run_rate(url, rate, args.duration, args.timeout, args.think_ms, args.max_active))
+        error_rate = report(rate, stats, elapsed, args.histograms)
+        p99 = percentile(stats.latencies.get('process', []), .99)
+        if saturation is None and (error_rate > args.max_error_rate or p99 > args.slo_ms or stats.dropped):
+            saturation = rate
+
+    print()
+    if saturation is None:
+        print("No saturation observed at the offered rates")
+    else:
+        print(f"Saturation at {saturation:g} conversations/s "
+              f"(p99 process > {args.slo_ms:g} ms, error rate > {args.max_error_rate:.0%} or client limit hit)")
+
+
+if __name__ == "__main__":
+    main()
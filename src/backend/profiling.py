@@ -0,0 +1,157 @@
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# Requests carrying this header (set to the admin token) are always profiled
+DEBUG_HEADER = 'X-Debug-Profile'
+
+# Number of functions included in the text report
+REPORT_LINES = 40
+
+
+class ProfileSession:
+    def __init__(self, method, path):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.profiler = cProfile.Profile()
+
+
+class RequestProfiler:
+    """Opt-in per-request cProfile sampler.
+
+    Profiling is disabled unless an admin token is configured. When enabled,
+    a `sample_rate` fraction of requests, plus any request whose debug header
+    carries the admin token, is profiled and the most recent `capacity`
+    profiles are kept in memory for download.
+    """
+
+    def __init__(self, token=None, sample_rate=0.0, capacity=20):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.enabled = bool(token)
+        self._profiles = deque(maxlen=capacity)
+        self._profiles_lock = threading.Lock()
+        # Only one cProfile profiler may be active at a time
+        self._active = threading.Lock()
+
+    def is_authorized(self, authorization):
+        """Check an `Authorization: Bearer <token>` header value."""
+        if not self.enabled or not authorization:
+            return False
+        scheme, _, value = authorization.partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(value.strip().encode(), self.token.encode())
+
+    def start(self, method, path, debug_header=None):
+        """Start profiling this request if it is sampled; returns a session or None."""
+        if not self.enabled:
+            return None
+        forced = bool(debug_header) and hmac.compare_digest(debug_header.encode(), self.token.encode())
+        if not forced and not (self.sample_rate > 0 and random.random() < self.sample_rate):
+            return None
+        if not self._active.acquire(blocking=False):
+            return None
+
+        session = ProfileSession(method, path)
+        try:
+            session.profiler.enable()
+        except Exception:
+            self._active.release()
+            raise
+        return session
+
+    def stop(self, session, status=None):
+        """Stop a session started by start() and store its profile."""
+        if session is None:
+            return
+        try:
+            session.profiler.disable()
+        finally:
+            self._active.release()
+
+        stats = pstats.Stats(session.profiler)
+        report = io.StringIO()
+        stats.stream = report
+        stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+
+        record = {
+            'id': session.id,
+            'method': session.method,
+            'path': session.path,
+            'status': status,
+            'startedAt': session.started_at,
+            'durationMs': round((time.time() - session.started_at) * 1000, 2),
+            'report': report.getvalue(),
+            # Same format as pstats.Stats.dump_stats, loadable with pstats/snakeviz
+            'stats': marshal.dumps(stats.stats),
+        }
+        with self._profiles_lock:
+            self._profiles.append(record)
+
+    @contextmanager
+    def profile(self, method, path, debug_header=None):
+        session = self.start(method, path, debug_header)
+        try:
+            yield session
+        finally:
+            self.stop(session)
+
+    def list_profiles(self):
+        """Summaries of the stored profiles, newest first."""
+        with self._profiles_lock:
+            records = list(self._profiles)
+        return [
+            {key: value for key, value in record.items() if key not in ('report', 'stats')}
+            for record in reversed(records)
+        ]
+
+    def get_profile(self, profile_id):
+        with self._profiles_lock:
+            for record in self._profiles:
+                if record['id'] == profile_id:
+                    return record
+        return None
+
+
+_profiler = None
+
+
+def get_profiler():
+    """Return the process-wide profiler, configured from the environment."""
+    global _profiler
+    if _profiler is None:
+        _profiler = RequestProfiler(
+            token=os.environ.get('PROFILE_ADMIN_TOKEN'),
+            sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+            capacity=int(os.environ.get('PROFILE_BUFFER_SIZE', 20)),
+        )
+    return _profiler
+
+
+def profiles_response(profiler, authorization, profile_id=None, fmt=None):
+    """Build the admin profile download response.
+
+    Returns (status_code, body, content_type); body is a dict for JSON
+    responses and bytes/str otherwise.
+    """
+    if not profiler.is_authorized(authorization):
+        return 401, {'error': 'Unauthorized'}, 'application/json'
+    if profile_id is None:
+        return 200, {'profiles': profiler.list_profiles()}, 'application/json'
+
+    record = profiler.get_profile(profile_id)
+    if record is None:
+        return 404, {'error': 'Profile not found'}, 'application/json'
+    if fmt == 'prof':
+        return 200, record['stats'], 'application/octet-stream'
+    return 200, record['report'], 'text/plain; charset=utf-8'
@@ -0,0 +1,371 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from langchain_openai import ChatOpenAI
+except ImportError:
+    ChatOpenAI = None
+
+try:
+    from .storage import connect
+    from .structured_logging import get_logger, log_duration
+    from .survey_templates import TEMPLATES, template_question_alternatives
+    from .token_usage import MeteredModel, charge_to
+except ImportError:
+    from storage import connect
+    from structured_logging import get_logger, log_duration
+    from survey_templates import TEMPLATES, template_question_alternatives
+    from token_usage import MeteredModel, charge_to
+
+logger = get_logger('question_edits')
+
+REGENERATE = 'regenerate'
+REPHRASE = 'rephrase'
+ADD = 'add'
+ACTIONS = (REGENERATE, REPHRASE, ADD)
+
+# Alternatives written per model call; the extras answer "show me another"
+DEFAULT_BATCH_SIZE = 3
+DEFAULT_CACHE_TTL = 30 * 60
+
+# Compact context: the rest of the survey costs a few tokens per question
+MAX_CONTEXT_TEXT = 120
+MAX_CONTEXT_OPTIONS = 6
+MAX_REQUIREMENT_TEXT = 200
+MAX_INSTRUCTION_TEXT = 500
+
+
+class InvalidEdit(ValueError):
+    pass
+
+
+def _describe(question):
+    line = f"[{question.get('question_type', 'text')}] {str(question.get('question_text', ''))[:MAX_CONTEXT_TEXT]}"
+    options = question.get('options') or []
+    if options:
+        shown = ', '.join(str(option) for option in options[:MAX_CONTEXT_OPTIONS])
+        line += f" (options: {shown}{', ...' if len(options) > MAX_CONTEXT_OPTIONS else ''})"
+    return line
+
+
+def compact_context(questions, exclude_id=None):
+    """One short line per question of the survey, leaving out `exclude_id`."""
+    return '\n'.join(
+        f"{i}. {_describe(question)}"
+        for i, question in enumerate((q for q in questions if q.get('id') != exclude_id), 1)
+    )
+
+
+# Identical for every edit of every session, so it forms a cacheable prompt prefix
+SYSTEM_PROMPT = '\n'.join([
+    "You are editing one question of a survey.",
+    "Reply with only a JSON array of objects with the keys question_text, "
+    f"question_type ({', '.join(TEMPLATES)}), required, and options for rating and multiple_choice questions.",
+])
+
+
+def build_prompt(action, requirements, context, target, count, instruction=None):
+    """Chat messages for one edit: the fixed system prompt, then what changes least to most.
+
+    Requirements and the rest of the survey stay the same across a
+    session's edits, so they extend the cached prefix; the target question
+    and the user's instruction come last.
+    """
+    lines = []
+    slots = [f"- {key}: {str(value)[:MAX_REQUIREMENT_TEXT]}" for key, value in (requirements or {}).items() if value]
+    if slots:
+        lines += ["Survey requirements:", *slots]
+    if context:
+        lines += ["Other questions in the survey (do not repeat them):", context]
+    if action == REGENERATE:
+        lines.append(f"Write {count} different questions that could replace this one: {_describe(target)}")
+    elif action == REPHRASE:
+        lines.append(f"Rephrase this question {count} different ways, keeping its meaning: {_describe(target)}")
+    else:
+        lines.append(f"Write {count} new questions covering something the survey does not ask yet.")
+    if instruction:
+        lines.append(f"The user asked: {instruction}")
+    return [('system', SYSTEM_PROMPT), ('user', '\n'.join(lines))]
+
+
+def normalize_question(question):
+    """Coerce a generated question into the survey's question shape, or None if unusable."""
+    if not isinstance(question, dict):
+        return None
+    text = str(question.get('question_text') or question.get('text') or '').strip()
+    if not text:
+        return None
+    question_type = question.get('question_type') or question.get('type')
+    question_type = question_type if question_type in TEMPLATES else 'text'
+    normalized = {'question_text': text, 'question_type': question_type, 'required': bool(question.get('required', True))}
+    if question_type in ('rating', 'multiple_choice'):
+        options = [str(option) for option in question.get('options') or [] if str(option).strip()]
+        if not options:
+            return None
+        normalized['options'] = options
+    return normalized
+
+
+def parse_questions(reply):
+    questions = json.loads(reply[reply.find('['):reply.rfind(']') + 1])
+    if not isinstance(questions, list):
+        raise ValueError("Question reply is not a JSON array")
+    return questions
+
+
+class ModelQuestionWriter:
+    """Writes alternatives for a single question in one chat completion."""
+
+    def __init__(self, api_key=None, model=None):
+        # Charged to the session being edited (QuestionEditor sets charge_to)
+        self.llm = MeteredModel(ChatOpenAI(
+            model_name=model or os.environ.get('QUESTION_EDIT_MODEL', 'gpt-3.5-turbo'),
+            openai_api_key=api_key or os.environ.get('OPENAI_API_KEY'),
+            temperature=0.8,
+        ))
+
+    def __call__(self, action, requirements, context, target, count, instruction=None):
+        messages = build_prompt(action, requirements, context, target, count, instruction)
+        return parse_questions(self.llm.invoke(messages).content)
+
+
+# Rewordings the template writer falls back to when rephrasing
+REPHRASE_PREFIXES = ("Could you tell us: ", "In a few words: ", "Thinking about your recent experience: ")
+
+
+def template_writer(action, requirements, context, target, count, instruction=None):
+    """Writes alternatives from the survey templates, without a model."""
+    lines = context.splitlines()
+    exclude = [line.split('] ', 1)[-1].split(' (options:')[0] for line in lines]
+    if target:
+        exclude.append(target.get('question_text', ''))
+        types = [target.get('question_type')]
+    else:
+        # Add the question type the survey uses least
+        used = [line.split('[', 1)[-1].split(']', 1)[0] for line in lines]
+        types = [min(TEMPLATES, key=used.count)]
+    if action != REPHRASE:
+        types += [name for name in TEMPLATES if name not in types]
+
+    alternatives = []
+    for question_type in types:
+        found = template_question_alternatives(requirements, question_type, count - len(alternatives), exclude)
+        alternatives += found
+        exclude += [question['question_text'] for question in found]
+        if len(alternatives) == count:
+            return alternatives
+    if action == REPHRASE:
+        alternatives += [
+            {**target, 'question_text': prefix + target['question_text']} for prefix in REPHRASE_PREFIXES
+        ][:count - len(alternatives)]
+    return alternatives
+
+
+class AlternativesCache:
+    """Unused alternatives per session and question, in the local SQLite database.
+
+    Entries are keyed by a hash of everything the alternatives depend on
+    (action, the target question, the rest of the survey, the user's
+    instruction), so any worker process can serve the next one and an
+    edited survey never gets stale suggestions.
+    """
+
+    def __init__(self, db_name='question_edits', ttl=DEFAULT_CACHE_TTL):
+        self.ttl = ttl
+        self._conn = connect(db_name)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS alternatives (
+                    session_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    questions TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, key)
+                )
+            """)
+            self._conn.execute("DELETE FROM alternatives WHERE updated_at < ?", (time.time() - ttl,))
+
+    def take(self, session_id, key):
+        """Pop the next cached alternative; returns (question or None, number left)."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    "SELECT questions, updated_at FROM alternatives WHERE session_id = ? AND key = ?",
+                    (session_id, key)
+                ).fetchone()
+                questions = json.loads(row['questions']) if row and time.time() - row['updated_at'] <= self.ttl else []
+                if questions:
+                    self._conn.execute(
+                        "UPDATE alternatives SET questions = ? WHERE session_id = ? AND key = ?",
+                        (json.dumps(questions[1:]), session_id, key)
+                    )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return (questions[0], len(questions) - 1) if questions else (None, 0)
+
+    def add(self, session_id, key, questions):
+        """Append alternatives, skipping any already cached; returns the number cached."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    "SELECT questions, updated_at FROM alternatives WHERE session_id = ? AND key = ?",
+                    (session_id, key)
+                ).fetchone()
+                cached = json.loads(row['questions']) if row and time.time() - row['updated_at'] <= self.ttl else []
+                texts = {q['question_text'].lower() for q in cached}
+                cached += [q for q in questions if q['question_text'].lower() not in texts]
+                self._conn.execute(
+                    "INSERT INTO alternatives (session_id, key, questions, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(session_id, key) DO UPDATE SET questions = excluded.questions, "
+                    "updated_at = excluded.updated_at",
+                    (session_id, key, json.dumps(cached), time.time())
+                )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return len(cached)
+
+
+class QuestionEditor:
+    """Regenerate, rephrase or add a single question of a generated survey.
+
+    Only the target question and a compact one-line-per-question summary
+    of the rest of the survey go to the model, so an edit costs a fraction
+    of regenerating the whole survey. Each call writes a small batch of
+    alternatives; the first is returned and the rest are cached, so asking
+    for another is answered from the cache. When the cache runs dry it is
+    refilled in the background.
+
+    The agent may provide write_question_alternatives(action, requirements,
+    context, target, count, instruction) (the stub agent does); otherwise
+    `writer` is used.
+    """
+
+    def __init__(self, writer=None, cache=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.writer = writer or template_writer
+        self.cache = cache or AlternativesCache()
+        self.batch_size = batch_size
+        self._refills = ThreadPoolExecutor(max_workers=2, thread_name_prefix='question-edits')
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    def edit(self, session_id, agent, questions, action, question_id=None, instruction=None):
+        """Return {'question', 'alternativesLeft', 'cached'} for one edit of `questions`."""
+        if action not in ACTIONS:
+            raise InvalidEdit(f"Unknown action: {action}")
+        if not isinstance(questions, list) or not all(isinstance(q, dict) for q in questions):
+            raise InvalidEdit("questions must be a list of question objects")
+        target = None
+        if action != ADD:
+            target = next((q for q in questions if q.get('id') == question_id), None)
+            if target is None:
+                raise InvalidEdit(f"Question {question_id} is not in the survey")
+        instruction = str(instruction or '').strip()[:MAX_INSTRUCTION_TEXT] or None
+
+        context = compact_context(questions, question_id if target else None)
+        # The target's own wording is part of the key: alternatives for an edited question are stale
+        key = hashlib.sha1(json.dumps(
+            [action, question_id if target else None, _describe(target) if target else None, context, instruction]
+        ).encode('utf-8')).hexdigest()
+        existing = {str(q.get('question_text', '')).strip().lower() for q in questions}
+
+        question, left = self.cache.take(session_id, key)
+        while question is not None and question['question_text'].lower() in existing:
+            question, left = self.cache.take(session_id, key)
+        cached = question is not None
+        if not cached:
+            started = time.perf_counter()
+            alternatives = self._write(session_id, agent, action, context, target, instruction, existing)
+            log_duration(logger, "Wrote question alternatives", started, action=action,
+                         alternatives=len(alternatives))
+            if not alternatives:
+                raise ValueError("No usable question was generated")
+            question = alternatives[0]
+            left = self.cache.add(session_id, key, alternatives[1:]) if len(alternatives) > 1 else 0
+        if left == 0:
+            existing = existing | {question['question_text'].lower()}
+            self._refill((session_id, key, agent, action, context, target, instruction, existing))
+
+        question = dict(question)
+        if target is not None:
+            question['id'] = target['id']
+            if action == REPHRASE:
+                # A rephrased question keeps its type and choices, so collected answers stay comparable
+                question['question_type'] = target.get('question_type', question['question_type'])
+                question.pop('options', None)
+                if target.get('options'):
+                    question['options'] = list(target['options'])
+        else:
+            question['id'] = next_question_id(questions)
+        return {'question': question, 'alternativesLeft': left, 'cached': cached}
+
+    def _write(self, session_id, agent, action, context, target, instruction, existing):
+        write = getattr(agent, 'write_question_alternatives', None) or self.writer
+        requirements = agent.get_survey_requirements() if hasattr(agent, 'get_survey_requirements') else {}
+        alternatives = []
+        with charge_to(session_id):
+            written = write(action, requirements, context, target, self.batch_size, instruction)
+        for question in written:
+            question = normalize_question(question)
+            if question and question['question_text'].lower() not in existing:
+                existing = existing | {question['question_text'].lower()}
+                alternatives.append(question)
+        return alternatives
+
+    def _refill(self, job):
+        session_id, key = job[:2]
+        with self._pending_lock:
+            if (session_id, key) in self._pending:
+                return
+            self._pending.add((session_id, key))
+        self._refills.submit(self._run_refill, job)
+
+    def _run_refill(self, job):
+        session_id, key = job[:2]
+        try:
+            alternatives = self._write(session_id, *job[2:])
+            if alternatives:
+                self.cache.add(session_id, key, alternatives)
+        except Exception:
+            logger.exception("Error refilling question alternatives", extra={'session_id': session_id})
+        finally:
+            with self._pending_lock:
+                self._pending.discard((session_id, key))
+
+
+def next_question_id(questions):
+    used = {q.get('id') for q in questions}
+    n = len(questions) + 1
+    while f"q_{n}" in used:
+        n += 1
+    return f"q_{n}"
+
+
+_editor = None
+_editor_lock = threading.Lock()
+
+
+def get_question_editor():
+    """Return the process-wide editor; writes with the model when OPENAI_API_KEY is set."""
+    global _editor
+    with _editor_lock:
+        if _editor is None:
+            writer = None
+            if ChatOpenAI is not None and os.environ.get('OPENAI_API_KEY'):
+                writer = ModelQuestionWriter()
+            _editor = QuestionEditor(
+                writer=writer,
+                cache=AlternativesCache(ttl=float(os.environ.get('QUESTION_ALTERNATIVES_TTL', DEFAULT_CACHE_TTL))),
+                batch_size=int(os.environ.get('QUESTION_ALTERNATIVES_BATCH', DEFAULT_BATCH_SIZE)),
+            )
+        return _editor
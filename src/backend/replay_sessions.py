@@ -0,0 +1,226 @@
+# src/backend/replay_sessions.py
+"""Replay recorded conversations against the current build.
+
+Record traffic by running the backend with SESSION_RECORD_RATE set (e.g.
+0.05 records one session in twenty); turns are written, redacted, under
+SESSION_TRACE_DIR (default .data/traces). Then replay them:
+
+    python replay_sessions.py .data/traces --out before.json
+    # ... switch to the new build ...
+    python replay_sessions.py .data/traces --baseline before.json
+
+Every turn is re-run in order with the recorded arguments. The model is
+replaced by the recording: each model call returns the recorded response,
+so replays are deterministic and cost nothing. Reported per turn:
+
+  * own time - wall time minus time spent in the model, i.e. what the
+    build itself costs; compared with the baseline report, or with the
+    recording when no baseline is given
+  * output differences - the result differs from the recorded one
+  * model mismatches - the build sent a different prompt, or made more
+    model calls than were recorded
+
+Exits with status 1 when any output differs or an operation's median own
+time regressed by more than --threshold.
+"""
+import argparse
+import difflib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+try:
+    from .session_recording import model_attributes, model_request, read_traces, redact, trace_dir
+except ImportError:
+    from session_recording import model_attributes, model_request, read_traces, redact, trace_dir
+
+
+class ReplayMismatch(Exception):
+    pass
+
+
+class ReplayedMessage:
+    """Stands in for the chat model's response message."""
+
+    def __init__(self, content):
+        self.content = content
+
+
+class ReplayModel:
+    """Answers a turn's model calls with the recorded responses, in order."""
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.used = 0
+        self.prompt_changes = 0
+
+    def invoke(self, messages, *args, **kwargs):
+        if self.used >= len(self.calls):
+            raise ReplayMismatch(f"model call {self.used + 1} was not recorded ({len(self.calls)} recorded)")
+        call = self.calls[self.used]
+        self.used += 1
+        if redact(model_request(messages)) != call['req']:
+            self.prompt_changes += 1
+        return ReplayedMessage(call['res'])
+
+
+def new_agent(stub):
+    if stub:
+        from stub_agent import StubSurveyAgent
+        # Recorded stub latency is not replayed; only the agent's own work is timed
+        return StubSurveyAgent(model_latency_ms=0, latency_sigma=0, generate_latency_ms=0)
+    from langgraph_survey_agent import LangGraphSurveyAgent
+    # Never reaches the API: every model attribute is replaced before each turn
+    return LangGraphSurveyAgent(api_key='replay')
+
+
+def normalized(value):
+    return json.loads(json.dumps(redact(list(value) if isinstance(value, tuple) else value), default=str))
+
+
+def output_diff(recorded, replayed, limit=20):
+    before = json.dumps(recorded, indent=1, sort_keys=True, ensure_ascii=False).splitlines()
+    after = json.dumps(replayed, indent=1, sort_keys=True, ensure_ascii=False).splitlines()
+    lines = list(difflib.unified_diff(before, after, 'recorded', 'replayed', lineterm='', n=1))
+    return lines[:limit] + (['...'] if len(lines) > limit else [])
+
+
+def replay_session(turns, stub):
+    """Re-run one session's turns; returns a result per turn."""
+    random.seed(0)
+    agent = new_agent(stub)
+    results = []
+    for turn in turns:
+        model = ReplayModel(turn.get('model') or [])
+        for name in model_attributes(agent):
+            setattr(agent, name, model)
+        result = {'session': turn['session'], 'turn': turn['turn'], 'op': turn['op'],
+                  'recordedOwnMs': round(turn['ms'] - turn.get('modelMs', 0), 2)}
+        started = time.perf_counter()
+        try:
+            out = getattr(agent, turn['op'])(*turn.get('args', []), **turn.get('kwargs', {}))
+            error = None
+        except Exception as e:
+            out, error = None, f"{type(e).__name__}: {e}"
+        result['ownMs'] = round((time.perf_counter() - started) * 1000, 2)
+        if error:
+            result['error'] = error
+        else:
+            replayed = normalized(out)
+            if replayed != turn['out']:
+                result['diff'] = output_diff(turn['out'], replayed)
+        if model.used < len(model.calls):
+            result['error'] = result.get('error') or f"{len(model.calls) - model.used} recorded model calls were not made"
+        if model.prompt_changes:
+            result['promptChanges'] = model.prompt_changes
+        results.append(result)
+    return results
+
+
+def replay(sessions, stub, repeat):
+    """Replay every session `repeat` times; each turn keeps its median own time."""
+    turns = []
+    for session, recorded in sorted(sessions.items()):
+        if not recorded or recorded[0]['op'] != 'start_conversation' or recorded[0]['turn'] != 0:
+            # Recording started mid-session (e.g. after a restart); the agent state is unknown
+            continue
+        runs = [replay_session(recorded, stub) for _ in range(repeat)]
+        for attempts in zip(*runs):
+            result = dict(attempts[0])
+            result['ownMs'] = round(statistics.median(attempt['ownMs'] for attempt in attempts), 2)
+            turns.append(result)
+    return turns
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def compare(turns, baseline=None):
+    """Per-operation latency summary: replay vs baseline report (or the recording)."""
+    reference = {}
+    if baseline:
+        reference = {(t['session'], t['turn']): t['ownMs'] for t in baseline['turns']}
+    by_op = defaultdict(lambda: ([], []))
+    for turn in turns:
+        before = reference.get((turn['session'], turn['turn'])) if baseline else turn['recordedOwnMs']
+        if before is None:
+            continue
+        by_op[turn['op']][0].append(before)
+        by_op[turn['op']][1].append(turn['ownMs'])
+    summary = {}
+    for op, (before, after) in sorted(by_op.items()):
+        summary[op] = {
+            'turns': len(after),
+            'beforeP50': round(statistics.median(before), 2),
+            'afterP50': round(statistics.median(after), 2),
+            'beforeP95': round(percentile(before, 95), 2),
+            'afterP95': round(percentile(after, 95), 2),
+        }
+        summary[op]['ratio'] = round(summary[op]['afterP50'] / max(summary[op]['beforeP50'], 0.01), 3)
+    return summary
+
+
+def print_report(turns, summary, threshold, baseline, out=sys.stdout):
+    source = 'baseline' if baseline else 'recorded'
+    print(f"{'operation':<28} {'turns':>6} {source + ' p50':>14} {'replay p50':>11} "
+          f"{source + ' p95':>14} {'replay p95':>11} {'ratio':>7}", file=out)
+    regressed = []
+    for op, row in summary.items():
+        flag = ''
+        if row['ratio'] > 1 + threshold and row['afterP50'] - row['beforeP50'] >= 1.0:
+            flag = '  REGRESSION'
+            regressed.append(op)
+        print(f"{op:<28} {row['turns']:>6} {row['beforeP50']:>14.2f} {row['afterP50']:>11.2f} "
+              f"{row['beforeP95']:>14.2f} {row['afterP95']:>11.2f} {row['ratio']:>7.2f}{flag}", file=out)
+
+    changed = [t for t in turns if 'diff' in t or 'error' in t]
+    prompts = sum(1 for t in turns if t.get('promptChanges'))
+    print(f"\n{len(turns)} turns replayed, {len(changed)} with different output or errors, "
+          f"{prompts} with changed model prompts", file=out)
+    for turn in changed[:20]:
+        print(f"\n-- session {turn['session']} turn {turn['turn']} ({turn['op']})", file=out)
+        if 'error' in turn:
+            print(f"   error: {turn['error']}", file=out)
+        for line in turn.get('diff', []):
+            print(f"   {line}", file=out)
+    return regressed, changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='trace files or directories (default: SESSION_TRACE_DIR)')
+    parser.add_argument('--stub', action='store_true', default=bool(os.environ.get('SURVEY_AGENT_STUB')),
+                        help='replay against StubSurveyAgent instead of LangGraphSurveyAgent')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per session; the median own time is kept')
+    parser.add_argument('--baseline', help='report of an earlier replay to compare latency against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p50 slowdown (0.2 = 20%%)')
+    parser.add_argument('--out', help='write the replay report (JSON) here, e.g. as the next baseline')
+    args = parser.parse_args()
+
+    sessions = read_traces(args.paths or [trace_dir()])
+    if not sessions:
+        print("No recorded sessions found")
+        return
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    turns = replay(sessions, args.stub, max(args.repeat, 1))
+    summary = compare(turns, baseline)
+    regressed, changed = print_report(turns, summary, args.threshold, baseline)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'turns': turns}, f, ensure_ascii=False, indent=1)
+    if regressed or changed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    from .storage import get_data_dir
+except ImportError:
+    from storage import get_data_dir
+
+MAGIC = b'FZSEG001'
+TRAILER = struct.Struct('<Q8s')
+SUFFIX = '.seg'
+ENVELOPE = '__envelope__'
+
+# Buffers are stored compressed only when that saves at least this much
+MIN_SAVING = 0.1
+# Strings repeat enough for a dictionary when distinct values are at most this share of the rows
+DICTIONARY_SHARE = 0.5
+MAX_OPEN_SEGMENTS = 64
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class ArchiveUnavailable(ArchiveError):
+    """The survey has archived responses that are not on this host's disk."""
+
+
+def _column_kind(values):
+    present = [v for v in values if v is not _MISSING]
+    if present and all(isinstance(v, int) and not isinstance(v, bool) and -2**63 <= v < 2**63 for v in present):
+        return 'int'
+    if present and all(isinstance(v, float) for v in present):
+        return 'float'
+    encoded = {json.dumps(v, sort_keys=True, ensure_ascii=False) for v in present}
+    if len(encoded) <= max(16, DICTIONARY_SHARE * len(values)):
+        return 'dict'
+    if all(isinstance(v, str) for v in present):
+        return 'str'
+    return 'json'
+
+
+class _Missing:
+    def __repr__(self):
+        return '<missing>'
+
+
+# An answer object without an 'answer' key, as opposed to an answer of null
+_MISSING = _Missing()
+
+
+def _offsets_and_data(texts):
+    data = [t.encode('utf-8') for t in texts]
+    offsets = np.zeros(len(data) + 1, dtype=np.uint64)
+    np.cumsum([len(d) for d in data], out=offsets[1:])
+    return offsets.tobytes(), b''.join(data)
+
+
+def encode_column(values):
+    """(kind, {buffer name: bytes}) for one question's answers, one value per response."""
+    kind = _column_kind(values)
+    present = np.array([v is not _MISSING for v in values], dtype=np.uint8)
+    if kind in ('int', 'float'):
+        dtype = np.int64 if kind == 'int' else np.float64
+        array = np.array([0 if v is _MISSING else v for v in values], dtype=dtype)
+        return kind, {'present': present.tobytes(), 'values': array.tobytes()}
+    if kind == 'dict':
+        dictionary, codes = {}, np.zeros(len(values), dtype=np.uint32)
+        for i, v in enumerate(values):
+            if v is not _MISSING:
+                codes[i] = dictionary.setdefault(json.dumps(v, sort_keys=True, ensure_ascii=False),
+                                                 len(dictionary) + 1)
+        # Code 0 is a missing answer
+        return kind, {'codes': codes.tobytes(),
+                      'dictionary': json.dumps(list(dictionary), ensure_ascii=False).encode('utf-8')}
+    texts = ['' if v is _MISSING else v if kind == 'str' else json.dumps(v, ensure_ascii=False) for v in values]
+    offsets, data = _offsets_and_data(texts)
+    return kind, {'present': present.tobytes(), 'offsets': offsets, 'data': data}
+
+
+def split_responses(responses):
+    """Envelopes (each response without its answer values) and the values by question id.
+
+    An answer is moved to its question's column the first time the
+    question appears in a response; a repeated question stays inline.
+    """
+    columns, envelopes = {}, []
+    for row, response in enumerate(responses):
+        answers = response if isinstance(response, list) else (response or {}).get('answers') \
+            if isinstance(response, dict) else None
+        envelope = json.loads(json.dumps(response))
+        moved = set()
+        if isinstance(answers, list):
+            target = envelope if isinstance(envelope, list) else envelope['answers']
+            for answer in target:
+                if not isinstance(answer, dict) or answer.get('question_id') is None:
+                    continue
+                key = json.dumps(answer['question_id'])
+                if key in moved:
+                    continue
+                moved.add(key)
+                column = columns.setdefault(key, [_MISSING] * len(responses))
+                column[row] = answer.pop('answer', _MISSING)
+                # Marks an answer object whose value lives in the column
+                answer['\x00'] = 1
+        envelopes.append(envelope)
+    return envelopes, columns
+
+
+def write_segment(path, survey_id, first_position, responses, level=6):
+    """Write `responses` as one columnar segment file; atomic (temporary file, fsync, rename)."""
+    envelopes, columns = split_responses(responses)
+    buffers, directory = [], []
+    offset = len(MAGIC)
+
+    def add(column, kind, parts):
+        nonlocal offset
+        entry = {'name': column, 'kind': kind, 'buffers': {}}
+        for name, raw in parts.items():
+            packed = zlib.compress(raw, level)
+            codec = 'zlib' if len(packed) <= len(raw) * (1 - MIN_SAVING) else 'raw'
+            stored = packed if codec == 'zlib' else raw
+            # Raw buffers start 8-byte aligned, so numeric ones map straight into numpy arrays
+            padding = -offset % 8
+            buffers.append(b'\0' * padding + stored)
+            offset += padding
+            entry['buffers'][name] = {'offset': offset, 'length': len(stored), 'rawLength': len(raw),
+                                      'codec': codec, 'crc32': zlib.crc32(raw)}
+            offset += len(stored)
+        directory.append(entry)
+
+    add(ENVELOPE, 'json', dict(zip(('offsets', 'data'), _offsets_and_data(
+        [json.dumps(e, ensure_ascii=False, separators=(',', ':')) for e in envelopes]))))
+    for column, values in columns.items():
+        add(column, *encode_column(values))
+
+    footer = json.dumps({
+        'version': 1, 'surveyId': survey_id, 'firstPosition': first_position, 'rows': len(responses),
+        'createdAt': datetime.now(timezone.utc).isoformat(), 'columns': directory,
+    }, separators=(',', ':')).encode('utf-8')
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        for buffer in buffers:
+            f.write(buffer)
+        f.write(footer)
+        f.write(TRAILER.pack(len(footer), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    directory_fd = os.open(os.path.dirname(path), os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
+    return os.path.getsize(path)
+
+
+class Segment:
+    """A segment file, memory-mapped; columns are decoded on first use."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        footer_length, magic = TRAILER.unpack(self._view[-TRAILER.size:])
+        if self._view[:len(MAGIC)] != MAGIC or magic != MAGIC:
+            raise ArchiveError(f"{path} is not a response segment")
+        start = len(self._view) - TRAILER.size - footer_length
+        self.meta = json.loads(bytes(self._view[start:start + footer_length]))
+        self.rows = self.meta['rows']
+        self.first_position = self.meta['firstPosition']
+        self._columns = {entry['name']: entry for entry in self.meta['columns']}
+
+    @property
+    def question_ids(self):
+        return [json.loads(name) for name in self._columns if name != ENVELOPE]
+
+    def _buffer(self, column, name, verify=False):
+        spec = self._columns[column]['buffers'][name]
+        stored = self._view[spec['offset']:spec['offset'] + spec['length']]
+        data = stored if spec['codec'] == 'raw' else zlib.decompress(stored)
+        if verify and zlib.crc32(data) != spec['crc32']:
+            raise ArchiveError(f"{self.path}: checksum mismatch in {column}/{name}")
+        return data
+
+    def _strings(self, column):
+        offsets = np.frombuffer(self._buffer(column, 'offsets'), dtype=np.uint64)
+        data = bytes(self._buffer(column, 'data'))
+        return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+    def _values(self, column):
+        entry = self._columns[column]
+        kind = entry['kind']
+        if kind == 'dict':
+            dictionary = [_MISSING] + [json.loads(v) for v in json.loads(bytes(self._buffer(column, 'dictionary')))]
+            codes = np.frombuffer(self._buffer(column, 'codes'), dtype=np.uint32)
+            return [dictionary[code] for code in codes.tolist()]
+        present = np.frombuffer(self._buffer(column, 'present'), dtype=np.uint8)
+        if kind in ('int', 'float'):
+            values = np.frombuffer(self._buffer(column, 'values'), dtype=np.int64 if kind == 'int' else np.float64)
+            return [v if p else _MISSING for v, p in zip(values.tolist(), present.tolist())]
+        texts = self._strings(column)
+        if kind == 'json':
+            texts = [json.loads(t) if p else t for t, p in zip(texts, present.tolist())]
+        return [t if p else _MISSING for t, p in zip(texts, present.tolist())]
+
+    def numeric(self, question_id):
+        """(values, present) numpy arrays of a numeric question, straight from the mapped file when stored raw."""
+        column = json.dumps(question_id)
+        entry = self._columns.get(column)
+        if entry is None or entry['kind'] not in ('int', 'float'):
+            return None
+        dtype = np.int64 if entry['kind'] == 'int' else np.float64
+        return (np.frombuffer(self._buffer(column, 'values'), dtype=dtype),
+                np.frombuffer(self._buffer(column, 'present'), dtype=np.uint8).astype(bool))
+
+    def column(self, question_id):
+        """Answers to one question, one per response (None where it was not answered)."""
+        column = json.dumps(question_id)
+        if column not in self._columns:
+            return [None] * self.rows
+        return [None if v is _MISSING else v for v in self._values(column)]
+
+    def responses(self):
+        """The stored responses, as they were in surveys.responses."""
+        envelopes = [json.loads(text) for text in self._strings(ENVELOPE)]
+        columns = {name: self._values(name) for name in self._columns if name != ENVELOPE}
+        for row, envelope in enumerate(envelopes):
+            answers = envelope if isinstance(envelope, list) else envelope.get('answers') \
+                if isinstance(envelope, dict) else None
+            for answer in answers if isinstance(answers, list) else ():
+                if isinstance(answer, dict) and answer.pop('\x00', None):
+                    value = columns[json.dumps(answer['question_id'])][row]
+                    if value is not _MISSING:
+                        answer['answer'] = value
+        return envelopes
+
+    def verify(self):
+        """Check every buffer's checksum."""
+        for column, entry in self._columns.items():
+            for name in entry['buffers']:
+                self._buffer(column, name, verify=True)
+
+
+class ResponseArchive:
+    """Responses of closed surveys in compressed, columnar segment files on local disk.
+
+    Each archiving run of a survey writes one segment under
+    <root>/<survey id>/, named by the 1-based position of its first
+    response; a survey's archived responses are its segments in order.
+    Segments are read through mmap, so readers only page in the columns
+    they decode; numeric answers stored uncompressed are used in place.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(get_data_dir(), 'archive')
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+
+    def survey_dir(self, survey_id):
+        return os.path.join(self.root, str(survey_id))
+
+    def segment_path(self, survey_id, first_position):
+        return os.path.join(self.survey_dir(survey_id), f"{first_position:010d}{SUFFIX}")
+
+    def paths(self, survey_id):
+        try:
+            names = sorted(n for n in os.listdir(self.survey_dir(survey_id)) if n.endswith(SUFFIX))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.survey_dir(survey_id), name) for name in names]
+
+    def segment(self, path):
+        with self._lock:
+            segment = self._open.pop(path, None) or Segment(path)
+            self._open[path] = segment
+            if len(self._open) > MAX_OPEN_SEGMENTS:
+                # Mappings are closed once no decoded array refers to them
+                self._open.popitem(last=False)
+            return segment
+
+    def segments(self, survey_id, expected=None):
+        """The survey's segments; `expected` is the archived response count the database records."""
+        segments = [self.segment(path) for path in self.paths(survey_id)]
+        position = 1
+        for segment in segments:
+            if segment.first_position != position:
+                raise ArchiveUnavailable(f"Archived responses of survey {survey_id} are incomplete")
+            position += segment.rows
+        if expected is not None and position - 1 != expected:
+            raise ArchiveUnavailable(f"Archived responses of survey {survey_id} are not on this host")
+        return segments
+
+    def write(self, survey_id, first_position, responses):
+        """Write and read back one segment; returns (path, bytes). Raises ArchiveError if it does not round-trip."""
+        path = self.segment_path(survey_id, first_position)
+        size = write_segment(path, str(survey_id), first_position, responses)
+        with self._lock:
+            self._open.pop(path, None)
+        segment = Segment(path)
+        segment.verify()
+        if segment.rows != len(responses) or segment.responses() != json.loads(json.dumps(responses)):
+            self.remove(path)
+            raise ArchiveError(f"Segment for survey {survey_id} did not read back identically")
+        return path, size
+
+    def remove(self, path):
+        with self._lock:
+            self._open.pop(path, None)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def responses(self, survey_id, expected=None):
+        responses = []
+        for segment in self.segments(survey_id, expected):
+            responses += segment.responses()
+        return responses
+
+    def column(self, survey_id, question_id, expected=None):
+        values = []
+        for segment in self.segments(survey_id, expected):
+            values += segment.column(question_id)
+        return values
+
+
+def merged_responses(survey_id, hot, archived_count, archive=None):
+    """A survey's archived responses followed by those still in surveys.responses."""
+    if not archived_count:
+        return hot
+    return (archive or get_response_archive()).responses(survey_id, archived_count) + hot
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_response_archive():
+    """Return the process-wide archive, under RESPONSE_ARCHIVE_DIR (default <data dir>/archive)."""
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = ResponseArchive(os.environ.get('RESPONSE_ARCHIVE_DIR'))
+        return _archive
@@ -0,0 +1,328 @@
+import json
+import os
+import re
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    from .response_screening import get_response_screen
+    from .structured_logging import get_logger
+    from .supabase_rest import SupabaseError, get_client
+    from .survey_definitions import SurveyNotFound
+except ImportError:
+    from response_screening import get_response_screen
+    from structured_logging import get_logger
+    from supabase_rest import SupabaseError, get_client
+    from survey_definitions import SurveyNotFound
+
+logger = get_logger('response_ingest')
+
+# Respondents identify their draft with this header; the first save issues a token
+TOKEN_HEADER = 'x-respondent-token'
+TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+MAX_ANSWERS = 200
+MAX_ANSWER_BYTES = 10000
+
+QUARANTINE_TABLE = 'response_quarantine'
+DEFAULT_QUARANTINE_PAGE = 50
+MAX_QUARANTINE_PAGE = 200
+
+# Submitted responses waiting for the after_submit hooks; beyond this they are left to the next full update
+DEFAULT_MAX_PENDING = 10000
+
+
+class InvalidResponse(ValueError):
+    pass
+
+
+class QuotaExceeded(Exception):
+    """The survey owner's plan allows no more responses to this survey."""
+
+
+def new_token():
+    return secrets.token_urlsafe(24)
+
+
+def check_token(token):
+    if not isinstance(token, str) or not TOKEN_PATTERN.match(token):
+        raise InvalidResponse("Invalid respondent token")
+    return token
+
+
+def check_answers(answers):
+    """Answers are a JSON object of question id -> answer."""
+    if not isinstance(answers, dict) or len(answers) > MAX_ANSWERS:
+        raise InvalidResponse("answers must be an object mapping question ids to answers")
+    for question_id, answer in answers.items():
+        if len(json.dumps(answer)) > MAX_ANSWER_BYTES:
+            raise InvalidResponse(f"Answer to {question_id} is too large")
+    return answers
+
+
+def _raise_for(e, survey_id):
+    # PostgREST: 404 for the RPC's P0002, 409 for the survey foreign key, 400 for a malformed uuid,
+    # 402 for the response limit (PT402)
+    if e.status == 402:
+        raise QuotaExceeded(survey_id) from e
+    if e.status in (404, 409):
+        raise SurveyNotFound(survey_id) from e
+    if e.status == 400:
+        raise InvalidResponse(str(e)) from e
+    raise e
+
+
+class ResponseIngestor:
+    """Autosaved drafts and the submit path for survey responses.
+
+    A draft is an append-only log of small deltas (question id -> answer)
+    keyed by a respondent token, so each autosave writes one small row no
+    matter how long the survey is. Submitting merges the log with the final
+    answers and inserts the response as one row inside the database
+    (submit_survey_response), instead of the browser reading and writing
+    back the survey's whole responses array. The same transaction enforces
+    the plan's response limit with a per-survey counter (QuotaExceeded).
+
+    Submits that come with a client fingerprint are screened first
+    (response_screening); suspicious ones are held in the quarantine table
+    until the survey owner releases or discards them. The respondent gets
+    the same reply either way, without a position.
+
+    Callables in `after_submit` run on one background thread with
+    (survey_id, responses, position): the survey's new responses that
+    queued up since its last call, ending at 1-based `position`. Surveys
+    take turns; a burst of submits to one survey becomes one call. At
+    most `max_pending` responses wait, the rest are dropped for the hooks
+    (their analytics catch up on the next full update).
+    """
+
+    def __init__(self, client=None, screen=None, max_pending=DEFAULT_MAX_PENDING):
+        self._client = client
+        self._screen = screen
+        self.after_submit = []
+        self.max_pending = max_pending
+        self.dropped = 0
+        # survey id -> {position: response}, oldest survey first
+        self._pending = OrderedDict()
+        self._pending_count = 0
+        self._busy = False
+        self._changed = threading.Condition()
+        self._worker = None
+
+    @property
+    def client(self):
+        return self._client or get_client()
+
+    @property
+    def screen(self):
+        return self._screen or get_response_screen()
+
+    def save_draft(self, survey_id, token, seq, answers):
+        """Append one delta to the respondent's draft; retries with the same seq are ignored.
+
+        Without a token a new one is issued and its first delta is stored
+        even when empty: the form asks for a token when it opens, and
+        submits measure their completion time from that row.
+        """
+        issued = not token
+        token = check_token(token) if token else new_token()
+        if not isinstance(seq, int) or isinstance(seq, bool) or seq < 0:
+            raise InvalidResponse("seq must be a non-negative integer")
+        check_answers(answers)
+        if answers or issued:
+            if self.screen is not None:
+                self.screen.draft_started(token)
+            try:
+                self.client.insert(
+                    'response_draft_deltas',
+                    {'token': token, 'survey_id': survey_id, 'seq': seq, 'delta': answers},
+                    on_conflict='token,seq', ignore_duplicates=True,
+                )
+            except SupabaseError as e:
+                _raise_for(e, survey_id)
+        return {'token': token, 'seq': seq}
+
+    def load_draft(self, survey_id, token):
+        """Current answers of a draft, for resuming in a new tab or device."""
+        check_token(token)
+        filters = {'token': f"eq.{token}", 'survey_id': f"eq.{survey_id}"}
+        try:
+            rows = self.client.select('response_draft_deltas', 'seq,delta', filters, order='seq.asc')
+            submitted = not rows and bool(self.client.select('response_drafts_submitted', 'token', filters, limit=1))
+        except SupabaseError as e:
+            _raise_for(e, survey_id)
+        answers = {}
+        for row in rows:
+            answers.update(row['delta'])
+        return {
+            'token': token,
+            'answers': answers,
+            'seq': rows[-1]['seq'] if rows else -1,
+            'submitted': submitted,
+        }
+
+    def submit(self, survey_id, token=None, answers=None, fingerprint=None, elapsed_ms=None):
+        """Merge the draft with `answers` and append the response; safe to retry with the same token.
+
+        `fingerprint` (client_fingerprint) and the client-reported
+        `elapsed_ms` feed the screening; without a fingerprint the submit
+        is not screened. Neither is a retry of a token that was already
+        accepted, whichever worker accepted it.
+        """
+        if token:
+            check_token(token)
+        check_answers(answers or {})
+        screen = self.screen if fingerprint else None
+        if screen is not None:
+            submitted, started = self._draft_state(survey_id, token) if token else (False, None)
+            if not submitted:
+                verdict = screen.screen(survey_id, answers or {}, fingerprint, token, elapsed_ms, started=started)
+                if verdict.reasons:
+                    return self._quarantine(survey_id, token, answers or {}, verdict)
+        try:
+            result = self.client.rpc('submit_survey_response', {
+                'p_survey_id': survey_id, 'p_token': token, 'p_answers': answers or {},
+            })
+        except SupabaseError as e:
+            _raise_for(e, survey_id)
+        return self._accepted(survey_id, result)
+
+    def _draft_state(self, survey_id, token):
+        """Whether the token was already submitted, and when its draft was started (epoch seconds)."""
+        filters = {'token': f"eq.{token}", 'survey_id': f"eq.{survey_id}"}
+        try:
+            if self.client.select('response_drafts_submitted', 'token', filters, limit=1):
+                return True, None
+            rows = self.client.select('response_draft_deltas', 'created_at', filters, order='id.asc', limit=1)
+        except SupabaseError as e:
+            _raise_for(e, survey_id)
+        started = rows[0]['created_at'] if rows else None
+        return False, datetime.fromisoformat(started).timestamp() if started else None
+
+    def _accepted(self, survey_id, result):
+        if not result['duplicate'] and self.after_submit:
+            self._enqueue(survey_id, result['position'], {'answers': result['answers']})
+        return {'submitted': True, 'position': result['position'], 'duplicate': result['duplicate']}
+
+    def _quarantine(self, survey_id, token, answers, verdict):
+        elapsed_ms = round(verdict.elapsed * 1000) if verdict.elapsed is not None else None
+        try:
+            self.client.insert(QUARANTINE_TABLE, {
+                'survey_id': survey_id, 'token': token, 'answers': answers, 'reasons': verdict.reasons,
+                'fingerprint': verdict.fingerprint, 'elapsed_ms': elapsed_ms,
+            }, on_conflict='survey_id,token', ignore_duplicates=True)
+        except SupabaseError as e:
+            _raise_for(e, survey_id)
+        logger.info("Response quarantined", extra={
+            'survey_id': survey_id, 'reasons': verdict.reasons, 'fingerprint': verdict.fingerprint,
+        })
+        return {'submitted': True, 'position': None, 'duplicate': False}
+
+    def quarantined(self, client, survey_id, limit=None, cursor=None):
+        """Held responses of a survey, newest first, read with the owner's `client` (RLS)."""
+        try:
+            limit = max(1, min(int(limit), MAX_QUARANTINE_PAGE)) if limit else DEFAULT_QUARANTINE_PAGE
+        except (TypeError, ValueError) as e:
+            raise InvalidResponse("limit must be a number") from e
+        filters = {'survey_id': f"eq.{survey_id}"}
+        if cursor:
+            if not str(cursor).isdigit():
+                raise InvalidResponse("Invalid cursor")
+            filters['id'] = f"lt.{cursor}"
+        try:
+            rows = client.select(QUARANTINE_TABLE, 'id,answers,reasons,fingerprint,elapsed_ms,created_at',
+                                 filters, order='id.desc', limit=limit + 1) or []
+        except SupabaseError as e:
+            _raise_for(e, survey_id)
+        return {
+            'responses': [
+                {'id': row['id'], 'answers': row['answers'], 'reasons': row['reasons'],
+                 'fingerprint': row['fingerprint'], 'elapsedMs': row['elapsed_ms'], 'createdAt': row['created_at']}
+                for row in rows[:limit]
+            ],
+            'nextCursor': str(rows[limit - 1]['id']) if len(rows) > limit else None,
+        }
+
+    def release(self, client, survey_id, quarantine_id):
+        """Submit a held response as the owner (`client`); the plan's response limit applies."""
+        try:
+            result = client.rpc('release_quarantined_response', {'p_survey_id': survey_id, 'p_id': quarantine_id})
+        except SupabaseError as e:
+            _raise_for(e, survey_id)
+        return self._accepted(survey_id, result)
+
+    def discard(self, client, survey_id, quarantine_id):
+        try:
+            client.rpc('discard_quarantined_response', {'p_survey_id': survey_id, 'p_id': quarantine_id})
+        except SupabaseError as e:
+            _raise_for(e, survey_id)
+        return {'discarded': True}
+
+    def _enqueue(self, survey_id, position, response):
+        with self._changed:
+            if self._pending_count >= self.max_pending:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    logger.warning("Response ingestion hooks behind; dropping", extra={'dropped': self.dropped})
+                return
+            self._pending.setdefault(survey_id, {})[position] = response
+            self._pending_count += 1
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._drain, name='ingest-hooks', daemon=True)
+                self._worker.start()
+            self._changed.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until the hooks have seen every queued response; returns False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def _drain(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._pending)
+                survey_id, responses = self._pending.popitem(last=False)
+                self._pending_count -= len(responses)
+                self._busy = True
+            try:
+                for position, batch in _contiguous(responses):
+                    for hook in self.after_submit:
+                        self._run_hook(hook, survey_id, batch, position)
+            finally:
+                with self._changed:
+                    self._busy = False
+                    self._changed.notify_all()
+
+    @staticmethod
+    def _run_hook(hook, survey_id, responses, position):
+        try:
+            hook(survey_id, responses, position)
+        except Exception:
+            logger.exception("Response ingestion hook failed", extra={'survey_id': survey_id})
+
+
+def _contiguous(responses):
+    """Split {position: response} into runs of consecutive positions: (last position, responses)."""
+    run, last = [], None
+    for position in sorted(responses):
+        if run and position != last + 1:
+            yield last, run
+            run = []
+        run.append(responses[position])
+        last = position
+    if run:
+        yield last, run
+
+
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def get_ingestor():
+    global _ingestor
+    with _ingestor_lock:
+        if _ingestor is None:
+            _ingestor = ResponseIngestor(max_pending=int(os.environ.get('INGEST_MAX_PENDING', DEFAULT_MAX_PENDING)))
+        return _ingestor
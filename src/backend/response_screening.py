@@ -0,0 +1,345 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict, namedtuple
+
+import numpy as np
+
+# Quarantine reasons
+RATE = 'rate'
+DUPLICATE = 'duplicate'
+TOO_FAST = 'too_fast'
+
+DEFAULT_RATE_WINDOW = 60.0
+# Submits per client fingerprint and survey within the window; a class or an
+# office behind one NAT address with identical browsers shares a fingerprint
+DEFAULT_RATE_LIMIT = 20
+# The same client sending the same answers again within this long is a repeat
+REPEAT_WINDOW = 3600.0
+# SimHash bits that may differ for two responses to count as near-duplicates
+DEFAULT_MAX_DISTANCE = 3
+# Near-duplicates are only looked for in responses with this much free text:
+# identical multiple-choice answers from different people are normal
+MIN_TEXT_TOKENS = 8
+# Recent signatures kept per survey, and surveys tracked
+RECENT_PER_SURVEY = 512
+MAX_SURVEYS = 2000
+# Draft tokens remembered (start time, already screened)
+MAX_TOKENS = 100000
+DEFAULT_SECONDS_PER_ANSWER = 1.0
+# Set by the edge proxy, not by the client
+CLIENT_ADDRESS_HEADERS = ('X-Vercel-Forwarded-For', 'X-Real-IP')
+
+WORD = re.compile(r'\w+')
+# Set bits of every byte value, for popcounts over uint64 arrays viewed as bytes
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+Verdict = namedtuple('Verdict', 'reasons fingerprint elapsed')
+
+
+MASK64 = (1 << 64) - 1
+
+
+def hash64(value):
+    # Only compared within this process, so the built-in (per-process salted) string hash will do
+    return hash(value) & MASK64
+
+
+def client_fingerprint(address, user_agent=None, accept_language=None):
+    """Stable, non-reversible id of a client: address, browser and language."""
+    raw = '\n'.join((address or '', user_agent or '', accept_language or ''))
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def trusted_proxies():
+    """Addresses of our own proxies in X-Forwarded-For (TRUSTED_PROXIES, comma separated)."""
+    return frozenset(a.strip() for a in os.environ.get('TRUSTED_PROXIES', '').split(',') if a.strip())
+
+
+def client_address(headers, remote_addr=None, proxies=()):
+    """The address our own proxy saw the request come from.
+
+    Vercel's x-vercel-forwarded-for and x-real-ip are set by the edge,
+    which overwrites what the client sent. X-Forwarded-For is appended to
+    by every hop, so only its rightmost entries are trustworthy: the
+    client is the rightmost one that is not one of our `proxies`.
+    """
+    for name in CLIENT_ADDRESS_HEADERS:
+        address = (headers.get(name) or '').split(',')[0].strip()
+        if address:
+            return address
+    for address in reversed((headers.get('X-Forwarded-For') or '').split(',')):
+        address = address.strip()
+        if address and address not in proxies:
+            return address
+    return remote_addr
+
+
+def request_fingerprint(headers, remote_addr=None):
+    """client_fingerprint of an HTTP request (client_address, User-Agent, Accept-Language)."""
+    return client_fingerprint(client_address(headers, remote_addr, trusted_proxies()),
+                              headers.get('User-Agent'), headers.get('Accept-Language'))
+
+
+def answer_features(answers):
+    """Hashed features of a response and how many free-text words it has."""
+    features, words = [], 0
+    for question_id, answer in answers.items():
+        if isinstance(answer, str):
+            tokens = WORD.findall(answer.lower())
+            words += len(tokens)
+            features += [f"{question_id}:{token}" for token in tokens] or [f"{question_id}:"]
+        else:
+            features.append(f"{question_id}={json.dumps(answer, sort_keys=True)}")
+    return np.array([hash(feature) for feature in features], dtype=np.int64).view(np.uint64), words
+
+
+def simhash(hashes):
+    """64-bit SimHash: each bit is set if most features have it set."""
+    if not len(hashes):
+        return np.uint64(0)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    votes = bits.sum(axis=0, dtype=np.int32) * 2 > len(hashes)
+    return np.packbits(votes, bitorder='little').view(np.uint64)[0]
+
+
+class WindowCounter:
+    """Approximate event counts per key over a sliding window, in fixed memory.
+
+    Counts go into a count-min sketch (`depth` rows of `width` counters)
+    per fixed window; the current window's count plus the previous
+    window's, weighted by how much of it is still inside the sliding
+    window, estimates the sliding count. Estimates never undercount; they
+    overcount only when keys collide in every row.
+    """
+
+    def __init__(self, window, width=1 << 16, depth=4):
+        self.window = window
+        self.width = width
+        self.depth = depth
+        self._current = array('I', bytes(4 * width * depth))
+        self._previous = array('I', bytes(4 * width * depth))
+        self._started = None
+
+    def _slots(self, key):
+        h = hash64(key)
+        step = (h >> 32) | 1
+        # Double hashing: row i uses h + i * step
+        return [row * self.width + (h + row * step) % self.width for row in range(self.depth)]
+
+    def _advance(self, now):
+        start = now - now % self.window
+        if self._started is None:
+            self._started = start
+        elif start > self._started:
+            if start - self._started == self.window:
+                self._previous = self._current
+            else:
+                self._previous = array('I', bytes(4 * self.width * self.depth))
+            self._current = array('I', bytes(4 * self.width * self.depth))
+            self._started = start
+
+    def add(self, key, now):
+        """Count one event for `key`; returns the estimated count in the sliding window."""
+        self._advance(now)
+        current, previous = self._current, self._previous
+        slots = self._slots(key)
+        for slot in slots:
+            current[slot] += 1
+        overlap = 1.0 - (now - self._started) / self.window
+        return min(current[slot] for slot in slots) + overlap * min(previous[slot] for slot in slots)
+
+
+class WindowFilter:
+    """Whether a key was seen within the last one to two windows, in fixed memory.
+
+    One Bloom filter (`bits` bits, `hashes` probes) per fixed window; a
+    key is seen if it is in the current or the previous window's filter.
+    Never misses a key it was given; with 2^22 bits and 200,000 keys per
+    window about one unseen key in a thousand is reported as seen.
+    """
+
+    def __init__(self, window, bits=1 << 22, hashes=4):
+        self.window = window
+        self.bits = bits
+        self.hashes = hashes
+        self._current = bytearray(bits // 8)
+        self._previous = bytearray(bits // 8)
+        self._started = None
+
+    def _advance(self, now):
+        start = now - now % self.window
+        if self._started is None:
+            self._started = start
+        elif start > self._started:
+            self._previous = self._current if start - self._started == self.window else bytearray(self.bits // 8)
+            self._current = bytearray(self.bits // 8)
+            self._started = start
+
+    def add(self, key, now):
+        """Add `key`; returns whether it was already seen."""
+        self._advance(now)
+        h = hash64(key)
+        step = (h >> 32) | 1
+        seen_current = seen_previous = True
+        for i in range(self.hashes):
+            bit = (h + i * step) % self.bits
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            seen_current = seen_current and bool(self._current[byte] & mask)
+            seen_previous = seen_previous and bool(self._previous[byte] & mask)
+            self._current[byte] |= mask
+        return seen_current or seen_previous
+
+
+class RecentSignatures:
+    """SimHash signatures of each survey's latest responses, in ring buffers.
+
+    At most `max_surveys` surveys are tracked; the least recently active
+    one is forgotten first.
+    """
+
+    def __init__(self, per_survey=RECENT_PER_SURVEY, max_surveys=MAX_SURVEYS):
+        self.per_survey = per_survey
+        self.max_surveys = max_surveys
+        self._surveys = OrderedDict()
+
+    def nearest(self, survey_id, signature):
+        """Smallest Hamming distance to a recent signature of the survey (64 if none)."""
+        entry = self._surveys.get(survey_id)
+        if entry is None or not entry[1]:
+            return 64
+        ring, count = entry
+        distances = POPCOUNT[(ring[:min(count, self.per_survey)] ^ signature).view(np.uint8)]
+        return int(distances.reshape(-1, 8).sum(axis=1).min())
+
+    def add(self, survey_id, signature):
+        entry = self._surveys.pop(survey_id, None)
+        if entry is None:
+            entry = [np.zeros(self.per_survey, dtype=np.uint64), 0]
+            if len(self._surveys) >= self.max_surveys:
+                self._surveys.popitem(last=False)
+        entry[0][entry[1] % self.per_survey] = signature
+        entry[1] += 1
+        self._surveys[survey_id] = entry
+
+
+class ResponseScreen:
+    """Streaming checks on submitted responses, in bounded memory.
+
+    A submit is suspicious when its client fingerprint sends more than
+    `rate_limit` responses to the survey within `rate_window` seconds,
+    when the same client repeats the same answers, when its free text is
+    a near-duplicate (SimHash within `max_distance` bits) of a recent
+    response to the survey, or when it was completed faster than
+    `seconds_per_answer` per answer. Completion time is measured on the
+    server from the draft's first row, stored when the form issued its
+    respondent token (`started`, or when this process saw it); the
+    client's elapsedMs can only shorten it. Without either the time is
+    unknown and does not count as too fast.
+
+    Memory is fixed by the sketch and filter sizes, RECENT_PER_SURVEY x
+    MAX_SURVEYS signatures and MAX_TOKENS draft tokens; each worker
+    process screens the submits it serves.
+    """
+
+    def __init__(self, rate_limit=DEFAULT_RATE_LIMIT, rate_window=DEFAULT_RATE_WINDOW,
+                 max_distance=DEFAULT_MAX_DISTANCE, seconds_per_answer=DEFAULT_SECONDS_PER_ANSWER):
+        self.rate_limit = rate_limit
+        self.max_distance = max_distance
+        self.seconds_per_answer = seconds_per_answer
+        self._rates = WindowCounter(rate_window)
+        self._repeats = WindowFilter(REPEAT_WINDOW)
+        self._recent = RecentSignatures()
+        self._started = OrderedDict()
+        self._screened_tokens = OrderedDict()
+        self._lock = threading.Lock()
+        self.screened = 0
+        self.flagged = Counter()
+
+    def draft_started(self, token, now=None):
+        """Note when a respondent's draft was started."""
+        with self._lock:
+            if token not in self._started:
+                self._started[token] = time.time() if now is None else now
+                if len(self._started) > MAX_TOKENS:
+                    self._started.popitem(last=False)
+
+    def screen(self, survey_id, answers, fingerprint, token=None, elapsed_ms=None, now=None, started=None):
+        """Check one submit; Verdict.reasons is empty when it looks genuine.
+
+        `started` is when the draft's first row was stored, if known.
+        """
+        now = time.time() if now is None else now
+        hashes, words = answer_features(answers)
+        signature = simhash(hashes)
+        exact = hashlib.blake2b(np.sort(hashes).tobytes(), digest_size=8).hexdigest()
+        reasons = []
+        with self._lock:
+            if token in self._screened_tokens:
+                # A retried submit of a draft gets the first verdict; the database ignores the repeat
+                return self._screened_tokens[token]
+            seen = self._started.pop(token, None) if token else None
+            if seen is not None:
+                started = seen if started is None else min(started, seen)
+            if self._rates.add(f"{survey_id}:{fingerprint}", now) > self.rate_limit:
+                reasons.append(RATE)
+            repeated = self._repeats.add(f"{survey_id}:{fingerprint}:{exact}", now)
+            if repeated or (words >= MIN_TEXT_TOKENS
+                            and self._recent.nearest(survey_id, signature) <= self.max_distance):
+                reasons.append(DUPLICATE)
+            if words >= MIN_TEXT_TOKENS:
+                self._recent.add(survey_id, signature)
+
+            elapsed = now - started if started is not None else None
+            if isinstance(elapsed_ms, (int, float)) and not isinstance(elapsed_ms, bool):
+                elapsed = elapsed_ms / 1000.0 if elapsed is None else min(elapsed, elapsed_ms / 1000.0)
+            if answers and elapsed is not None and elapsed < self.seconds_per_answer * len(answers):
+                reasons.append(TOO_FAST)
+
+            self.screened += 1
+            self.flagged.update(reasons)
+            verdict = Verdict(reasons, fingerprint, elapsed)
+            if token:
+                self._screened_tokens[token] = verdict
+                if len(self._screened_tokens) > MAX_TOKENS:
+                    self._screened_tokens.popitem(last=False)
+        return verdict
+
+    def metrics_text(self):
+        """Screening counters in the Prometheus text format."""
+        with self._lock:
+            screened, flagged = self.screened, dict(self.flagged)
+        lines = ["# TYPE formalyze_responses_screened_total counter",
+                 f"formalyze_responses_screened_total {screened}",
+                 "# TYPE formalyze_responses_flagged_total counter"]
+        lines += [f'formalyze_responses_flagged_total{{reason="{reason}"}} {flagged.get(reason, 0)}'
+                  for reason in (RATE, DUPLICATE, TOO_FAST)]
+        return '\n'.join(lines) + '\n'
+
+
+_screen = None
+_screen_lock = threading.Lock()
+
+
+def get_response_screen():
+    """Return the process-wide screen, or None with RESPONSE_SCREENING=0.
+
+    Thresholds: SCREEN_RATE_LIMIT per SCREEN_RATE_WINDOW seconds,
+    SCREEN_MAX_DISTANCE, SCREEN_SECONDS_PER_ANSWER.
+    """
+    global _screen
+    with _screen_lock:
+        if _screen is None:
+            if os.environ.get('RESPONSE_SCREENING') == '0':
+                return None
+            _screen = ResponseScreen(
+                rate_limit=int(os.environ.get('SCREEN_RATE_LIMIT', DEFAULT_RATE_LIMIT)),
+                rate_window=float(os.environ.get('SCREEN_RATE_WINDOW', DEFAULT_RATE_WINDOW)),
+                max_distance=int(os.environ.get('SCREEN_MAX_DISTANCE', DEFAULT_MAX_DISTANCE)),
+                seconds_per_answer=float(os.environ.get('SCREEN_SECONDS_PER_ANSWER', DEFAULT_SECONDS_PER_ANSWER)),
+            )
+        return _screen
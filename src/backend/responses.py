@@ -0,0 +1,64 @@
+import json
+from http import HTTPStatus
+from types import MappingProxyType
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+# Header sets shared by every response; never mutated after import
+JSON_HEADERS = MappingProxyType({
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+})
+
+CORS_PREFLIGHT_HEADERS = MappingProxyType({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, x-session-id, Idempotency-Key',
+})
+
+API_HEADERS = MappingProxyType({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, x-respondent-token, Idempotency-Key',
+    'Content-Type': 'application/json',
+})
+
+
+def json_body(payload):
+    """Serialize `payload` to UTF-8 JSON bytes with the fastest available backend."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(status_code, payload, headers=JSON_HEADERS):
+    """Build a serverless (statusCode/body/headers) JSON response."""
+    return {
+        'statusCode': int(status_code),
+        'body': json_body(payload).decode('utf-8'),
+        'headers': dict(headers),
+    }
+
+
+def encode_header_block(headers):
+    """Pre-encode a header set as raw HTTP/1.x header lines."""
+    return ''.join(f"{key}: {value}\r\n" for key, value in headers.items()).encode('latin-1')
+
+
+API_HEADER_BLOCK = encode_header_block(API_HEADERS)
+
+
+def http_response_bytes(protocol_version, status_code, body, header_block=API_HEADER_BLOCK):
+    """Status line, headers and body as a single buffer for one socket write."""
+    status = HTTPStatus(status_code)
+    return b''.join((
+        f"{protocol_version} {status.value} {status.phrase}\r\n".encode('latin-1'),
+        header_block,
+        f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1'),
+        body,
+    ))
@@ -0,0 +1,218 @@
+import json
+import os
+import pickle
+import sys
+import types
+import zlib
+
+# Agent attributes by what they hold; anything else is counted as 'other'
+TRANSCRIPT_ATTRIBUTES = ('history', 'conversation_history', 'messages', 'transcript')
+REQUIREMENT_ATTRIBUTES = ('requirements', 'survey_requirements')
+GRAPH_ATTRIBUTES = ('state', 'graph_state', 'graph', 'workflow', 'memory', 'checkpointer', 'config')
+
+# Objects shared by every session (code, classes, modules) are not part of a session's cost
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+GB = 1024 ** 3
+# Sessions measured by store_memory; deep sizing walks every object, so it is not free
+DEFAULT_SAMPLE = 200
+
+
+def deep_size(obj, seen=None):
+    """Bytes reachable from `obj`, counting each object once (shared `seen` set across calls)."""
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+            continue
+        else:
+            if hasattr(obj, '__dict__'):
+                stack.append(vars(obj))
+            for cls in type(obj).__mro__:
+                for slot in getattr(cls, '__slots__', ()):
+                    if hasattr(obj, slot):
+                        stack.append(getattr(obj, slot))
+    return size
+
+
+CATEGORIES = ('transcript', 'requirements', 'graphState', 'other')
+
+
+def _category(name):
+    if name in TRANSCRIPT_ATTRIBUTES:
+        return 'transcript'
+    if name in REQUIREMENT_ATTRIBUTES:
+        return 'requirements'
+    if name in GRAPH_ATTRIBUTES:
+        return 'graphState'
+    return 'other'
+
+
+def session_memory(agent):
+    """Deep size of one session's agent, broken down by transcript, requirements and graph state.
+
+    An object reachable from several attributes is counted once, in the
+    first of CATEGORIES that reaches it. pickledBytes is what the SQLite
+    session store holds for the session.
+    """
+    # Recording and metering proxies keep the real agent in .agent
+    inner = vars(agent).get('agent', agent)
+    seen = {id(inner), id(vars(inner))}
+    sizes = dict.fromkeys(CATEGORIES, 0)
+    sizes['other'] = sys.getsizeof(inner) + sys.getsizeof(vars(inner))
+    for name, value in sorted(vars(inner).items(), key=lambda item: CATEGORIES.index(_category(item[0]))):
+        sizes[_category(name)] += deep_size(name, seen) + deep_size(value, seen)
+    if inner is not agent:
+        sizes['other'] += deep_size(agent, seen)
+    try:
+        pickled = len(pickle.dumps(agent, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        pickled = None
+    report = {'totalBytes': sum(sizes.values())}
+    report.update((f"{category}Bytes", size) for category, size in sizes.items())
+    report['pickledBytes'] = pickled
+    return report
+
+
+def store_memory(store, sample=DEFAULT_SAMPLE):
+    """Average size of a session store's agents, measured on the `sample` most recent ones."""
+    sessions = [session_memory(agent) for _, agent in store.agents(sample)]
+    count = store.count()
+    report = {'sessions': count, 'measured': len(sessions)}
+    for key in ['totalBytes'] + [f"{category}Bytes" for category in CATEGORIES] + ['pickledBytes']:
+        values = [s[key] for s in sessions if s[key] is not None]
+        report[f"avg{key[0].upper()}{key[1:]}"] = round(sum(values) / len(values)) if values else 0
+    report['estimatedTotalBytes'] = report['avgTotalBytes'] * count
+    report['sessionsPerGb'] = GB // report['avgTotalBytes'] if report['avgTotalBytes'] else None
+    return report
+
+
+class Message:
+    """One transcript message; slotted, with the role interned."""
+
+    __slots__ = ('role', 'content')
+
+    def __init__(self, role, content):
+        self.role = sys.intern(str(role))
+        self.content = content
+
+    def to_dict(self):
+        return {'role': self.role, 'content': self.content}
+
+
+def _as_message(message):
+    if isinstance(message, Message):
+        return message
+    if isinstance(message, dict) and set(message) <= {'role', 'content'}:
+        return Message(message.get('role'), message.get('content'))
+    return message
+
+
+class CompactTranscript:
+    """List of chat messages that keeps recent turns as slotted records and older ones compressed.
+
+    Appending past `keep_recent` messages packs the oldest `chunk_size`
+    into one zlib-compressed block. Iterating and indexing yield plain
+    {'role', 'content'} dicts, so it stands in for the list of message
+    dicts an agent keeps (messages of another shape are stored as is).
+    """
+
+    __slots__ = ('keep_recent', 'chunk_size', '_chunks', '_chunk_lengths', '_recent')
+
+    def __init__(self, messages=(), keep_recent=8, chunk_size=16):
+        self.keep_recent = keep_recent
+        self.chunk_size = chunk_size
+        self._chunks = []
+        self._chunk_lengths = []
+        self._recent = []
+        for message in messages:
+            self.append(message)
+
+    def append(self, message):
+        self._recent.append(_as_message(message))
+        if len(self._recent) >= self.keep_recent + self.chunk_size:
+            self._pack()
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def _pack(self):
+        old, self._recent = self._recent[:self.chunk_size], self._recent[self.chunk_size:]
+        data = json.dumps([m.to_dict() if isinstance(m, Message) else m for m in old],
+                          ensure_ascii=False, separators=(',', ':'), default=str)
+        self._chunks.append(zlib.compress(data.encode('utf-8')))
+        self._chunk_lengths.append(len(old))
+
+    def _unpacked(self):
+        for chunk in self._chunks:
+            yield from json.loads(zlib.decompress(chunk))
+        for message in self._recent:
+            yield message.to_dict() if isinstance(message, Message) else message
+
+    def __len__(self):
+        return sum(self._chunk_lengths) + len(self._recent)
+
+    def __iter__(self):
+        return self._unpacked()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self._unpacked())[index]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("transcript index out of range")
+        packed = sum(self._chunk_lengths)
+        if index >= packed:
+            message = self._recent[index - packed]
+            return message.to_dict() if isinstance(message, Message) else message
+        for chunk, count in zip(self._chunks, self._chunk_lengths):
+            if index < count:
+                return json.loads(zlib.decompress(chunk))[index]
+            index -= count
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"CompactTranscript({len(self)} messages, {len(self._chunks)} packed chunks)"
+
+
+def compact_transcripts(agent, keep_recent=8, chunk_size=16):
+    """Replace the agent's transcript lists with CompactTranscripts; returns the agent."""
+    if agent is None:
+        return None
+    inner = vars(agent).get('agent', agent)
+    for name in TRANSCRIPT_ATTRIBUTES:
+        value = vars(inner).get(name)
+        if isinstance(value, list):
+            setattr(inner, name, CompactTranscript(value, keep_recent, chunk_size))
+    return agent
+
+
+def maybe_compact(agent):
+    """Compact the agent's transcripts when TRANSCRIPT_MODE=compact (default 'list').
+
+    Called whenever a session is saved, so a transcript the agent replaced
+    with a fresh list (e.g. on restart) is compacted again.
+    """
+    if os.environ.get('TRANSCRIPT_MODE', 'list').lower() != 'compact':
+        return agent
+    return compact_transcripts(
+        agent,
+        keep_recent=int(os.environ.get('TRANSCRIPT_KEEP_RECENT', 8)),
+        chunk_size=int(os.environ.get('TRANSCRIPT_CHUNK_MESSAGES', 16)),
+    )
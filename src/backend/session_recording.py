@@ -0,0 +1,268 @@
+import atexit
+import glob
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+try:
+    from .storage import get_data_dir
+    from .structured_logging import get_logger
+except ImportError:
+    from storage import get_data_dir
+    from structured_logging import get_logger
+
+logger = get_logger('session_recording')
+
+TRACE_VERSION = 1
+
+# Agent methods that make up a conversation; everything else is passed through
+RECORDED_METHODS = ('start_conversation', 'process_response', 'generate_survey_questions', 'write_question_alternatives')
+
+# Buffered turns are written as one gzip member when either limit is reached
+FLUSH_TURNS = 64
+FLUSH_SECONDS = 30.0
+
+REDACTIONS = (
+    (re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+'), '<email>'),
+    (re.compile(r'\b(?:sk|pk|rk)-[A-Za-z0-9_-]{16,}\b'), '<secret>'),
+    (re.compile(r'\beyJ[A-Za-z0-9_-]{10,}\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+'), '<jwt>'),
+    (re.compile(r'https?://\S+'), '<url>'),
+    (re.compile(r'\+?\d[\d ()-]{7,}\d'), '<number>'),
+)
+
+
+def redact(value):
+    """Replace personal data and credentials in every string inside `value`."""
+    if isinstance(value, str):
+        for pattern, placeholder in REDACTIONS:
+            value = pattern.sub(placeholder, value)
+        return value
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def session_key(session_id):
+    # Traces never contain the session id the client sent
+    return hashlib.sha256(str(session_id).encode('utf-8')).hexdigest()[:16]
+
+
+def message_content(message):
+    """Plain role/content of a chat message, a (role, content) tuple or a string prompt."""
+    if isinstance(message, str):
+        return {'role': 'user', 'content': message}
+    if isinstance(message, (list, tuple)) and len(message) == 2:
+        return {'role': str(message[0]), 'content': message[1]}
+    if isinstance(message, dict):
+        return {'role': message.get('role'), 'content': message.get('content')}
+    return {'role': getattr(message, 'type', type(message).__name__), 'content': getattr(message, 'content', str(message))}
+
+
+def model_request(messages):
+    if isinstance(messages, (list, tuple)) and not (len(messages) == 2 and isinstance(messages[0], str)):
+        return [message_content(message) for message in messages]
+    return [message_content(messages)]
+
+
+_turn = threading.local()
+
+
+class RecordingModel:
+    """Wraps a chat model's invoke() and notes each request and response in the current turn."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def invoke(self, messages, *args, **kwargs):
+        started = time.perf_counter()
+        result = self.model.invoke(messages, *args, **kwargs)
+        calls = getattr(_turn, 'calls', None)
+        if calls is not None:
+            calls.append({
+                'req': model_request(messages),
+                'res': getattr(result, 'content', result),
+                'ms': round((time.perf_counter() - started) * 1000, 2),
+            })
+        return result
+
+    def __getattr__(self, name):
+        # Unpickling looks up attributes before 'model' is set; don't recurse into it
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+def model_attributes(agent):
+    """Names of the agent's attributes holding a chat model (anything with invoke())."""
+    return [
+        name for name, value in vars(agent).items()
+        if not isinstance(value, type) and callable(getattr(value, 'invoke', None))
+    ]
+
+
+class RecordingAgent:
+    """Survey agent proxy that writes each turn to the session trace.
+
+    A turn is one agent call: its arguments, result, wall time and the
+    model requests/responses made during it, redacted. Model wrappers are
+    (re)installed before each turn, because agents restored from the
+    session store rebuild their model client.
+    """
+
+    def __init__(self, agent, session_id, writer=None):
+        self.agent = agent
+        self.session = session_key(session_id)
+        self.turns = 0
+        self._writer = writer
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_writer'] = None
+        return state
+
+    def __getattr__(self, name):
+        if name == 'agent':
+            raise AttributeError(name)
+        return getattr(self.agent, name)
+
+    def _instrument(self):
+        for name in model_attributes(self.agent):
+            model = getattr(self.agent, name)
+            if not isinstance(model, RecordingModel):
+                setattr(self.agent, name, RecordingModel(model))
+
+    def _record(self, method, args, kwargs):
+        self._instrument()
+        _turn.calls = calls = []
+        started = time.perf_counter()
+        try:
+            result = getattr(self.agent, method)(*args, **kwargs)
+        finally:
+            _turn.calls = None
+        elapsed = (time.perf_counter() - started) * 1000
+        turn = {
+            'v': TRACE_VERSION,
+            'session': self.session,
+            'turn': self.turns,
+            'agent': type(self.agent).__name__,
+            'op': method,
+            'args': redact(list(args)),
+            'kwargs': redact(kwargs),
+            'out': redact(list(result) if isinstance(result, tuple) else result),
+            'ms': round(elapsed, 2),
+            'modelMs': round(sum(call['ms'] for call in calls), 2),
+            'model': [redact(call) for call in calls],
+            'at': time.time(),
+        }
+        self.turns += 1
+        try:
+            (self._writer or get_trace_writer()).append(turn)
+        except Exception:
+            logger.exception("Failed to record session turn", extra={'session': self.session})
+        return result
+
+    def start_conversation(self, *args, **kwargs):
+        return self._record('start_conversation', args, kwargs)
+
+    def process_response(self, *args, **kwargs):
+        return self._record('process_response', args, kwargs)
+
+    def generate_survey_questions(self, *args, **kwargs):
+        return self._record('generate_survey_questions', args, kwargs)
+
+    def write_question_alternatives(self, *args, **kwargs):
+        return self._record('write_question_alternatives', args, kwargs)
+
+
+class TraceWriter:
+    """Appends turns to gzip-compressed JSON lines, one file per process and day.
+
+    Turns are buffered and written as a gzip member at a time, so a crash
+    loses at most the buffered turns and never corrupts earlier ones.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._buffer = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def path(self):
+        return os.path.join(self.directory, f"turns-{time.strftime('%Y%m%d')}-{os.getpid()}.jsonl.gz")
+
+    def append(self, turn):
+        line = json.dumps(turn, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._buffer.append(line)
+            self._oldest = self._oldest or time.monotonic()
+            if len(self._buffer) < FLUSH_TURNS and time.monotonic() - self._oldest < FLUSH_SECONDS:
+                return
+            self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        data = ('\n'.join(self._buffer) + '\n').encode('utf-8')
+        with open(self.path(), 'ab') as f:
+            f.write(gzip.compress(data))
+        self._buffer = []
+        self._oldest = None
+
+
+def read_traces(paths):
+    """Recorded sessions as {session: [turns in order]} from trace files or directories."""
+    files = []
+    for path in paths:
+        files += sorted(glob.glob(os.path.join(path, '*.jsonl.gz'))) if os.path.isdir(path) else [path]
+    sessions = {}
+    for path in files:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    turn = json.loads(line)
+                    sessions.setdefault(turn['session'], []).append(turn)
+    for turns in sessions.values():
+        turns.sort(key=lambda turn: turn['turn'])
+    return sessions
+
+
+def trace_dir():
+    return os.environ.get('SESSION_TRACE_DIR') or os.path.join(get_data_dir(), 'traces')
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_trace_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = TraceWriter(trace_dir())
+        return _writer
+
+
+def record_rate():
+    return float(os.environ.get('SESSION_RECORD_RATE', 0))
+
+
+def maybe_record(agent, session_id):
+    """Wrap a new session's agent in a RecordingAgent for SESSION_RECORD_RATE of sessions (default none)."""
+    rate = record_rate()
+    if rate <= 0 or random.random() >= rate:
+        return agent
+    return RecordingAgent(agent, session_id)
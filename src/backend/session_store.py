@@ -0,0 +1,208 @@
+import os
+import pickle
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    from .storage import connect
+except ImportError:
+    from storage import connect
+
+# Sessions idle for longer than this are removed
+DEFAULT_SESSION_TTL = 24 * 3600
+
+# How long a request waits for another request on the same session
+DEFAULT_LOCK_TIMEOUT = 30
+
+# A lock left by a worker that died is taken over after this long
+LOCK_LEASE_SECONDS = 300
+
+
+class SessionBusy(Exception):
+    """Raised when another request holds the session for longer than the lock timeout."""
+
+
+class _KeyedLocks:
+    """One lock per session id, dropped once nobody holds or waits for it."""
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key, timeout):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            if not entry[0].acquire(timeout=timeout):
+                raise SessionBusy(f"Session {key} is busy")
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+
+class MemorySessionStore:
+    """Agent instances held in this process, as the single-process server does."""
+
+    def __init__(self, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.lock_timeout = lock_timeout
+        self._agents = {}
+        self._lock = threading.Lock()
+        self._session_locks = _KeyedLocks()
+
+    def locked(self, session_id):
+        """Hold the session for a get -> change -> put, so concurrent requests don't lose each other's turns."""
+        return self._session_locks.hold(session_id, self.lock_timeout)
+
+    def get(self, session_id):
+        with self._lock:
+            return self._agents.get(session_id)
+
+    def put(self, session_id, agent):
+        with self._lock:
+            self._agents[session_id] = agent
+
+    def delete(self, session_id):
+        with self._lock:
+            self._agents.pop(session_id, None)
+
+    def agents(self, limit=None):
+        """(session id, agent) pairs held by this process, at most `limit`."""
+        with self._lock:
+            items = list(self._agents.items())
+        return items[:limit] if limit else items
+
+    def count(self):
+        with self._lock:
+            return len(self._agents)
+
+
+class SQLiteSessionStore:
+    """Agents pickled into a SQLite database in WAL mode.
+
+    Every worker process opens the same database, so any worker can continue
+    any conversation. Agents must be picklable; an agent holding a model
+    client should drop it in __getstate__ and rebuild it in __setstate__.
+    """
+
+    def __init__(self, db_name='sessions', ttl=DEFAULT_SESSION_TTL, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self._conn = connect(db_name)
+        self._lock = threading.Lock()
+        self._session_locks = _KeyedLocks()
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    state BLOB NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at)')
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_locks (
+                    id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - ttl,))
+
+    @contextmanager
+    def locked(self, session_id):
+        """Hold the session for a get -> change -> put, across every worker process.
+
+        Threads of this process queue on a local lock; the process then
+        takes a lease row that other processes poll for.
+        """
+        deadline = time.monotonic() + self.lock_timeout
+        with self._session_locks.hold(session_id, self.lock_timeout):
+            owner = uuid.uuid4().hex
+            while not self._acquire(session_id, owner):
+                if time.monotonic() >= deadline:
+                    raise SessionBusy(f"Session {session_id} is busy")
+                time.sleep(0.05)
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self._conn.execute("DELETE FROM session_locks WHERE id = ? AND owner = ?", (session_id, owner))
+
+    def _acquire(self, session_id, owner):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM session_locks WHERE id = ? AND expires_at < ?", (session_id, now))
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO session_locks (id, owner, expires_at) VALUES (?, ?, ?)",
+                (session_id, owner, now + LOCK_LEASE_SECONDS)
+            )
+            return cursor.rowcount == 1
+
+    def get(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, updated_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None or time.time() - row['updated_at'] > self.ttl:
+            return None
+        return pickle.loads(row['state'])
+
+    def put(self, session_id, agent):
+        state = pickle.dumps(agent, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (id, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (session_id, state, time.time())
+            )
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def agents(self, limit=None):
+        """(session id, agent) pairs of the most recently active sessions, at most `limit`."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, state FROM sessions WHERE updated_at >= ? ORDER BY updated_at DESC LIMIT ?",
+                (time.time() - self.ttl, limit or -1)
+            ).fetchall()
+        return [(row['id'], pickle.loads(row['state'])) for row in rows]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE updated_at >= ?", (time.time() - self.ttl,)
+            ).fetchone()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Return the process-wide session store selected by SESSION_BACKEND (memory|sqlite)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.environ.get('SESSION_BACKEND', 'memory').lower()
+            if backend == 'sqlite':
+                _store = SQLiteSessionStore(
+                    ttl=float(os.environ.get('SESSION_TTL', DEFAULT_SESSION_TTL)),
+                    lock_timeout=float(os.environ.get('SESSION_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)),
+                )
+            elif backend == 'memory':
+                _store = MemorySessionStore(lock_timeout=float(os.environ.get('SESSION_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)))
+            else:
+                raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+        return _store
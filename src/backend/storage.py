@@ -0,0 +1,30 @@
+import os
+import sqlite3
+import tempfile
+
+
+def get_data_dir():
+    """Directory holding the backend's local SQLite databases."""
+    data_dir = os.environ.get('FORMALYZE_DATA_DIR')
+    if not data_dir:
+        if os.environ.get('VERCEL'):
+            # Serverless functions can only write under /tmp
+            data_dir = os.path.join(tempfile.gettempdir(), 'formalyze')
+        else:
+            data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+
+def connect(name):
+    """Open (or create) the local database `name` in WAL mode.
+
+    The connection runs in autocommit mode and may be shared between
+    threads; callers are responsible for serializing access with a lock.
+    """
+    path = name if name == ':memory:' else os.path.join(get_data_dir(), f"{name}.db")
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
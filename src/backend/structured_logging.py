@@ -0,0 +1,171 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Keys whose values never reach the log output
+REDACTED_KEYS = frozenset({
+    'authorization', 'cookie', 'set-cookie', 'x-debug-profile',
+    'api_key', 'apikey', 'openai_api_key', 'password', 'token', 'secret',
+})
+
+DEFAULT_PAYLOAD_LIMIT = 512
+
+# Per-level fraction of records kept; levels not listed are always kept
+DEFAULT_SAMPLE_RATES = {logging.DEBUG: 0.1}
+
+_STANDARD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def redact(value, limit=DEFAULT_PAYLOAD_LIMIT, _depth=0):
+    """Return a copy of `value` with secrets masked and long strings truncated."""
+    if isinstance(value, bytes):
+        value = value[:limit + 1].decode('utf-8', errors='replace')
+    if isinstance(value, str):
+        if len(value) > limit:
+            return f"{value[:limit]}...<{len(value) - limit} more chars>"
+        return value
+    if _depth >= 4:
+        return '<nested>'
+    if isinstance(value, dict) or hasattr(value, 'items'):
+        return {
+            key: '<redacted>' if str(key).lower() in REDACTED_KEYS else redact(item, limit, _depth + 1)
+            for key, item in list(value.items())[:50]
+        }
+    if isinstance(value, (list, tuple)):
+        items = [redact(item, limit, _depth + 1) for item in value[:20]]
+        if len(value) > 20:
+            items.append(f"<{len(value) - 20} more items>")
+        return items
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; extra fields are redacted and truncated."""
+
+    def __init__(self, payload_limit=DEFAULT_PAYLOAD_LIMIT):
+        super().__init__()
+        self.payload_limit = payload_limit
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = redact(value, self.payload_limit)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a configurable fraction of records per level."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full.
+
+    Formatting is deferred to the listener thread; only the traceback, which
+    refers to live frames, is rendered on the calling thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sample_rates(spec):
+    """Parse LOG_SAMPLE_RATES, e.g. "DEBUG=0.05,INFO=0.5"."""
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for part in (spec or '').split(','):
+        level, _, rate = part.partition('=')
+        if level.strip() and rate.strip():
+            rates[logging.getLevelName(level.strip().upper())] = float(rate)
+    return rates
+
+
+_listener = None
+
+
+def configure(stream=None, level=None, sample_rates=None, payload_limit=None, queue_size=None):
+    """Install the queue-backed JSON handler on the `formalyze` logger."""
+    global _listener
+    root = logging.getLogger('formalyze')
+    if _listener is not None:
+        _listener.stop()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter(
+        payload_limit or int(os.environ.get('LOG_PAYLOAD_LIMIT', DEFAULT_PAYLOAD_LIMIT))
+    ))
+    log_queue = queue.Queue(queue_size or int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(
+        sample_rates if sample_rates is not None else parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES'))
+    ))
+
+    root.addHandler(handler)
+    root.setLevel(level or os.environ.get('LOG_LEVEL', 'INFO').upper())
+    root.propagate = False
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return handler
+
+
+def flush():
+    """Stop the listener thread after it has written every queued record."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(flush)
+
+
+def get_logger(name):
+    """Return a child of the `formalyze` logger, configuring it on first use."""
+    if _listener is None:
+        configure()
+    return logging.getLogger(f"formalyze.{name}")
+
+
+def log_duration(logger, message, started, **fields):
+    """Log `message` at INFO with the elapsed milliseconds since `started`."""
+    if logger.isEnabledFor(logging.INFO):
+        fields['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(message, extra=fields)
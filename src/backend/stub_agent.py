@@ -0,0 +1,123 @@
+import math
+import os
+import random
+import time
+
+try:
+    from .agent_streaming import current_stream, split_tokens
+    from .question_edits import template_writer
+    from .survey_templates import generate_template_survey
+except ImportError:
+    from agent_streaming import current_stream, split_tokens
+    from question_edits import template_writer
+    from survey_templates import generate_template_survey
+
+# Intake questions asked by the stub, one per requirement slot
+INTAKE_QUESTIONS = (
+    ('purpose', "What is the primary purpose of your survey?"),
+    ('target_audience', "Who is your target audience for this survey?"),
+    ('num_questions', "How many questions would you like the survey to include?"),
+    ('topics', "What specific topics or areas do you want to cover in your survey?"),
+    ('question_types', "What type of questions would be most helpful for your analysis?"),
+)
+
+
+def _burn(ms):
+    # Busy loop standing in for prompt building and response parsing
+    deadline = time.perf_counter() + ms / 1000.0
+    while time.perf_counter() < deadline:
+        pass
+
+
+def sample_latency_ms(median_ms, sigma):
+    """Log-normal latency: model APIs have a long right tail, not a bell curve."""
+    if sigma <= 0:
+        return median_ms
+    return median_ms * math.exp(random.gauss(0.0, sigma))
+
+
+class StubSurveyAgent:
+    """Drop-in stand-in for LangGraphSurveyAgent that never calls a model.
+
+    Used for load tests and local development (SURVEY_AGENT_STUB=1). Each
+    model call spends `cpu_ms` of CPU time and then sleeps for a log-normal
+    latency with the given median and sigma; survey generation, which
+    produces far more tokens, uses its own median. Intake replies are then
+    produced one word every `token_ms`, streamed when the turn has a
+    TurnStream (agent_streaming.py).
+    """
+
+    # Sessions stored before replies were paced
+    token_ms = 0.0
+
+    def __init__(self, api_key=None, model_latency_ms=None, cpu_ms=None,
+                 latency_sigma=None, generate_latency_ms=None, token_ms=None):
+        self.model_latency_ms = float(
+            model_latency_ms if model_latency_ms is not None else os.environ.get('STUB_MODEL_LATENCY_MS', 50)
+        )
+        self.cpu_ms = float(cpu_ms if cpu_ms is not None else os.environ.get('STUB_CPU_MS', 5))
+        self.latency_sigma = float(
+            latency_sigma if latency_sigma is not None else os.environ.get('STUB_LATENCY_SIGMA', 0)
+        )
+        self.generate_latency_ms = float(
+            generate_latency_ms if generate_latency_ms is not None
+            else os.environ.get('STUB_GENERATE_LATENCY_MS', self.model_latency_ms)
+        )
+        self.token_ms = float(token_ms if token_ms is not None else os.environ.get('STUB_TOKEN_MS', 0))
+        self.requirements = {}
+        self.history = []
+        self.step = 0
+
+    def _model_call(self, median_ms=None, reply=None):
+        _burn(self.cpu_ms)
+        median_ms = self.model_latency_ms if median_ms is None else median_ms
+        # A streaming turn's client can cancel while the model is still working
+        stream = current_stream.get()
+        sleep = time.sleep if stream is None else stream.sleep
+        sleep(sample_latency_ms(median_ms, self.latency_sigma) / 1000.0)
+        for token in split_tokens(reply):
+            if self.token_ms:
+                sleep(self.token_ms / 1000.0)
+            if stream is not None:
+                stream.emit(token)
+
+    def start_conversation(self):
+        self.requirements = {}
+        self.history = []
+        self.step = 0
+        question = INTAKE_QUESTIONS[0][1]
+        self.history.append({'role': 'assistant', 'content': question})
+        return question
+
+    def process_response(self, user_response):
+        step = self.step + 1
+        if step >= len(INTAKE_QUESTIONS):
+            question = "Thank you! I have everything I need to generate your survey."
+            is_complete = True
+        else:
+            question = INTAKE_QUESTIONS[step][1]
+            is_complete = False
+        # Like a model reply, a cancelled turn leaves the conversation as it was
+        self._model_call(reply=question)
+
+        self.history.append({'role': 'user', 'content': user_response})
+        if self.step < len(INTAKE_QUESTIONS):
+            self.requirements[INTAKE_QUESTIONS[self.step][0]] = user_response
+        self.step = step
+        self.history.append({'role': 'assistant', 'content': question})
+        return question, is_complete
+
+    def generate_survey_questions(self):
+        self._model_call(self.generate_latency_ms)
+        return generate_template_survey(self.requirements)
+
+    def write_question_alternatives(self, action, requirements, context, target, count, instruction=None):
+        # A single question is a much shorter completion than the whole survey
+        self._model_call()
+        return template_writer(action, requirements, context, target, count, instruction)
+
+    def get_survey_requirements(self):
+        return dict(self.requirements)
+
+    def get_conversation_history(self):
+        return list(self.history)
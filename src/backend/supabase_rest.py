@@ -0,0 +1,116 @@
+import base64
+import binascii
+import copy
+import json
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+class SupabaseError(Exception):
+    """Raised when a PostgREST request fails."""
+
+    def __init__(self, status, message):
+        super().__init__(f"Supabase request failed ({status}): {message}")
+        self.status = status
+
+
+class SupabaseRest:
+    """Minimal PostgREST client for the Supabase project used by the frontend.
+
+    Uses the service role key when configured so the backend is not bound by
+    the anonymous RLS policies; falls back to the anon key.
+    """
+
+    def __init__(self, url=None, key=None, timeout=10):
+        self.url = (url or os.environ.get('SUPABASE_URL') or os.environ.get('VITE_SUPABASE_URL') or '').rstrip('/')
+        self.key = (
+            key
+            or os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+            or os.environ.get('SUPABASE_ANON_KEY')
+            or os.environ.get('VITE_SUPABASE_ANON_KEY')
+        )
+        self.timeout = timeout
+        self.access_token = None
+        if not self.url or not self.key:
+            raise ValueError("SUPABASE_URL and a Supabase API key must be configured")
+
+    def _request(self, method, path, params=None, payload=None, headers=None, api='rest/v1'):
+        url = f"{self.url}/{api}/{path}"
+        if params:
+            url = f"{url}?{urllib.parse.urlencode(params)}"
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(url, data=data, method=method, headers={
+            'apikey': self.key,
+            'Authorization': f"Bearer {self.access_token or self.key}",
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+            **(headers or {}),
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            raise SupabaseError(e.code, e.read().decode('utf-8', errors='replace')) from e
+        return json.loads(body) if body else None
+
+    def as_user(self, access_token):
+        """Client that sends the caller's JWT, so row level security applies to them."""
+        client = copy.copy(self)
+        client.access_token = access_token
+        return client
+
+    def user(self, access_token):
+        """The Supabase Auth user the access token belongs to; SupabaseError (401) if it is not valid."""
+        return self.as_user(access_token)._request('GET', 'user', api='auth/v1')
+
+    def select(self, table, columns='*', filters=None, order=None, limit=None):
+        """SELECT rows; `filters` maps column -> PostgREST operator expression, e.g. 'eq.123'."""
+        params = {'select': columns, **(filters or {})}
+        if order:
+            params['order'] = order
+        if limit is not None:
+            params['limit'] = limit
+        return self._request('GET', table, params)
+
+    def insert(self, table, rows, upsert=False, returning=False, on_conflict=None, ignore_duplicates=False):
+        prefer = ['return=representation' if returning else 'return=minimal']
+        if ignore_duplicates:
+            prefer.append('resolution=ignore-duplicates')
+        elif upsert:
+            prefer.append('resolution=merge-duplicates')
+        params = {'on_conflict': on_conflict} if on_conflict else None
+        return self._request('POST', table, params=params, payload=rows, headers={'Prefer': ','.join(prefer)})
+
+    def update(self, table, values, filters):
+        return self._request('PATCH', table, params=filters, payload=values,
+                             headers={'Prefer': 'return=minimal'})
+
+    def rpc(self, function, args=None):
+        return self._request('POST', f"rpc/{function}", payload=args or {})
+
+
+def token_subject(access_token):
+    """The user id (`sub` claim) of a Supabase JWT, without checking its signature.
+
+    Only compare it with rows read through as_user(access_token): PostgREST
+    rejects that request if the token is not genuine.
+    """
+    try:
+        payload = access_token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    except (AttributeError, IndexError, ValueError, binascii.Error):
+        return None
+    return claims.get('sub') if isinstance(claims, dict) else None
+
+
+_client = None
+
+
+def get_client():
+    """Return the process-wide client, configured from the environment."""
+    global _client
+    if _client is None:
+        _client = SupabaseRest()
+    return _client
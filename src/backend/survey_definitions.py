@@ -0,0 +1,200 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from .responses import json_body
+    from .supabase_rest import get_client
+except ImportError:
+    from responses import json_body
+    from supabase_rest import get_client
+
+# Only the columns a respondent needs; never the responses array
+DEFINITION_COLUMNS = 'id,title,description,questions,is_active,updated_at'
+
+# Payloads smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+
+
+class SurveyNotFound(Exception):
+    pass
+
+
+class CachedDefinition:
+    """Serialized survey definition with its content hash and lazily built encodings."""
+
+    def __init__(self, body, version=None):
+        self.body = body
+        self.tag = hashlib.sha256(body).hexdigest()[:32]
+        self.version = version
+        self.loaded_at = self.checked_at = time.monotonic()
+        self._encoded = {}
+
+    def etag(self, encoding=None):
+        # Strong ETags differ per content-coding, since the bytes differ
+        return f'"{self.tag}-{encoding}"' if encoding else f'"{self.tag}"'
+
+    def encoded(self, encoding):
+        if encoding not in self._encoded:
+            if encoding == 'br':
+                self._encoded[encoding] = brotli.compress(self.body, quality=5)
+            else:
+                self._encoded[encoding] = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._encoded[encoding]
+
+
+class SurveyDefinitionCache:
+    """Process-local LRU cache of survey question definitions.
+
+    Entries stay until invalidated (when the survey is updated) or, as a
+    safety net for missed invalidations, until `ttl` seconds have passed.
+    Other workers never see this process's invalidations, so an entry
+    older than `revalidate` seconds is only served again after its
+    updated_at, which changes with every edit of the definition, still
+    matches the database's.
+    """
+
+    def __init__(self, loader=None, version_loader=None, max_entries=1000, ttl=300, revalidate=1):
+        self.loader = loader or load_definition
+        self.version_loader = version_loader or load_definition_version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.revalidate = revalidate
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, survey_id):
+        with self._lock:
+            entry = self._entries.get(survey_id)
+            if entry is not None and (not self.ttl or time.monotonic() - entry.loaded_at < self.ttl):
+                self._entries.move_to_end(survey_id)
+            else:
+                entry = None
+
+        if entry is not None:
+            now = time.monotonic()
+            if not self.revalidate or now - entry.checked_at < self.revalidate:
+                return entry
+            if self.version_loader(survey_id) == entry.version:
+                entry.checked_at = now
+                return entry
+
+        definition = self.loader(survey_id)
+        entry = CachedDefinition(json_body(definition), definition.get('updated_at'))
+        with self._lock:
+            self._entries[survey_id] = entry
+            self._entries.move_to_end(survey_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, survey_id=None):
+        """Drop one survey, or every survey when `survey_id` is None."""
+        with self._lock:
+            if survey_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(survey_id, None)
+
+
+def load_definition(survey_id, client=None):
+    rows = (client or get_client()).select('surveys', DEFINITION_COLUMNS, {'id': f"eq.{survey_id}"}, limit=1)
+    if not rows:
+        raise SurveyNotFound(survey_id)
+    return rows[0]
+
+
+def load_definition_version(survey_id, client=None):
+    """The survey's updated_at, or None if it no longer exists."""
+    rows = (client or get_client()).select('surveys', 'updated_at', {'id': f"eq.{survey_id}"}, limit=1)
+    return rows[0]['updated_at'] if rows else None
+
+
+def etag_matches(if_none_match, tag):
+    """True if any entity tag in If-None-Match names a representation of `tag`."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate.split('-', 1)[0] == tag:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding, size):
+    if size < COMPRESS_MIN_BYTES or not accept_encoding:
+        return None
+    accepted = {part.split(';')[0].strip().lower() for part in accept_encoding.split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def definition_response(cache, survey_id, if_none_match=None, accept_encoding=None):
+    """Build the response for a survey definition request.
+
+    Returns (status_code, body_bytes, headers).
+    """
+    entry = cache.get(survey_id)
+    encoding = choose_encoding(accept_encoding, len(entry.body))
+    headers = {
+        'ETag': entry.etag(encoding),
+        'Cache-Control': 'public, no-cache',
+        'Vary': 'Accept-Encoding',
+    }
+    if etag_matches(if_none_match, entry.tag):
+        return 304, b'', headers
+
+    headers['Content-Type'] = 'application/json'
+    if encoding is None:
+        return 200, entry.body, headers
+    headers['Content-Encoding'] = encoding
+    return 200, entry.encoded(encoding), headers
+
+
+def changed_survey_id(payload):
+    """Survey id to invalidate for an invalidation request, or None.
+
+    Accepts {"surveyId": ...} or a Supabase database webhook payload. Webhook
+    updates that only touched the responses column leave the cache alone.
+    """
+    if payload.get('surveyId'):
+        return payload['surveyId']
+    record = payload.get('record') or payload.get('old_record') or {}
+    old_record = payload.get('old_record')
+    if payload.get('type') == 'UPDATE' and old_record and payload.get('record'):
+        columns = DEFINITION_COLUMNS.split(',')
+        columns.remove('updated_at')
+        if all(old_record.get(c) == payload['record'].get(c) for c in columns):
+            return None
+    return record.get('id')
+
+
+_cache = None
+
+
+def get_definition_cache():
+    """Return the process-wide cache, configured from the environment."""
+    global _cache
+    if _cache is None:
+        _cache = SurveyDefinitionCache(
+            max_entries=int(os.environ.get('SURVEY_CACHE_MAX_ENTRIES', 1000)),
+            ttl=float(os.environ.get('SURVEY_CACHE_TTL', 300)),
+            revalidate=float(os.environ.get('SURVEY_CACHE_REVALIDATE', 1)),
+        )
+    return _cache
@@ -0,0 +1,235 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .storage import connect
+    from .structured_logging import get_logger
+except ImportError:
+    from storage import connect
+    from structured_logging import get_logger
+
+logger = get_logger('survey_jobs')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+# Upper bound for a single long-poll request
+MAX_WAIT_SECONDS = 30
+
+# How often a long-poll rereads a job another worker process may be running
+POLL_INTERVAL = 0.25
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds the maximum number of pending jobs."""
+
+
+class SurveyJobQueue:
+    """Runs survey generation jobs on a local worker pool.
+
+    Job state is kept in SQLite so status and results survive the request
+    that created the job; the callables themselves only live in this process.
+    Each job records the process running it (owner), so a restarted worker
+    only fails the jobs of processes that are gone.
+    """
+
+    def __init__(self, db_name='jobs', max_workers=4, max_pending=100):
+        self.max_pending = max_pending
+        self._conn = connect(db_name)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._futures = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='survey-job')
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    session_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+            if 'owner' not in columns:
+                self._conn.execute('ALTER TABLE jobs ADD COLUMN owner TEXT')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs(session_id, status)')
+            # Jobs left active by a process that exited can never finish; other workers' jobs are running
+            owners = self._conn.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE status IN (?, ?)", ACTIVE_STATES
+            ).fetchall()
+            for (owner,) in owners:
+                if not _owner_alive(owner):
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status IN (?, ?) AND owner IS ?",
+                        (FAILED, 'Interrupted by server restart', time.time(), *ACTIVE_STATES, owner)
+                    )
+
+    def submit(self, session_id, fn):
+        """Queue `fn` for the session and return the job.
+
+        A session has at most one active job; submitting again while one is
+        queued or running returns the existing job instead of starting another.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE session_id = ? AND status IN (?, ?) ORDER BY created_at DESC LIMIT 1",
+                (session_id, *ACTIVE_STATES)
+            ).fetchone()
+            if row:
+                return _to_dict(row)
+
+            pending = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", ACTIVE_STATES
+            ).fetchone()[0]
+            if pending >= self.max_pending:
+                raise QueueFullError(f"Too many pending jobs ({pending})")
+
+            job_id = uuid.uuid4().hex
+            self._conn.execute(
+                "INSERT INTO jobs (id, session_id, status, owner, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, session_id, QUEUED, self.owner, time.time())
+            )
+            self._futures[job_id] = self._executor.submit(self._run, job_id, fn)
+            return self._get(job_id)
+
+    def get(self, job_id):
+        """Return the job as a dict, or None if it does not exist."""
+        with self._lock:
+            return self._get(job_id)
+
+    def wait(self, job_id, timeout):
+        """Long-poll: block until the job finishes or `timeout` seconds pass.
+
+        Jobs of this process wake the waiter as soon as they change; jobs
+        another worker process runs are reread every POLL_INTERVAL.
+        """
+        deadline = time.monotonic() + min(max(timeout, 0), MAX_WAIT_SECONDS)
+        with self._changed:
+            while True:
+                job = self._get(job_id)
+                if job is None or job['status'] not in ACTIVE_STATES:
+                    return job
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return job
+                self._changed.wait(min(remaining, POLL_INTERVAL))
+
+    def cancel(self, job_id):
+        """Cancel a job.
+
+        Queued jobs never start. A running model call cannot be interrupted,
+        so a running job is marked and its result discarded when it returns.
+        """
+        with self._changed:
+            job = self._get(job_id)
+            if job is None or job['status'] not in ACTIVE_STATES:
+                return job
+            future = self._futures.get(job_id)
+            if future is not None and future.cancel():
+                self._finish(job_id, CANCELLED)
+            else:
+                self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return self._get(job_id)
+
+    def _run(self, job_id, fn):
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row['cancel_requested']:
+                self._finish(job_id, CANCELLED)
+                return
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), job_id, QUEUED)
+            )
+            self._changed.notify_all()
+
+        try:
+            result = fn()
+            error = None
+        except Exception as e:
+            logger.exception("Error in survey job", extra={'job_id': job_id})
+            result, error = None, str(e)
+
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row['cancel_requested']:
+                self._finish(job_id, CANCELLED)
+            elif error is not None:
+                self._finish(job_id, FAILED, error=error)
+            else:
+                self._finish(job_id, SUCCEEDED, result=result)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        # Caller holds the lock; a job that already finished keeps its outcome
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, *ACTIVE_STATES)
+        )
+        self._futures.pop(job_id, None)
+        self._changed.notify_all()
+
+    def _get(self, job_id):
+        row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _to_dict(row) if row else None
+
+
+def _owner_alive(owner):
+    """Whether the process that queued a job is still running (jobs are only shared on one host)."""
+    try:
+        pid = int(owner.split(':', 1)[0])
+    except (AttributeError, ValueError):
+        return False
+    if pid == os.getpid():
+        # This process just started, so the job belonged to an earlier one with the same pid
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _to_dict(row):
+    return {
+        'jobId': row['id'],
+        'status': row['status'],
+        'result': json.loads(row['result']) if row['result'] else None,
+        'error': row['error'],
+        'createdAt': row['created_at'],
+        'startedAt': row['started_at'],
+        'finishedAt': row['finished_at'],
+    }
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue, configured from the environment."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = SurveyJobQueue(
+                max_workers=int(os.environ.get('SURVEY_JOB_WORKERS', 4)),
+                max_pending=int(os.environ.get('SURVEY_JOB_MAX_PENDING', 100)),
+            )
+        return _job_queue
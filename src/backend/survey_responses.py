@@ -0,0 +1,173 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+try:
+    from .response_archive import ArchiveUnavailable, merged_responses
+    from .structured_logging import get_logger
+    from .supabase_rest import get_client, token_subject
+    from .survey_definitions import SurveyNotFound
+except ImportError:
+    from response_archive import ArchiveUnavailable, merged_responses
+    from structured_logging import get_logger
+    from supabase_rest import get_client, token_subject
+    from survey_definitions import SurveyNotFound
+
+logger = get_logger('survey_responses')
+
+# Question types answered with free text
+TEXT_QUESTION_TYPES = frozenset({'short_answer', 'text', 'open', 'long_answer', 'paragraph'})
+RESPONSE_ROWS_TABLE = '680da8fd0ef55179cf75685a_responses'
+ROWS_PAGE = 1000
+
+
+class NotSurveyOwner(Exception):
+    """The caller is signed in but the survey belongs to someone else."""
+
+
+def require_owner(survey_id, access_token, client=None):
+    """Raise unless the caller owns the survey; returns their client.
+
+    Surveys are readable by anyone (shared links), so row level security
+    alone does not keep other users away from a survey's responses or
+    from the model calls made on its behalf.
+    """
+    client = client or get_client().as_user(access_token)
+    rows = client.select('surveys', 'created_by', {'id': f"eq.{survey_id}"}, limit=1)
+    if not rows:
+        raise SurveyNotFound(survey_id)
+    if not rows[0].get('created_by') or str(rows[0]['created_by']) != token_subject(access_token):
+        raise NotSurveyOwner(survey_id)
+    return client
+
+
+def iter_answers(response):
+    """Yield (question_id, answer) pairs from one stored response.
+
+    surveys.responses holds either {answers: [...], submitted_at, ...},
+    {user_id, timestamp, answers} or a bare list of answer objects.
+    """
+    answers = response if isinstance(response, list) else (response or {}).get('answers') or []
+    for answer in answers:
+        if isinstance(answer, dict) and answer.get('question_id') is not None:
+            yield answer['question_id'], answer.get('answer')
+
+
+def submitted_at(response):
+    """ISO 8601 submission time of a stored response, or None if it has none."""
+    if isinstance(response, dict):
+        answers = response.get('answers') or []
+        value = response.get('submitted_at') or response.get('timestamp')
+    else:
+        answers, value = response or [], None
+    if value is None:
+        # Responses appended by submit_survey_response carry the time on every answer
+        value = next((a.get('submitted_at') for a in answers if isinstance(a, dict) and a.get('submitted_at')), None)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Epoch seconds or, from JavaScript's Date.now(), milliseconds
+        value = datetime.fromtimestamp(value / 1000 if value > 1e11 else value, timezone.utc).isoformat()
+    return value if isinstance(value, str) and value else None
+
+
+def text_question_ids(questions):
+    return [
+        q['id'] for q in questions or []
+        if q.get('id') is not None and (q.get('question_type') or q.get('type')) in TEXT_QUESTION_TYPES
+    ]
+
+
+def text_columns(questions, responses):
+    """Non-empty free-text answers grouped by question id, in response order."""
+    columns = {question_id: [] for question_id in text_question_ids(questions)}
+    for response in responses:
+        for question_id, answer in iter_answers(response):
+            column = columns.get(question_id)
+            if column is not None and isinstance(answer, str) and answer.strip():
+                column.append(answer.strip())
+    return columns
+
+
+def _response(row):
+    respondent = row.get('respondent')
+    return {**respondent, 'answers': row['answers']} if isinstance(respondent, dict) else row['answers']
+
+
+def _rows(client, survey_id, after, limit=None):
+    """(position, response) of a survey's response rows after `after`, in order, a page at a time."""
+    while limit is None or limit > 0:
+        page = ROWS_PAGE if limit is None else min(ROWS_PAGE, limit)
+        rows = client.select(RESPONSE_ROWS_TABLE, 'position,answers,respondent', {
+            'survey_id': f"eq.{survey_id}", 'position': f"gt.{after}",
+        }, order='position.asc', limit=page)
+        for row in rows:
+            yield row['position'], _response(row)
+        if len(rows) < page:
+            return
+        after = rows[-1]['position']
+        limit = None if limit is None else limit - len(rows)
+
+
+def response_rows(client, survey_id, after=0):
+    """Responses rebuilt from a survey's response rows with positions after `after`."""
+    return [response for _, response in _rows(client, survey_id, after)]
+
+
+def archived_rows(client, survey_id, count):
+    """Responses 1..count of a survey rebuilt from its response rows.
+
+    Raises ArchiveUnavailable if any of them is missing.
+    """
+    responses = []
+    for position, response in _rows(client, survey_id, 0, count):
+        if position != len(responses) + 1:
+            break
+        responses.append(response)
+    if len(responses) < count:
+        raise ArchiveUnavailable(f"Archived responses of survey {survey_id} are not on this host "
+                                 f"and only {len(responses)} of {count} are in the response rows")
+    return responses
+
+
+def load_survey_responses(survey_id, client=None):
+    """Fetch (questions, responses) for one survey, in position order.
+
+    A survey's responses are its archived ones (from the segment files, or
+    from the response rows on a host that does not have them), then those
+    still in surveys.responses, then the rows submit_survey_response has
+    written since it stopped appending to the array.
+    """
+    client = client or get_client()
+    rows = client.select(
+        'surveys', 'id,questions,responses,responses_archived', {'id': f"eq.{survey_id}"}, limit=1)
+    if not rows:
+        raise SurveyNotFound(survey_id)
+    hot, archived = rows[0].get('responses') or [], rows[0].get('responses_archived') or 0
+    try:
+        responses = merged_responses(survey_id, hot, archived)
+    except ArchiveUnavailable as e:
+        logger.error("Archive segments missing, reading response rows", extra={
+            'survey_id': survey_id, 'error': str(e),
+        })
+        responses = archived_rows(client, survey_id, archived) + hot
+    responses += response_rows(client, survey_id, archived + len(hot))
+    return rows[0].get('questions') or [], responses
+
+
+def responses_csv(questions, responses):
+    """One CSV row per response: submission time, then each question's answer (lists and objects as JSON)."""
+    question_ids = [q['id'] for q in questions or [] if q.get('id') is not None]
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['submitted_at'] + [
+        q.get('question_text') or q.get('text') or q.get('title') or str(q['id'])
+        for q in questions or [] if q.get('id') is not None
+    ])
+    for response in responses:
+        answers = dict(iter_answers(response))
+        writer.writerow([submitted_at(response) or ''] + [
+            '' if answers.get(qid) is None else answers[qid] if isinstance(answers[qid], str)
+            else json.dumps(answers[qid], ensure_ascii=False)
+            for qid in question_ids
+        ])
+    return out.getvalue()
@@ -0,0 +1,72 @@
+import base64
+import json
+
+try:
+    from .supabase_rest import get_client
+except ImportError:
+    from supabase_rest import get_client
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(row):
+    """Opaque cursor pointing just past `row` in (created_at, id) order."""
+    raw = json.dumps([row['created_at'], row['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, survey_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+    if not isinstance(created_at, str) or not isinstance(survey_id, str):
+        raise InvalidCursor("Invalid cursor")
+    return created_at, survey_id
+
+
+def page_size(value):
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE)) if value else DEFAULT_PAGE_SIZE
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor("limit must be a number") from e
+
+
+def _summary(row):
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'description': row['description'],
+        'status': 'active' if row['is_active'] else 'draft',
+        'createdAt': row['created_at'],
+        'updatedAt': row['updated_at'],
+        'questions': row['question_count'] or 0,
+        'responses': row['response_count'] or 0,
+        'lastResponseAt': row['last_response_at'],
+    }
+
+
+def list_survey_summaries(client=None, limit=None, cursor=None):
+    """One page of the caller's surveys, newest first, from list_survey_summaries().
+
+    Counts come from surveys.question_count and survey_response_counters,
+    so neither the questions nor the responses JSONB is read. The client
+    must carry the caller's JWT (SupabaseRest.as_user); the function lists
+    the surveys of auth.uid().
+    """
+    limit = page_size(limit)
+    args = {'p_limit': limit + 1}
+    if cursor:
+        args['p_before_created_at'], args['p_before_id'] = decode_cursor(cursor)
+    rows = (client or get_client()).rpc('list_survey_summaries', args) or []
+    # One extra row tells whether there is a next page
+    page = rows[:limit]
+    return {
+        'surveys': [_summary(row) for row in page],
+        'nextCursor': encode_cursor(page[-1]) if len(rows) > limit else None,
+    }
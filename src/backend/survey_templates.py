@@ -0,0 +1,234 @@
+import os
+import pickle
+import re
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+try:
+    from .agent_streaming import TurnStream, stream_agent, streaming_to
+    from .structured_logging import get_logger
+except ImportError:
+    from agent_streaming import TurnStream, stream_agent, streaming_to
+    from structured_logging import get_logger
+
+logger = get_logger('survey_templates')
+
+# Latency budget for model-generated surveys before falling back to templates
+DEFAULT_LATENCY_BUDGET_MS = 20000
+
+DEFAULT_QUESTION_COUNT = 5
+MAX_QUESTION_COUNT = 20
+
+RATING_OPTIONS = ("1", "2", "3", "4", "5")
+
+# Question templates by type. Placeholders: {topic}, {audience}, {purpose}
+TEMPLATES = {
+    'rating': (
+        "On a scale of 1 to 5, how satisfied are you with {topic}?",
+        "On a scale of 1 to 5, how would you rate the quality of {topic}?",
+        "On a scale of 1 to 5, how important is {topic} to you?",
+    ),
+    'multiple_choice': (
+        "How often do you interact with {topic}?",
+        "Which best describes your overall experience with {topic}?",
+        "What is your main reason for using {topic}?",
+    ),
+    'boolean': (
+        "Have you experienced any problems with {topic}?",
+        "Would you recommend {topic} to others?",
+    ),
+    'text': (
+        "What would you most like to improve about {topic}?",
+        "Is there anything else you would like to tell us about {topic}?",
+    ),
+}
+
+MULTIPLE_CHOICE_OPTIONS = (
+    ("Daily", "Weekly", "Monthly", "Rarely", "Never"),
+    ("Excellent", "Good", "Average", "Poor"),
+    ("Quality", "Price", "Convenience", "Recommendation", "Other"),
+)
+
+# Keywords used to read the preferred question types from free text
+TYPE_KEYWORDS = (
+    ('rating', ('rating', 'scale', 'likert', 'score')),
+    ('multiple_choice', ('multiple', 'choice', 'select')),
+    ('boolean', ('yes/no', 'yes or no', 'boolean', 'true/false')),
+    ('text', ('open', 'text', 'free', 'written', 'comment')),
+)
+
+DEFAULT_TYPE_CYCLE = ('rating', 'multiple_choice', 'boolean', 'rating', 'text')
+
+
+def _first(requirements, *keys):
+    for key in keys:
+        value = requirements.get(key)
+        if value:
+            return value
+    return None
+
+
+def _as_list(value):
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [part.strip() for part in re.split(r',|;|\band\b|\n', str(value)) if part.strip()]
+
+
+def _question_count(value):
+    if isinstance(value, int):
+        count = value
+    else:
+        match = re.search(r'\d+', str(value or ''))
+        count = int(match.group()) if match else DEFAULT_QUESTION_COUNT
+    return max(1, min(count, MAX_QUESTION_COUNT))
+
+
+def _question_types(value):
+    text = ' '.join(_as_list(value)).lower()
+    types = [name for name, words in TYPE_KEYWORDS if any(word in text for word in words)]
+    return types or list(DEFAULT_TYPE_CYCLE)
+
+
+def _template_question(question_type, index, topic, audience, purpose):
+    templates = TEMPLATES[question_type]
+    question = {
+        'question_text': templates[index % len(templates)].format(topic=topic, audience=audience, purpose=purpose),
+        'question_type': question_type,
+        'required': question_type != 'text',
+    }
+    if question_type == 'rating':
+        question['options'] = list(RATING_OPTIONS)
+    elif question_type == 'multiple_choice':
+        question['options'] = list(MULTIPLE_CHOICE_OPTIONS[index % len(MULTIPLE_CHOICE_OPTIONS)])
+    return question
+
+
+def _requirement_slots(requirements):
+    requirements = requirements or {}
+    topics = _as_list(_first(requirements, 'topics', 'key_topics', 'information_to_gather')) or ['our service']
+    audience = _first(requirements, 'target_audience', 'audience') or 'respondents'
+    purpose = _first(requirements, 'purpose', 'goal', 'survey_purpose') or 'feedback'
+    return requirements, topics, audience, purpose
+
+
+def generate_template_survey(requirements):
+    """Build a survey from the requirement slots without calling the model.
+
+    Output is deterministic for a given set of requirements and uses the
+    same question shape as the model-generated survey.
+    """
+    requirements, topics, audience, purpose = _requirement_slots(requirements)
+    count = _question_count(_first(requirements, 'num_questions', 'question_count', 'number_of_questions'))
+    types = _question_types(_first(requirements, 'question_types', 'preferred_question_types'))
+
+    questions = []
+    used = {name: 0 for name in TEMPLATES}
+    for i in range(count):
+        question_type = types[i % len(types)]
+        topic = topics[i % len(topics)]
+        index = used[question_type]
+        used[question_type] += 1
+        questions.append({'id': f"q_{i+1}", **_template_question(question_type, index, topic, audience, purpose)})
+    return questions
+
+
+def template_question_alternatives(requirements, question_type, count, exclude=()):
+    """Up to `count` template questions of one type whose text is not in `exclude`."""
+    _, topics, audience, purpose = _requirement_slots(requirements)
+    question_type = question_type if question_type in TEMPLATES else 'text'
+    seen = {text.strip().lower() for text in exclude}
+    alternatives = []
+    for index in range(len(TEMPLATES[question_type]) * len(topics)):
+        question = _template_question(question_type, index, topics[index % len(topics)], audience, purpose)
+        if question['question_text'].lower() not in seen:
+            seen.add(question['question_text'].lower())
+            alternatives.append(question)
+            if len(alternatives) == count:
+                break
+    return alternatives
+
+
+def get_latency_budget():
+    """Latency budget in seconds, from SURVEY_LATENCY_BUDGET_MS."""
+    return int(os.environ.get('SURVEY_LATENCY_BUDGET_MS', DEFAULT_LATENCY_BUDGET_MS)) / 1000.0
+
+
+# Generations that overran the budget and are still running. Past this many,
+# requests get the template survey without starting another model call.
+MAX_ABANDONED = int(os.environ.get('SURVEY_MAX_ABANDONED', 8))
+_abandoned = 0
+_abandoned_lock = threading.Lock()
+
+
+def _release_abandoned(_future):
+    global _abandoned
+    with _abandoned_lock:
+        _abandoned -= 1
+
+
+def _snapshot(agent):
+    # Agents are picklable for the session store; a copy keeps an abandoned call off the session's agent
+    try:
+        return pickle.loads(pickle.dumps(agent))
+    except Exception:
+        logger.warning("Could not copy the agent for survey generation", exc_info=True)
+        return None
+
+
+def _template_fallback(agent):
+    try:
+        requirements = agent.get_survey_requirements()
+    except Exception as e:
+        logger.warning(f"Could not read survey requirements: {e}")
+        requirements = {}
+    return generate_template_survey(requirements)
+
+
+def generate_with_fallback(generate, agent, budget=None):
+    """Run `generate(agent)` within the latency budget.
+
+    Returns (questions, degraded, agent). Generation runs on a copy of the
+    agent, and the returned agent is the one to store for the session: the
+    copy when generation succeeded, the original otherwise. When
+    the model call errors or takes longer than the budget, the template
+    survey is returned and degraded is True. An overrunning call is
+    cancelled at its next streamed token; one that cannot stop keeps
+    running on its copy, and at most MAX_ABANDONED of those are allowed.
+    """
+    global _abandoned
+    budget = get_latency_budget() if budget is None else budget
+    with _abandoned_lock:
+        saturated = _abandoned >= MAX_ABANDONED
+    if saturated:
+        logger.warning("Too many overrunning survey generations, using template survey",
+                       extra={'abandoned': MAX_ABANDONED})
+        return _template_fallback(agent), True, agent
+
+    copy = _snapshot(agent)
+    target = copy if copy is not None else agent
+    stream = TurnStream(lambda text: None)
+    future = Future()
+
+    def run():
+        future.set_running_or_notify_cancel()
+        try:
+            with streaming_to(stream):
+                future.set_result(generate(stream_agent(target)))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name='survey-generate', daemon=True).start()
+    try:
+        return future.result(timeout=budget), False, target
+    except FutureTimeoutError:
+        logger.warning("Survey generation exceeded latency budget, using template survey",
+                       extra={'budget_s': budget})
+        stream.cancel()
+        with _abandoned_lock:
+            _abandoned += 1
+        future.add_done_callback(_release_abandoned)
+    except Exception:
+        logger.exception("Survey generation failed, using template survey")
+    return _template_fallback(agent), True, agent
@@ -0,0 +1,285 @@
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+try:
+    from langchain_openai import ChatOpenAI
+except ImportError:
+    ChatOpenAI = None
+
+try:
+    from .storage import connect
+    from .structured_logging import get_logger, log_duration
+    from .token_usage import MeteredModel
+except ImportError:
+    from storage import connect
+    from structured_logging import get_logger, log_duration
+    from token_usage import MeteredModel
+
+logger = get_logger('survey_translation')
+
+# Per model call: stay well inside the context window and keep replies parseable
+DEFAULT_BATCH_CHARS = 6000
+DEFAULT_BATCH_STRINGS = 100
+
+LANGUAGE_PATTERN = re.compile(r'^[A-Za-z]{2,3}([-_][A-Za-z0-9]{2,8})*$')
+MAX_LANGUAGES = 10
+
+# Strings without letters ("1", "10", "%", "---") read the same in every language
+NO_LETTERS = re.compile(r'^[\W\d_]*$')
+
+# Survey fields whose values respondents read
+SURVEY_TEXT_FIELDS = ('title', 'description')
+QUESTION_TEXT_FIELDS = ('question_text', 'text', 'description', 'placeholder')
+CHOICE_LIST_FIELDS = ('choices', 'options')
+
+
+class InvalidLanguage(ValueError):
+    pass
+
+
+class TranslationUnavailable(Exception):
+    """No translation model is configured."""
+
+
+def normalize(text):
+    return ' '.join(text.split())
+
+
+def _text_slots(survey, labels=False):
+    """Yield (container, key, into) for every translatable string in the survey.
+
+    `into` is the (container, key) its translation is written to. Choices
+    are also the answer values stored with each response, so they keep
+    their text: a {"text": ...} choice gets a translated "label", and a
+    list of plain strings gets a parallel `<field>_labels` list, which is
+    only created when `labels` is set.
+    """
+    for field in SURVEY_TEXT_FIELDS:
+        if isinstance(survey.get(field), str):
+            yield survey, field, (survey, field)
+    for question in survey.get('questions') or []:
+        if not isinstance(question, dict):
+            continue
+        for field in QUESTION_TEXT_FIELDS:
+            if isinstance(question.get(field), str):
+                yield question, field, (question, field)
+        for field in CHOICE_LIST_FIELDS:
+            choices = question.get(field)
+            if not isinstance(choices, list):
+                continue
+            choice_labels = None
+            if labels and any(isinstance(choice, str) for choice in choices):
+                choice_labels = question[f"{field[:-1]}_labels"] = list(choices)
+            for i, choice in enumerate(choices):
+                if isinstance(choice, str):
+                    yield choices, i, (choice_labels, i)
+                elif isinstance(choice, dict) and isinstance(choice.get('text'), str):
+                    yield choice, 'text', (choice, 'label')
+
+
+def collect_strings(survey):
+    """Distinct translatable strings of a survey, in order of first appearance.
+
+    Whitespace is normalized, so "Yes", "Yes " and a rating label repeated
+    on every question are translated once.
+    """
+    seen = {}
+    for container, key, _ in _text_slots(survey):
+        text = normalize(container[key])
+        if text and not NO_LETTERS.match(text):
+            seen.setdefault(text, None)
+    return list(seen)
+
+
+def apply_translations(survey, translations):
+    """Copy of `survey` with every string found in `translations` translated.
+
+    Ids, types and choice values are kept; choices get translated labels
+    (see _text_slots).
+    """
+    translated = copy.deepcopy(survey)
+    for container, key, (target, target_key) in _text_slots(translated, labels=True):
+        text = normalize(container[key])
+        if text in translations:
+            target[target_key] = translations[text]
+    return translated
+
+
+def batches(strings, max_chars, max_strings):
+    batch, size = [], 0
+    for text in strings:
+        if batch and (size + len(text) > max_chars or len(batch) >= max_strings):
+            yield batch
+            batch, size = [], 0
+        batch.append(text)
+        size += len(text)
+    if batch:
+        yield batch
+
+
+def check_language(language):
+    if not isinstance(language, str) or not LANGUAGE_PATTERN.match(language):
+        raise InvalidLanguage(f"Invalid language code: {language!r}")
+    return language.replace('_', '-').lower()
+
+
+TRANSLATION_PROMPT = '\n'.join([
+    "Translate each string of a survey into the language with the given code.",
+    "Keep the tone short and neutral, as on a survey form. Keep placeholders and numbers as they are.",
+    "Reply with only a JSON array of the translated strings, in the same order and of the same length.",
+])
+
+
+class ModelTranslator:
+    """Translates a list of strings in one chat completion."""
+
+    def __init__(self, api_key=None, model=None):
+        self.model = model or os.environ.get('TRANSLATION_MODEL', 'gpt-3.5-turbo')
+        self.llm = MeteredModel(ChatOpenAI(
+            model_name=self.model,
+            openai_api_key=api_key or os.environ.get('OPENAI_API_KEY'),
+            temperature=0,
+        ))
+
+    def __call__(self, strings, language):
+        # The instructions are the same for every batch and language, so they form a cacheable prefix
+        messages = [('system', TRANSLATION_PROMPT), ('user', '\n'.join([
+            f"Language: {language}",
+            f"Strings ({len(strings)}): {json.dumps(strings, ensure_ascii=False)}",
+        ]))]
+        reply = self.llm.invoke(messages).content
+        translated = json.loads(reply[reply.find('['):reply.rfind(']') + 1])
+        if not isinstance(translated, list) or len(translated) != len(strings):
+            raise ValueError("Translation reply does not match the number of strings")
+        return [str(text).strip() for text in translated]
+
+
+class PhraseCache:
+    """Phrase-level translations in the local SQLite database, keyed by language and source text."""
+
+    def __init__(self, db_name='translations'):
+        self._conn = connect(db_name)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS phrases (
+                    language TEXT NOT NULL,
+                    source_hash TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    translation TEXT NOT NULL,
+                    model TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (language, source_hash)
+                )
+            """)
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, language, strings):
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound parameter limit
+            for start in range(0, len(strings), 500):
+                chunk = {self._hash(text): text for text in strings[start:start + 500]}
+                rows = self._conn.execute(
+                    f"SELECT source_hash, source, translation FROM phrases WHERE language = ? "
+                    f"AND source_hash IN ({','.join('?' * len(chunk))})",
+                    (language, *chunk)
+                ).fetchall()
+                for row in rows:
+                    if chunk.get(row['source_hash']) == row['source']:
+                        found[row['source']] = row['translation']
+        return found
+
+    def put_many(self, language, translations, model=None):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO phrases (language, source_hash, source, translation, model, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(language, source_hash) DO UPDATE SET "
+                "source = excluded.source, translation = excluded.translation, model = excluded.model, "
+                "updated_at = excluded.updated_at",
+                [(language, self._hash(source), source, translation, model, now)
+                 for source, translation in translations.items()]
+            )
+
+
+class SurveyTranslator:
+    """Translates a survey's title, questions and choices into other languages.
+
+    All distinct strings of the survey are collected first, so a label
+    repeated on every question ("Yes", "Strongly agree") is translated
+    once. Strings already in the phrase cache are reused; the rest go to
+    the model in as few calls as the batch limits allow. Re-translating
+    an edited survey therefore only sends the strings that changed.
+    """
+
+    def __init__(self, translator=None, cache=None, batch_chars=DEFAULT_BATCH_CHARS,
+                 batch_strings=DEFAULT_BATCH_STRINGS):
+        self.translator = translator
+        self.cache = cache or PhraseCache()
+        self.batch_chars = batch_chars
+        self.batch_strings = batch_strings
+
+    def translate(self, survey, language):
+        """Return (translated survey, stats) for one language."""
+        language = check_language(language)
+        strings = collect_strings(survey)
+        translations = self.cache.get_many(language, strings)
+        missing = [text for text in strings if text not in translations]
+        calls = 0
+        if missing:
+            if self.translator is None:
+                raise TranslationUnavailable("No translation model is configured")
+            started = time.perf_counter()
+            for batch in batches(missing, self.batch_chars, self.batch_strings):
+                translated = dict(zip(batch, self.translator(batch, language)))
+                calls += 1
+                # Cache each batch as it arrives, so a failure later on keeps the work done so far
+                self.cache.put_many(language, translated, getattr(self.translator, 'model', None))
+                translations.update(translated)
+            log_duration(logger, "Translated survey strings", started, language=language,
+                         strings=len(missing), calls=calls)
+        stats = {
+            'strings': len(strings),
+            'cached': len(strings) - len(missing),
+            'translated': len(missing),
+            'modelCalls': calls,
+        }
+        return apply_translations(survey, translations), stats
+
+    def translate_many(self, survey, languages):
+        if not isinstance(languages, list) or not languages or len(languages) > MAX_LANGUAGES:
+            raise InvalidLanguage(f"languages must be a list of 1 to {MAX_LANGUAGES} language codes")
+        results = {}
+        for language in languages:
+            translated, stats = self.translate(survey, language)
+            results[check_language(language)] = {'survey': translated, 'stats': stats}
+        return results
+
+
+_translator = None
+_translator_lock = threading.Lock()
+
+
+def get_survey_translator():
+    """Return the process-wide translator; needs OPENAI_API_KEY for strings not in the cache."""
+    global _translator
+    with _translator_lock:
+        if _translator is None:
+            model = None
+            if ChatOpenAI is not None and os.environ.get('OPENAI_API_KEY'):
+                model = ModelTranslator()
+            _translator = SurveyTranslator(
+                translator=model,
+                batch_chars=int(os.environ.get('TRANSLATION_BATCH_CHARS', DEFAULT_BATCH_CHARS)),
+                batch_strings=int(os.environ.get('TRANSLATION_BATCH_STRINGS', DEFAULT_BATCH_STRINGS)),
+            )
+        return _translator
@@ -0,0 +1,20 @@
+# src/backend/test_filter_cube.py
+from filter_cube import FilterCube
+
+QUESTIONS = [{'id': 'q1', 'question_type': 'multiple_choice', 'options': ['a', 'b']}]
+
+
+def response(choice, day='2024-04-01'):
+    return {'answers': [{'question_id': 'q1', 'answer': choice, 'submitted_at': f"{day}T12:00:00Z"}]}
+
+
+def test_counter_offset_from_responses_stays_fresh():
+    cube = FilterCube(':memory:')
+    assert not cube.fresh('s', 0)
+    # Two responses came with the survey, one was submitted: the counter says 1
+    cube.update('s', QUESTIONS, [response('a'), response('b'), response('a')], 1)
+    assert cube.fresh('s', 1)
+    assert cube.ingest('s', QUESTIONS, [response('b', '2024-04-02')], 4)
+    assert cube.fresh('s', 2) and not cube.fresh('s', 3)
+    assert cube.query('s')['questions'] == {'q1': {'a': 2, 'b': 2}}
+    assert cube.query('s', since='2024-04-02')['responses'] == 1
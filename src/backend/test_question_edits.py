@@ -0,0 +1,52 @@
+# src/backend/test_question_edits.py
+import pytest
+
+from question_edits import AlternativesCache, QuestionEditor
+
+
+class Writer:
+    """Writes numbered alternatives and remembers the target of every call."""
+
+    def __init__(self):
+        self.targets = []
+
+    def __call__(self, action, requirements, context, target, count, instruction=None):
+        self.targets.append(dict(target) if target else None)
+        start = len(self.targets) * 10
+        return [{'question_text': f"Alternative {start + i}", 'question_type': 'text'} for i in range(count)]
+
+
+@pytest.fixture
+def editor(tmp_path, monkeypatch):
+    monkeypatch.setenv('FORMALYZE_DATA_DIR', str(tmp_path))
+    writer = Writer()
+    editor = QuestionEditor(writer=writer, cache=AlternativesCache())
+    editor._refill = lambda job: None
+    return editor, writer
+
+
+def survey(text, question_type='text', options=None):
+    target = {'id': 'q_1', 'question_text': text, 'question_type': question_type}
+    if options:
+        target['options'] = options
+    return [target, {'id': 'q_2', 'question_text': 'Anything else?', 'question_type': 'text'}]
+
+
+def test_another_alternative_comes_from_the_cache(editor):
+    editor, writer = editor
+    editor.edit('s', object(), survey('How was it?'), 'regenerate', 'q_1')
+    result = editor.edit('s', object(), survey('How was it?'), 'regenerate', 'q_1')
+    assert result['cached'] and len(writer.targets) == 1
+
+
+@pytest.mark.parametrize('edited', [
+    survey('How was your visit?'),
+    survey('How was it?', 'rating', ['1', '2', '3']),
+    survey('How was it?', 'multiple_choice', ['Good', 'Bad']),
+])
+def test_editing_the_target_question_misses_the_cache(editor, edited):
+    editor, writer = editor
+    editor.edit('s', object(), survey('How was it?'), 'regenerate', 'q_1')
+    result = editor.edit('s', object(), edited, 'regenerate', 'q_1')
+    assert not result['cached']
+    assert writer.targets[-1] == edited[0]
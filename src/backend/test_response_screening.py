@@ -0,0 +1,64 @@
+# src/backend/test_response_screening.py
+from response_ingest import ResponseIngestor
+from response_screening import TOO_FAST, ResponseScreen, client_address
+
+TOKEN = 'a' * 24
+
+
+class Client:
+    """Draft tables of one respondent token, and the submits that reached the database."""
+
+    def __init__(self, submitted=False, draft_started=None):
+        self.submitted = submitted
+        self.draft_started = draft_started
+        self.submits = []
+
+    def select(self, table, columns, filters, order=None, limit=None):
+        if table == 'response_drafts_submitted':
+            return [{'token': TOKEN}] if self.submitted else []
+        return [{'created_at': self.draft_started}] if self.draft_started else []
+
+    def rpc(self, name, params):
+        self.submits.append(params)
+        duplicate, self.submitted = self.submitted, True
+        return {'position': 1, 'answers': params['p_answers'], 'duplicate': duplicate}
+
+    def insert(self, table, row, **kwargs):
+        raise AssertionError(f"quarantined: {row['reasons']}")
+
+
+def test_client_address_ignores_addresses_the_client_prepended():
+    headers = {'X-Forwarded-For': '1.2.3.4, 198.51.100.7, 10.0.0.1'}
+    assert client_address(headers, '10.0.0.2') == '10.0.0.1'
+    assert client_address(headers, '10.0.0.2', proxies={'10.0.0.1'}) == '198.51.100.7'
+    assert client_address({**headers, 'X-Real-IP': '203.0.113.9'}) == '203.0.113.9'
+    assert client_address({}, '10.0.0.2') == '10.0.0.2'
+
+
+def test_completion_time_is_measured_from_the_draft_start():
+    screen = ResponseScreen()
+    answers = {'q1': 'yes', 'q2': 'no', 'q3': 5}
+    # No draft row: the time is unknown, not too fast
+    verdict = screen.screen('s', answers, 'f1', TOKEN, now=1000.0)
+    assert not verdict.reasons and verdict.elapsed is None
+    screen.draft_started('b' * 24, now=999.0)
+    assert screen.screen('s', answers, 'f4', 'b' * 24, elapsed_ms=600_000, now=1000.0).reasons == [TOO_FAST]
+    verdict = screen.screen('s', answers, 'f2', None, elapsed_ms=600_000, now=1000.0, started=880.0)
+    assert not verdict.reasons and verdict.elapsed == 120.0
+    verdict = screen.screen('s', answers, 'f3', None, elapsed_ms=500, now=1000.0, started=880.0)
+    assert verdict.reasons == [TOO_FAST]
+
+
+def test_submit_measures_time_from_the_stored_draft_start():
+    client = Client(draft_started='2024-04-01T12:00:00.123+00:00')
+    ingestor = ResponseIngestor(client=client, screen=ResponseScreen())
+    result = ingestor.submit('s', TOKEN, {'q1': 'yes'}, fingerprint='f')
+    assert result['position'] == 1
+
+
+def test_retry_of_an_accepted_submit_is_not_screened_again():
+    client = Client(submitted=True)
+    # A fresh screen, as on another worker: no draft timing, same answers
+    ingestor = ResponseIngestor(client=client, screen=ResponseScreen())
+    result = ingestor.submit('s', TOKEN, {'q1': 'yes'}, fingerprint='f')
+    assert result == {'submitted': True, 'position': 1, 'duplicate': True}
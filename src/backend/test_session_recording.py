@@ -0,0 +1,44 @@
+# src/backend/test_session_recording.py
+import pickle
+
+from session_recording import RecordingAgent, RecordingModel
+from stub_agent import StubSurveyAgent
+
+
+class Writer:
+    def __init__(self):
+        self.turns = []
+
+    def append(self, turn):
+        self.turns.append(turn)
+
+
+class EchoModel:
+    temperature = 0.5
+
+    def invoke(self, messages):
+        return messages
+
+
+def test_recording_model_survives_a_pickle_round_trip():
+    model = pickle.loads(pickle.dumps(RecordingModel(EchoModel())))
+    assert isinstance(model.model, EchoModel)
+    assert model.temperature == 0.5
+    assert model.invoke('hi') == 'hi'
+
+
+def test_recorded_agent_survives_the_session_store():
+    writer = Writer()
+    stub = StubSurveyAgent(model_latency_ms=0, cpu_ms=0)
+    stub.llm = EchoModel()
+    agent = RecordingAgent(stub, 'session', writer)
+    agent.start_conversation()
+    agent.process_response('customer feedback')
+
+    restored = pickle.loads(pickle.dumps(agent))
+    restored._writer = writer
+    restored.process_response('customers')
+
+    assert [turn['turn'] for turn in writer.turns] == [0, 1, 2]
+    assert isinstance(restored.agent.llm, RecordingModel)
+    assert isinstance(restored.agent.llm.model, EchoModel)
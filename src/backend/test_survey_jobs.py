@@ -0,0 +1,113 @@
+# src/backend/test_survey_jobs.py
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from session_store import MemorySessionStore, SessionBusy, SQLiteSessionStore
+from survey_jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, SurveyJobQueue
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('FORMALYZE_DATA_DIR', str(tmp_path))
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def insert_job(queue, job_id, status, owner):
+    queue._conn.execute(
+        "INSERT INTO jobs (id, session_id, status, owner, created_at) VALUES (?, ?, ?, ?, ?)",
+        (job_id, f"session-{job_id}", status, owner, time.time())
+    )
+
+
+def test_restart_only_fails_jobs_of_exited_processes():
+    queue = SurveyJobQueue()
+    insert_job(queue, 'live', RUNNING, f"{os.getppid()}:other-worker")
+    insert_job(queue, 'dead', RUNNING, f"{dead_pid()}:exited-worker")
+    insert_job(queue, 'legacy', QUEUED, None)
+
+    restarted = SurveyJobQueue()
+
+    assert restarted.get('live')['status'] == RUNNING
+    assert restarted.get('dead')['status'] == FAILED
+    assert restarted.get('dead')['error'] == 'Interrupted by server restart'
+    assert restarted.get('legacy')['status'] == FAILED
+
+
+def test_failed_job_is_not_overwritten_when_it_finishes():
+    queue = SurveyJobQueue()
+    release = threading.Event()
+    job = queue.submit('s', lambda: release.wait(5) and {'questions': []})
+    queue.wait(job['jobId'], 0)
+    queue._conn.execute("UPDATE jobs SET status = ? WHERE id = ?", (FAILED, job['jobId']))
+
+    release.set()
+    time.sleep(0.2)
+
+    assert queue.get(job['jobId'])['status'] == FAILED
+
+
+def test_wait_sees_jobs_finished_by_another_process():
+    queue = SurveyJobQueue()
+    other = SurveyJobQueue()
+    insert_job(other, 'remote', RUNNING, f"{os.getppid()}:other-worker")
+
+    def finish():
+        time.sleep(0.3)
+        other._conn.execute("UPDATE jobs SET status = ? WHERE id = 'remote'", (SUCCEEDED,))
+
+    threading.Thread(target=finish).start()
+    started = time.monotonic()
+    job = queue.wait('remote', 5)
+
+    assert job['status'] == SUCCEEDED
+    assert time.monotonic() - started < 2
+
+
+@pytest.mark.parametrize('make_store', [
+    lambda: MemorySessionStore(lock_timeout=0.2),
+    lambda: SQLiteSessionStore(lock_timeout=0.2),
+])
+def test_session_lock_serializes_read_modify_write(make_store):
+    store = make_store()
+    store.put('s', [])
+
+    def append(i):
+        with store.locked('s'):
+            turns = store.get('s')
+            time.sleep(0.01)
+            store.put('s', turns + [i])
+
+    threads = [threading.Thread(target=append, args=(i,)) for i in range(8)]
+    store.lock_timeout = 5
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(store.get('s')) == list(range(8))
+
+    store.lock_timeout = 0.2
+    with store.locked('s'):
+        with pytest.raises(SessionBusy):
+            with store.locked('s'):
+                pass
+
+
+def test_sqlite_session_lock_is_shared_between_stores():
+    first, second = SQLiteSessionStore(lock_timeout=0.2), SQLiteSessionStore(lock_timeout=0.2)
+    with first.locked('s'):
+        with pytest.raises(SessionBusy):
+            with second.locked('s'):
+                pass
+    with second.locked('s'):
+        pass
+
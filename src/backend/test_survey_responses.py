@@ -0,0 +1,81 @@
+# src/backend/test_survey_responses.py
+import base64
+import json
+
+import pytest
+
+import survey_responses
+from response_archive import ArchiveUnavailable, ResponseArchive
+from survey_definitions import SurveyNotFound
+
+SURVEY = '11111111-1111-1111-1111-111111111111'
+OWNER = '00000000-0000-0000-0000-000000000001'
+
+
+def jwt(sub):
+    claims = base64.urlsafe_b64encode(json.dumps({'sub': sub}).encode()).decode().rstrip('=')
+    return f"e30.{claims}.signature"
+
+
+class Client:
+    """A survey with two archived responses and one still in surveys.responses."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, table, columns, filters, order=None, limit=None):
+        if table == 'surveys':
+            return [{'id': SURVEY, 'questions': [], 'responses': [{'answers': [], 'n': 3}], 'responses_archived': 2}]
+        after = int(filters['position'][len('gt.'):])
+        return [row for row in self.rows if row['position'] > after][:limit]
+
+
+@pytest.fixture(autouse=True)
+def empty_archive(tmp_path, monkeypatch):
+    # This host has none of the survey's segments
+    monkeypatch.setattr('response_archive._archive', ResponseArchive(str(tmp_path)))
+
+
+def test_archived_responses_come_from_the_rows_without_segments():
+    client = Client([
+        {'position': 1, 'answers': [{'question_id': 'q1', 'answer': 'a'}], 'respondent': {'n': 1}},
+        {'position': 2, 'answers': [{'question_id': 'q1', 'answer': 'b'}], 'respondent': None},
+        {'position': 3, 'answers': [], 'respondent': {'n': 3}},
+    ])
+    _, responses = survey_responses.load_survey_responses(SURVEY, client)
+    assert responses == [
+        {'n': 1, 'answers': [{'question_id': 'q1', 'answer': 'a'}]},
+        [{'question_id': 'q1', 'answer': 'b'}],
+        {'answers': [], 'n': 3},
+    ]
+
+
+def test_missing_segments_and_rows_fail_loudly():
+    client = Client([{'position': 2, 'answers': [], 'respondent': None}])
+    with pytest.raises(ArchiveUnavailable):
+        survey_responses.load_survey_responses(SURVEY, client)
+
+
+def test_rows_submitted_after_the_array_follow_it():
+    client = Client([
+        {'position': 1, 'answers': [], 'respondent': {'n': 1}},
+        {'position': 2, 'answers': [], 'respondent': {'n': 2}},
+        {'position': 3, 'answers': [], 'respondent': {'n': 3}},
+        {'position': 4, 'answers': [], 'respondent': {'n': 4}},
+        {'position': 6, 'answers': [], 'respondent': {'n': 6}},
+    ])
+    _, responses = survey_responses.load_survey_responses(SURVEY, client)
+    assert [response['n'] for response in responses] == [1, 2, 3, 4, 6]
+
+
+def test_only_the_owner_gets_past_require_owner():
+    client = Client([])
+    client.select = lambda table, columns, filters, order=None, limit=None: \
+        [{'created_by': OWNER}] if filters['id'] == f"eq.{SURVEY}" else []
+    assert survey_responses.require_owner(SURVEY, jwt(OWNER), client) is client
+    with pytest.raises(survey_responses.NotSurveyOwner):
+        survey_responses.require_owner(SURVEY, jwt('00000000-0000-0000-0000-000000000002'), client)
+    with pytest.raises(survey_responses.NotSurveyOwner):
+        survey_responses.require_owner(SURVEY, 'not a jwt', client)
+    with pytest.raises(SurveyNotFound):
+        survey_responses.require_owner('22222222-2222-2222-2222-222222222222', jwt(OWNER), client)
@@ -0,0 +1,21 @@
+# src/backend/test_text_scoring.py
+import pytest
+
+from text_scoring import TextAggregate
+
+
+def test_negation_flips_the_next_words():
+    not_great, not_very_great, great = TextAggregate().score(['not great', 'not very great', 'great'])
+    assert not_great < 0 and not_very_great < 0 and great > 0
+
+
+def test_negation_stops_at_punctuation():
+    not_great, not_bad = TextAggregate().score(['not. great', 'not, bad'])
+    great, bad = TextAggregate().score(['great', 'bad'])
+    assert not_great == pytest.approx(great)
+    assert not_bad == pytest.approx(bad)
+
+
+def test_negation_does_not_reach_the_next_answer():
+    _, great = TextAggregate().score(['not', 'great'])
+    assert great > 0
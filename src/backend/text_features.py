@@ -0,0 +1,68 @@
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here
+hers him his how i if in into is it its itself just me more most my no nor not of off on once only or other
+our ours out over own same she should so some such than that the their them then there these they this
+those through to too under until up very was we were what when where which while who whom why will with
+would you your yours i'm it's i've don't
+""".split())
+
+
+def tokenize(text):
+    """Lowercased word tokens with stopwords removed."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+@lru_cache(maxsize=1 << 16)
+def feature_index(term, dim):
+    # crc32 rather than hash(): string hashing is salted per process
+    return zlib.crc32(term.encode('utf-8')) % dim
+
+
+def terms_with_bigrams(tokens):
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+class HashingTfidf:
+    """TF-IDF over hashed unigrams and bigrams.
+
+    The feature space is fixed, so vectors from different batches stay
+    comparable as new answers arrive; document frequencies grow with
+    every batch passed to transform(update=True).
+    """
+
+    def __init__(self, dim=4096):
+        self.dim = dim
+        self.df = np.zeros(dim, dtype=np.int64)
+        self.n_docs = 0
+
+    def term_counts(self, texts):
+        rows, cols = [], []
+        for i, text in enumerate(texts):
+            indices = [feature_index(term, self.dim) for term in terms_with_bigrams(tokenize(text))]
+            rows.extend([i] * len(indices))
+            cols.extend(indices)
+        flat = np.asarray(rows, dtype=np.int64) * self.dim + np.asarray(cols, dtype=np.int64)
+        counts = np.bincount(flat, minlength=len(texts) * self.dim)
+        return counts.reshape(len(texts), self.dim).astype(np.float32)
+
+    def transform(self, texts, update=True):
+        """L2-normalized TF-IDF rows (float32) for `texts`."""
+        tf = self.term_counts(texts)
+        if update:
+            self.df += np.count_nonzero(tf, axis=0)
+            self.n_docs += len(texts)
+        idf = np.log((1.0 + self.n_docs) / (1.0 + self.df)).astype(np.float32) + 1.0
+        x = np.log1p(tf, out=tf)
+        x *= idf
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return x / norms
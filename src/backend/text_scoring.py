@@ -0,0 +1,250 @@
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+try:
+    from .analytics_store import SurveyStateTable
+    from .structured_logging import get_logger, log_duration
+    from .survey_responses import text_columns
+    from .text_features import STOPWORDS, TOKEN_RE
+except ImportError:
+    from analytics_store import SurveyStateTable
+    from structured_logging import get_logger, log_duration
+    from survey_responses import text_columns
+    from text_features import STOPWORDS, TOKEN_RE
+
+logger = get_logger('text_scoring')
+
+# Valence on a -3..3 scale, in the style of VADER's lexicon
+LEXICON = {
+    'amazing': 2.8, 'awesome': 3.0, 'best': 3.0, 'better': 1.9, 'brilliant': 2.8, 'clean': 1.7, 'clear': 1.6,
+    'comfortable': 1.6, 'convenient': 1.8, 'easy': 1.9, 'effective': 2.1, 'efficient': 1.9, 'enjoy': 2.2,
+    'enjoyed': 2.2, 'excellent': 3.0, 'fantastic': 2.9, 'fast': 1.5, 'fine': 0.8, 'friendly': 2.2, 'fun': 2.3,
+    'glad': 2.0, 'good': 1.9, 'great': 3.1, 'happy': 2.7, 'helpful': 1.8, 'impressed': 2.1, 'intuitive': 1.8,
+    'like': 1.5, 'liked': 1.8, 'love': 3.2, 'loved': 2.9, 'nice': 1.8, 'perfect': 2.7, 'pleasant': 2.3,
+    'pleased': 2.2, 'quick': 1.3, 'recommend': 1.6, 'reliable': 1.9, 'satisfied': 1.8, 'simple': 1.2,
+    'smooth': 1.6, 'solid': 1.5, 'super': 2.9, 'thanks': 1.9, 'useful': 1.9, 'valuable': 2.1, 'well': 1.1,
+    'wonderful': 2.7, 'worth': 0.9, 'affordable': 1.4, 'improved': 1.9, 'responsive': 1.4, 'powerful': 1.8,
+    'annoying': -1.7, 'awful': -2.0, 'bad': -2.5, 'broken': -2.1, 'bug': -1.3, 'buggy': -1.8, 'bugs': -1.3,
+    'clunky': -1.5, 'complicated': -1.3, 'confusing': -1.3, 'crash': -1.7, 'crashes': -1.7, 'difficult': -1.5,
+    'disappointed': -1.9, 'disappointing': -2.2, 'dislike': -1.6, 'error': -1.4, 'errors': -1.4,
+    'expensive': -1.3, 'fail': -2.5, 'failed': -2.3, 'frustrated': -2.4, 'frustrating': -1.9, 'hard': -0.4,
+    'hate': -2.7, 'horrible': -2.5, 'issue': -0.9, 'issues': -0.9, 'lacking': -1.1, 'lag': -1.2,
+    'laggy': -1.5, 'mess': -1.5, 'missing': -1.2, 'poor': -2.1, 'problem': -1.7, 'problems': -1.7,
+    'rude': -2.0, 'sad': -2.1, 'slow': -1.3, 'slowly': -1.0, 'terrible': -2.1, 'unclear': -1.0,
+    'unhappy': -1.8, 'unreliable': -1.6, 'unusable': -2.3, 'useless': -1.8, 'waste': -1.8, 'worse': -2.1,
+    'worst': -3.1, 'wrong': -2.1, 'overpriced': -1.8, 'outdated': -1.2, 'painful': -1.9, 'ugly': -2.3,
+}
+
+# A negator flips the valence of the next NEGATION_WINDOW tokens in the same answer
+NEGATIONS = frozenset({
+    'no', 'not', 'never', 'nothing', 'none', 'neither', 'nor', 'without', 'hardly', 'barely',
+    "don't", "doesn't", "didn't", "isn't", "wasn't", "aren't", "weren't", "can't", "couldn't", "won't",
+    "wouldn't", "shouldn't", "haven't", "hasn't",
+})
+NEGATION_WINDOW = 2
+# Punctuation is kept as tokens so a negation does not reach past the end of its clause
+CLAUSE_BREAKS = '.,;:!?'
+SCORING_TOKEN_RE = re.compile(TOKEN_RE.pattern + f"|[{CLAUSE_BREAKS}]")
+NEGATION_SCALAR = -0.74
+
+# compound = raw / sqrt(raw^2 + ALPHA), mapping summed valence into (-1, 1)
+ALPHA = 15.0
+POSITIVE_THRESHOLD = 0.05
+HISTOGRAM_BINS = 10
+
+# Keep the keyword vocabulary of one question bounded
+MAX_VOCABULARY = 20000
+KEEP_VOCABULARY = 5000
+
+
+class TextAggregate:
+    """Running sentiment and keyword statistics for the answers to one question.
+
+    Tokens are interned into a per-question vocabulary; lexicon valence,
+    negation flags and stopword flags live in arrays indexed by term id,
+    so scoring a batch is a handful of NumPy operations over the
+    concatenated token ids of every answer in it. Aggregates from separate
+    batches (or processes) combine with merge().
+    """
+
+    def __init__(self):
+        self.vocab = {}
+        self.terms = []
+        self.valence = np.zeros(0, dtype=np.float32)
+        self.negator = np.zeros(0, dtype=bool)
+        self.keyword = np.zeros(0, dtype=bool)
+        self.df = np.zeros(0, dtype=np.int64)
+        self.term_sentiment = np.zeros(0, dtype=np.float64)
+        self.count = 0
+        self.sentiment_sum = 0.0
+        # negative, neutral, positive
+        self.polarity = np.zeros(3, dtype=np.int64)
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+
+    def _intern(self, token_lists):
+        vocab, terms = self.vocab, self.terms
+        start = len(terms)
+        ids = []
+        for tokens in token_lists:
+            for token in tokens:
+                term_id = vocab.get(token)
+                if term_id is None:
+                    term_id = vocab[token] = len(terms)
+                    terms.append(token)
+                ids.append(term_id)
+        new_terms = terms[start:]
+        if new_terms:
+            self.valence = np.concatenate([self.valence, np.array([LEXICON.get(t, 0.0) for t in new_terms],
+                                                                  dtype=np.float32)])
+            self.negator = np.concatenate([self.negator, np.array([t in NEGATIONS for t in new_terms])])
+            self.keyword = np.concatenate([self.keyword, np.array(
+                [len(t) > 2 and not t.isdigit() and t not in STOPWORDS and t not in NEGATIONS for t in new_terms]
+            )])
+            self.df = np.concatenate([self.df, np.zeros(len(new_terms), dtype=np.int64)])
+            self.term_sentiment = np.concatenate([self.term_sentiment, np.zeros(len(new_terms))])
+        return np.asarray(ids, dtype=np.int64)
+
+    def score(self, texts):
+        """Compound sentiment in (-1, 1) for each text; also folds them into the aggregate."""
+        token_lists = [SCORING_TOKEN_RE.findall(text.lower()) for text in texts]
+        ids = self._intern(token_lists)
+        lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=len(texts))
+        doc = np.repeat(np.arange(len(texts)), lengths)
+
+        valence = self.valence[ids]
+        # reach[i]: a negator `shift` tokens back, in the same answer, with no clause break since
+        clause_break = np.isin(ids, [self.vocab[c] for c in CLAUSE_BREAKS if c in self.vocab])
+        reach = self.negator[ids]
+        flipped = np.zeros(len(ids), dtype=bool)
+        for _ in range(NEGATION_WINDOW):
+            reach = np.concatenate([[False], reach[:-1] & (doc[1:] == doc[:-1]) & ~clause_break[1:]])
+            flipped |= reach
+        valence = np.where(flipped, valence * NEGATION_SCALAR, valence)
+        raw = np.bincount(doc, weights=valence, minlength=len(texts))
+        compound = raw / np.sqrt(raw * raw + ALPHA)
+
+        self.count += len(texts)
+        self.sentiment_sum += float(compound.sum())
+        polarity = (compound >= POSITIVE_THRESHOLD).astype(np.int64) - (compound <= -POSITIVE_THRESHOLD) + 1
+        self.polarity += np.bincount(polarity, minlength=3)
+        self.histogram += np.histogram(compound, bins=HISTOGRAM_BINS, range=(-1.0, 1.0))[0]
+
+        # Document frequency and summed sentiment of each keyword, counting a term once per answer
+        mask = self.keyword[ids]
+        width = len(self.terms)
+        pairs = np.unique(doc[mask] * width + ids[mask])
+        pair_docs, pair_terms = np.divmod(pairs, width)
+        self.df += np.bincount(pair_terms, minlength=width)
+        self.term_sentiment += np.bincount(pair_terms, weights=compound[pair_docs], minlength=width)
+
+        if width > MAX_VOCABULARY:
+            self._trim()
+        return compound
+
+    def _trim(self):
+        keep = np.sort(np.argsort(-self.df, kind='stable')[:KEEP_VOCABULARY])
+        df, term_sentiment = self.df[keep], self.term_sentiment[keep]
+        terms = [self.terms[i] for i in keep]
+        self.vocab, self.terms = {}, []
+        self.valence = self.valence[:0]
+        self.negator = self.negator[:0]
+        self.keyword = self.keyword[:0]
+        self.df = self.df[:0]
+        self.term_sentiment = self.term_sentiment[:0]
+        self._intern([terms])
+        self.df += df
+        self.term_sentiment += term_sentiment
+
+    def merge(self, other):
+        """Fold another aggregate (e.g. from a worker process) into this one."""
+        ids = self._intern([other.terms])
+        self.df[ids] += other.df
+        self.term_sentiment[ids] += other.term_sentiment
+        self.count += other.count
+        self.sentiment_sum += other.sentiment_sum
+        self.polarity += other.polarity
+        self.histogram += other.histogram
+        if len(self.terms) > MAX_VOCABULARY:
+            self._trim()
+        return self
+
+    def summary(self, top_n=10):
+        top = np.argsort(-self.df, kind='stable')[:top_n]
+        return {
+            'count': self.count,
+            'meanSentiment': round(self.sentiment_sum / self.count, 4) if self.count else 0.0,
+            'sentiment': dict(zip(('negative', 'neutral', 'positive'), self.polarity.tolist())),
+            'histogram': self.histogram.tolist(),
+            'keywords': [
+                {
+                    'term': self.terms[i],
+                    'count': int(self.df[i]),
+                    'sentiment': round(float(self.term_sentiment[i] / self.df[i]), 4),
+                }
+                for i in top if self.df[i]
+            ],
+        }
+
+
+def score_texts(texts):
+    """Aggregate for one column of answers; picklable, so it can run in a worker process."""
+    aggregate = TextAggregate()
+    aggregate.score(texts)
+    return aggregate
+
+
+def score_in_pool(pool, texts, chunk_size=20000):
+    """Score a large column across a multiprocessing pool and merge the partial aggregates."""
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    aggregate = TextAggregate()
+    for partial in pool.imap(score_texts, chunks):
+        aggregate.merge(partial)
+    return aggregate
+
+
+class TextInsights:
+    """Per-survey sentiment and keyword aggregates for open-ended questions, cached in SQLite."""
+
+    def __init__(self, db_name='analytics', batch_size=5000):
+        self.batch_size = batch_size
+        self.table = SurveyStateTable('text_insights', db_name)
+
+    def get(self, survey_id):
+        _, state = self.table.read(survey_id)
+        return {question_id: aggregate.summary() for question_id, aggregate in state.items()}
+
+    def _folder(self, questions):
+        def add(state, new_responses):
+            for question_id, texts in text_columns(questions, new_responses).items():
+                if texts:
+                    aggregate = state.setdefault(question_id, TextAggregate())
+                    for start in range(0, len(texts), self.batch_size):
+                        aggregate.score(texts[start:start + self.batch_size])
+        return add
+
+    def update(self, survey_id, questions, responses):
+        """Fold responses not seen yet into the aggregates and return the summary per question."""
+        started = time.perf_counter()
+        state = self.table.fold_new_responses(survey_id, responses, self._folder(questions))
+        log_duration(logger, "Scored survey answers", started, survey_id=survey_id, responses=len(responses))
+        return {question_id: aggregate.summary() for question_id, aggregate in state.items()}
+
+    def ingest(self, survey_id, questions, responses, position):
+        """Fold newly submitted responses ending at `position` (see ResponseIngestor.after_submit)."""
+        return self.table.fold_appended(survey_id, responses, position, self._folder(questions))
+
+
+_insights = None
+_insights_lock = threading.Lock()
+
+
+def get_text_insights():
+    global _insights
+    with _insights_lock:
+        if _insights is None:
+            _insights = TextInsights(batch_size=int(os.environ.get('TEXT_SCORING_BATCH_SIZE', 5000)))
+        return _insights
@@ -0,0 +1,227 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from .session_recording import model_attributes
+    from .storage import connect
+    from .structured_logging import get_logger
+except ImportError:
+    from session_recording import model_attributes
+    from storage import connect
+    from structured_logging import get_logger
+
+logger = get_logger('token_usage')
+
+# USD per million tokens: (prompt, cached prompt, completion). Unknown models are counted but not priced.
+MODEL_PRICES = {
+    'gpt-3.5-turbo': (0.50, 0.50, 1.50),
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4.1-mini': (0.40, 0.10, 1.60),
+    'gpt-4.1': (2.00, 0.50, 8.00),
+}
+
+# Session the current model call is charged to, for shared model clients (e.g. the question writer)
+current_session = contextvars.ContextVar('usage_session', default=None)
+
+
+class BudgetExceeded(Exception):
+    """The session has used up its token budget."""
+
+    def __init__(self, session_id, usage):
+        super().__init__("This conversation has used up its token budget")
+        self.session_id = session_id
+        self.usage = usage
+
+
+def usage_of(message):
+    """(prompt, completion, cached) tokens of a chat model reply, or zeros if it reports none."""
+    usage = getattr(message, 'usage_metadata', None)
+    if usage:
+        details = usage.get('input_token_details') or {}
+        return usage.get('input_tokens', 0), usage.get('output_tokens', 0), details.get('cache_read', 0) or 0
+    usage = (getattr(message, 'response_metadata', None) or {}).get('token_usage') or {}
+    details = usage.get('prompt_tokens_details') or {}
+    return usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0), details.get('cached_tokens', 0) or 0
+
+
+def cost_of(model, prompt, completion, cached):
+    price = MODEL_PRICES.get(model)
+    if price is None:
+        # Dated snapshots, e.g. gpt-4o-mini-2024-07-18
+        price = next((p for name, p in sorted(MODEL_PRICES.items(), key=lambda item: -len(item[0]))
+                      if model.startswith(name)), None)
+    if price is None:
+        return 0.0
+    return ((prompt - cached) * price[0] + cached * price[1] + completion * price[2]) / 1e6
+
+
+@contextmanager
+def charge_to(session_id):
+    token = current_session.set(session_id)
+    try:
+        yield
+    finally:
+        current_session.reset(token)
+
+
+class UsageLedger:
+    """Token and cost totals per session and per model, in the local SQLite database.
+
+    Every worker process on the host updates the same totals, so a
+    session's budget holds whichever worker serves it. A budget of 0
+    means unlimited.
+    """
+
+    def __init__(self, db_name='usage', budget=0):
+        self.budget = budget
+        self._conn = connect(db_name)
+        self._lock = threading.Lock()
+        with self._lock:
+            for table, key in (('session_usage', 'session_id'), ('model_usage', 'model')):
+                self._conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        {key} TEXT PRIMARY KEY,
+                        calls INTEGER NOT NULL,
+                        prompt_tokens INTEGER NOT NULL,
+                        completion_tokens INTEGER NOT NULL,
+                        cached_tokens INTEGER NOT NULL,
+                        cost REAL NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                """)
+
+    def record(self, session_id, model, prompt, completion, cached):
+        cost = cost_of(model, prompt, completion, cached)
+        rows = [('model_usage', 'model', model)]
+        if session_id:
+            rows.append(('session_usage', 'session_id', session_id))
+        with self._lock:
+            for table, key, value in rows:
+                self._conn.execute(
+                    f"INSERT INTO {table} ({key}, calls, prompt_tokens, completion_tokens, cached_tokens, cost, "
+                    f"updated_at) VALUES (?, 1, ?, ?, ?, ?, ?) ON CONFLICT({key}) DO UPDATE SET "
+                    "calls = calls + 1, prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                    "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                    "cached_tokens = cached_tokens + excluded.cached_tokens, cost = cost + excluded.cost, "
+                    "updated_at = excluded.updated_at",
+                    (value, prompt, completion, cached, cost, time.time())
+                )
+
+    def session(self, session_id):
+        """Totals of one session, with its budget and what is left of it."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM session_usage WHERE session_id = ?", (session_id,)).fetchone()
+        usage = {
+            'calls': row['calls'] if row else 0,
+            'promptTokens': row['prompt_tokens'] if row else 0,
+            'completionTokens': row['completion_tokens'] if row else 0,
+            'cachedTokens': row['cached_tokens'] if row else 0,
+            'costUsd': round(row['cost'], 6) if row else 0.0,
+        }
+        used = usage['promptTokens'] + usage['completionTokens']
+        usage['budgetTokens'] = self.budget or None
+        usage['remainingTokens'] = max(self.budget - used, 0) if self.budget else None
+        return usage
+
+    def check(self, session_id):
+        """Raise BudgetExceeded if the session may not make another model call."""
+        if not self.budget or not session_id:
+            return
+        usage = self.session(session_id)
+        if usage['remainingTokens'] == 0:
+            raise BudgetExceeded(session_id, usage)
+
+    def models(self):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute("SELECT * FROM model_usage ORDER BY model")]
+
+    def metrics_text(self):
+        """Totals by model in the Prometheus text format."""
+        lines = []
+        rows = self.models()
+        for name, column, kind in (
+            ('formalyze_model_calls_total', 'calls', 'counter'),
+            ('formalyze_model_prompt_tokens_total', 'prompt_tokens', 'counter'),
+            ('formalyze_model_completion_tokens_total', 'completion_tokens', 'counter'),
+            ('formalyze_model_cached_tokens_total', 'cached_tokens', 'counter'),
+            ('formalyze_model_cost_usd_total', 'cost', 'counter'),
+        ):
+            lines.append(f"# TYPE {name} {kind}")
+            lines += [f'{name}{{model="{row["model"]}"}} {row[column]}' for row in rows]
+        with self._lock:
+            sessions = self._conn.execute("SELECT COUNT(*) FROM session_usage").fetchone()[0]
+            over = self._conn.execute(
+                "SELECT COUNT(*) FROM session_usage WHERE ? > 0 AND prompt_tokens + completion_tokens >= ?",
+                (self.budget, self.budget)
+            ).fetchone()[0]
+        lines += ["# TYPE formalyze_metered_sessions gauge", f"formalyze_metered_sessions {sessions}",
+                  "# TYPE formalyze_sessions_over_budget gauge", f"formalyze_sessions_over_budget {over}"]
+        return '\n'.join(lines) + '\n'
+
+
+class MeteredModel:
+    """Wraps a chat model's invoke(): checks the session budget first, then records the reply's usage.
+
+    With no session_id the call is charged to current_session (see
+    charge_to); calls outside any session only count towards the model
+    totals.
+    """
+
+    def __init__(self, model, session_id=None):
+        self.model = model
+        self.session_id = session_id
+
+    def invoke(self, messages, *args, **kwargs):
+        session_id = self.session_id or current_session.get()
+        ledger = get_usage_ledger()
+        ledger.check(session_id)
+        result = self.model.invoke(messages, *args, **kwargs)
+        model = getattr(self.model, 'model_name', None) or getattr(self.model, 'model', None)
+        try:
+            ledger.record(session_id, str(model or type(self.model).__name__), *usage_of(result))
+        except Exception:
+            logger.exception("Failed to record token usage", extra={'session_id': session_id})
+        return result
+
+    def __getattr__(self, name):
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+def _metered(model):
+    # Recording and metering wrappers nest; look through them via their 'model' attribute
+    while model is not None:
+        if isinstance(model, MeteredModel):
+            return True
+        model = vars(model).get('model') if hasattr(model, '__dict__') else None
+    return False
+
+
+def meter_agent(agent, session_id):
+    """Charge the model calls of a session's agent to the session; returns the agent."""
+    if agent is None:
+        return None
+    inner = vars(agent).get('agent', agent)
+    for name in model_attributes(inner):
+        model = getattr(inner, name)
+        if not _metered(model):
+            setattr(inner, name, MeteredModel(model, session_id))
+    return agent
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger():
+    """Return the process-wide ledger; SESSION_TOKEN_BUDGET caps prompt + completion tokens per session."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger(budget=int(os.environ.get('SESSION_TOKEN_BUDGET', 0)))
+        return _ledger
@@ -30,6 +30,8 @@ const mockSurveys = [
   },
 ];
 
+const PAGE_SIZE = 24;
+
 const SurveyCard = ({ survey, onDelete }) => {
   const [showActions, setShowActions] = useState(false);
   const navigate = useNavigate();
@@ -51,9 +53,7 @@ const SurveyCard = ({ survey, onDelete }) => {
     id: survey.id,
     title: survey.title,
     questions: survey.questions,
-    responses: survey.responses,
-    questionsData: survey.questionsData,
-    responsesData: survey.responsesData
+    responses: survey.responses
   });
 
   return (
@@ -160,6 +160,8 @@ const SurveyList = ({ user, onSetActiveTab }) => {
   const [error, setError] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
   const [filter, setFilter] = useState('all');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   
   useEffect(() => {
     console.log('=== SurveyList Component Mounted ===');
@@ -174,10 +176,14 @@ const SurveyList = ({ user, onSetActiveTab }) => {
     }
   }, [user]);
 
-  const fetchSurveys = async () => {
+  const fetchSurveys = async (cursor = null) => {
     console.log('=== Starting fetchSurveys ===');
     try {
-      setLoading(true);
+      if (cursor) {
+        setLoadingMore(true);
+      } else {
+        setLoading(true);
+      }
       setError(null);
       
       // Debug Supabase client
@@ -200,73 +206,28 @@ const SurveyList = ({ user, onSetActiveTab }) => {
 
       console.log('Fetching surveys for user:', user.id);
       
-      // Fetch surveys with all necessary data
-      const { data, error } = await supabase
-        .from('surveys')
-        .select(`
-          id,
-          title,
-          description,
-          created_by,
-          created_at,
-          updated_at,
-          is_active,
-          questions,
-          responses
-        `)
-        .eq('created_by', user.id)
-        .order('created_at', { ascending: false });
-
-      console.log('Raw survey data from Supabase:', data);
-
-      if (error) {
-        console.error('Supabase query error:', error);
-        throw error;
-      }
-
-      if (!data || data.length === 0) {
-        console.log('No surveys found in database');
-        setSurveys([]);
-        return;
-      }
-
-      // Transform data with detailed logging
-      console.log('Transforming survey data...');
-      const transformedSurveys = data.map(survey => {
-        const questions = survey.questions || [];
-        const responses = survey.responses || [];
-        
-        console.log('Processing survey:', {
-          id: survey.id,
-          title: survey.title,
-          questions_count: questions.length,
-          responses_count: responses.length,
-          questions_data: questions,
-          responses_data: responses
-        });
-        
-        return {
-          id: survey.id,
-          title: survey.title,
-          description: survey.description,
-          createdAt: survey.created_at,
-          updatedAt: survey.updated_at,
-          responses: responses.length,
-          status: survey.is_active ? 'active' : 'draft',
-          questions: questions.length,
-          questionsData: questions,
-          responsesData: responses
-        };
+      // Summaries only (counts come from maintained counters), one page at a time
+      const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+      if (cursor) params.set('cursor', cursor);
+      const response = await fetch(`/api/surveys?${params}`, {
+        headers: { Authorization: `Bearer ${session.access_token}` }
       });
-
-      console.log('Final transformed surveys:', transformedSurveys);
-      setSurveys(transformedSurveys);
+      const data = await response.json();
+      
+      if (!response.ok) {
+        console.error('Survey list request failed:', data);
+        throw new Error(data.error || `Survey list request failed: ${response.status}`);
+      }
       
+      console.log('Survey summaries:', data);
+      setSurveys(prev => (cursor ? [...prev, ...data.surveys] : data.surveys));
+      setNextCursor(data.nextCursor);
     } catch (error) {
       console.error('Error in fetchSurveys:', error);
       setError(error.message);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
       console.log('=== fetchSurveys completed ===');
     }
   };
@@ -311,7 +272,7 @@ const SurveyList = ({ user, onSetActiveTab }) => {
         <div className="text-red-500 mb-4">Error loading surveys</div>
         <p className="text-morandi-dark/70 mb-4">{error}</p>
         <button 
-          onClick={fetchSurveys}
+          onClick={() => fetchSurveys()}
           className="btn-primary"
         >
           Retry
@@ -410,6 +371,19 @@ const SurveyList = ({ user, onSetActiveTab }) => {
           <p className="text-morandi-dark/70">No surveys found matching your search criteria.</p>
         </div>
       )}
+
+      {nextCursor && (
+        <div className="flex justify-center mt-6">
+          <button
+            type="button"
+            onClick={() => fetchSurveys(nextCursor)}
+            disabled={loadingMore}
+            className="btn-text"
+          >
+            {loadingMore ? 'Loading...' : 'Load more surveys'}
+          </button>
+        </div>
+      )}
     </div>
   );
 };
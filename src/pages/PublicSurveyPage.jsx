@@ -1,8 +1,12 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { ArrowLeft } from 'lucide-react';
 import supabase from '../lib/supabase';
 
+// Answers are autosaved this long after the respondent stops typing
+const AUTOSAVE_DELAY_MS = 800;
+const respondentTokenKey = (surveyId) => `formalyze:respondent:${surveyId}`;
+
 const PublicSurveyPage = () => {
   const { id } = useParams();
   const navigate = useNavigate();
@@ -11,6 +15,18 @@ const PublicSurveyPage = () => {
   const [error, setError] = useState(null);
   const [answers, setAnswers] = useState({});
   const [submitted, setSubmitted] = useState(false);
+  // Autosave: answers changed since the last save, the next delta number,
+  // and a promise chain so saves (and the first token) are issued in order
+  const pendingDelta = useRef({});
+  const nextSeq = useRef(0);
+  const saveTimer = useRef(null);
+  const saveChain = useRef(Promise.resolve());
+  // Idempotency key of the last submit and the body it was sent with; a
+  // retry after a timeout reuses it so the response is only counted once
+  const pendingSubmit = useRef(null);
+  // When the form was opened. The backend times submits from the draft
+  // started below (startDraft) to spot bots; elapsedMs can only shorten that
+  const startedAt = useRef(Date.now());
 
   // Define mapQuestionType function at the component level
   const mapQuestionType = (type) => {
@@ -36,55 +52,114 @@ const PublicSurveyPage = () => {
       ...prev,
       [questionId]: value
     }));
+    pendingDelta.current[questionId] = value;
+    clearTimeout(saveTimer.current);
+    saveTimer.current = setTimeout(() => {
+      saveChain.current = saveChain.current.then(saveDraft);
+    }, AUTOSAVE_DELAY_MS);
   };
 
-  const handleSubmit = async (e) => {
-    e.preventDefault();
-    
+  const respondentHeaders = () => {
+    const token = localStorage.getItem(respondentTokenKey(id));
+    return {
+      'Content-Type': 'application/json',
+      ...(token ? { 'x-respondent-token': token } : {})
+    };
+  };
+
+  // Send only the answers changed since the last save
+  const saveDraft = async () => {
+    const delta = pendingDelta.current;
+    if (Object.keys(delta).length === 0) return;
+    pendingDelta.current = {};
     try {
-      // Format the answers into the expected structure
-      const formattedAnswers = Object.entries(answers).map(([questionId, answer]) => ({
-        question_id: questionId,
-        answer: answer,
-        submitted_at: new Date().toISOString()
-      }));
+      const response = await fetch(`/api/surveys/${id}/responses/draft`, {
+        method: 'POST',
+        headers: respondentHeaders(),
+        body: JSON.stringify({ seq: nextSeq.current++, answers: delta })
+      });
+      if (!response.ok) throw new Error(`Autosave failed: ${response.status}`);
+      const data = await response.json();
+      localStorage.setItem(respondentTokenKey(id), data.token);
+    } catch (error) {
+      // Retry with the next change; answers edited since then are newer
+      pendingDelta.current = { ...delta, ...pendingDelta.current };
+      console.error('Error autosaving response:', error);
+    }
+  };
 
-      // First get the current survey to access its responses
-      const { data: currentSurvey, error: fetchError } = await supabase
-        .from('surveys')
-        .select('responses')
-        .eq('id', id)
-        .limit(1);
+  // Ask for a respondent token as soon as the form is shown; the backend
+  // stores when it issued it, so submits are timed from here
+  const startDraft = async () => {
+    if (localStorage.getItem(respondentTokenKey(id))) return;
+    try {
+      const response = await fetch(`/api/surveys/${id}/responses/draft`, {
+        method: 'POST',
+        headers: respondentHeaders(),
+        body: JSON.stringify({ seq: nextSeq.current++, answers: {} })
+      });
+      if (!response.ok) throw new Error(`Starting the draft failed: ${response.status}`);
+      const data = await response.json();
+      localStorage.setItem(respondentTokenKey(id), data.token);
+    } catch (error) {
+      console.error('Error starting draft:', error);
+    }
+  };
 
-      if (fetchError) {
-        console.error('Error fetching current survey:', fetchError);
-        throw fetchError;
+  // Restore answers saved from an earlier visit
+  const loadDraft = async () => {
+    const token = localStorage.getItem(respondentTokenKey(id));
+    if (!token) return;
+    try {
+      const response = await fetch(`/api/surveys/${id}/responses/draft`, {
+        headers: { 'x-respondent-token': token }
+      });
+      if (!response.ok) return;
+      const draft = await response.json();
+      if (draft.submitted) {
+        localStorage.removeItem(respondentTokenKey(id));
+        return;
       }
+      nextSeq.current = draft.seq + 1;
+      setAnswers(prev => ({ ...draft.answers, ...prev }));
+    } catch (error) {
+      console.error('Error loading saved answers:', error);
+    }
+  };
 
-      // Get the current responses array or initialize it
-      const currentResponses = (currentSurvey?.[0]?.responses || []);
-
-      // Create new response object
-      const newResponse = {
-        answers: formattedAnswers,
-        submitted_at: new Date().toISOString(),
-        // Mark as anonymous response
-        is_anonymous: true
-      };
-
-      // Update the survey with the new response
-      const { error: updateError } = await supabase
-        .from('surveys')
-        .update({
-          responses: [...currentResponses, newResponse]
-        })
-        .eq('id', id);
+  const handleSubmit = async (e) => {
+    e.preventDefault();
+    
+    try {
+      // Save the answers still waiting for the autosave timer first
+      clearTimeout(saveTimer.current);
+      saveChain.current = saveChain.current.then(saveDraft);
+      await saveChain.current;
 
-      if (updateError) {
-        console.error('Error updating survey:', updateError);
-        throw updateError;
+      // The backend merges the autosaved draft with these answers and
+      // appends the response in the database
+      const answersJson = JSON.stringify(answers);
+      if (pendingSubmit.current?.answers !== answersJson) {
+        pendingSubmit.current = {
+          answers: answersJson,
+          body: JSON.stringify({ answers, elapsedMs: Date.now() - startedAt.current }),
+          key: crypto.randomUUID()
+        };
+      }
+      const response = await fetch(`/api/surveys/${id}/responses`, {
+        method: 'POST',
+        headers: { ...respondentHeaders(), 'Idempotency-Key': pendingSubmit.current.key },
+        body: pendingSubmit.current.body
+      });
+      // The server answered; only requests that never got a reply are retried with the key
+      pendingSubmit.current = null;
+      const data = await response.json().catch(() => ({}));
+      // 402: the survey owner's plan has no responses left for this survey
+      if (!response.ok) {
+        throw new Error(data.error || `Submit failed: ${response.status}`);
       }
 
+      localStorage.removeItem(respondentTokenKey(id));
       setSubmitted(true);
     } catch (error) {
       console.error('Error submitting survey:', error);
@@ -95,13 +170,22 @@ const PublicSurveyPage = () => {
   const fetchSurvey = async () => {
     try {
       setLoading(true);
-      const { data, error } = await supabase
-        .from('surveys')
-        .select('*')
-        .eq('id', id)
-        .single();
+      // Only the question definition is needed here; the backend serves it
+      // from cache with ETags instead of fetching the whole responses array
+      let data;
+      const response = await fetch(`/api/surveys/${id}/definition`);
+      if (response.ok) {
+        data = await response.json();
+      } else {
+        const { data: row, error } = await supabase
+          .from('surveys')
+          .select('id, title, description, questions, is_active, updated_at')
+          .eq('id', id)
+          .single();
 
-      if (error) throw error;
+        if (error) throw error;
+        data = row;
+      }
       
       console.log('Raw data from DB:', data); // Debug log
       
@@ -129,6 +213,7 @@ const PublicSurveyPage = () => {
       };
       
       setSurvey(surveyData);
+      saveChain.current = saveChain.current.then(startDraft);
     } catch (error) {
       console.error('Error fetching survey:', error);
       setError(error.message);
@@ -138,7 +223,11 @@ const PublicSurveyPage = () => {
   };
 
   useEffect(() => {
+    startedAt.current = Date.now();
+    // Runs before startDraft, which only asks for a token if there is none to resume
+    saveChain.current = saveChain.current.then(loadDraft);
     fetchSurvey();
+    return () => clearTimeout(saveTimer.current);
   }, [id]);
 
   if (loading) {
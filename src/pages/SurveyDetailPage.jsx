@@ -429,6 +429,11 @@ const SurveyDetailPage = () => {
   const [activeTab, setActiveTab] = useState('questions');
   const [showShareModal, setShowShareModal] = useState(false);
   const [copied, setCopied] = useState(false);
+  const [answerThemes, setAnswerThemes] = useState(null);
+  const [textInsights, setTextInsights] = useState(null);
+  const [breakdown, setBreakdown] = useState(null);
+  const [breakdownChoices, setBreakdownChoices] = useState({});
+  const [breakdownFilter, setBreakdownFilter] = useState({ since: '', until: '', choice: '' });
 
   const surveyUrl = `${window.location.origin}/s/${id}`;
 
@@ -442,6 +447,62 @@ const SurveyDetailPage = () => {
     fetchSurvey();
   }, [id]);
 
+  useEffect(() => {
+    if (activeTab === 'responses' && survey?.responses?.length) {
+      fetchAnswerThemes();
+    }
+  }, [activeTab, survey]);
+
+  useEffect(() => {
+    if (activeTab === 'responses' && survey?.responses?.length) {
+      fetchBreakdown();
+    }
+  }, [activeTab, survey, breakdownFilter]);
+
+  // Choice counts by day from the precomputed cube; filters do not rescan the responses
+  const fetchBreakdown = async () => {
+    try {
+      const { data: { session } } = await supabase.auth.getSession();
+      if (!session) return;
+      const params = new URLSearchParams();
+      if (breakdownFilter.since) params.set('since', breakdownFilter.since);
+      if (breakdownFilter.until) params.set('until', breakdownFilter.until);
+      if (breakdownFilter.choice) {
+        const [questionId, choice] = JSON.parse(breakdownFilter.choice);
+        params.set('filterQuestion', questionId);
+        params.set('filterChoice', choice);
+      }
+      const response = await fetch(`/api/surveys/${id}/breakdown?${params}`, {
+        headers: { Authorization: `Bearer ${session.access_token}` }
+      });
+      if (!response.ok) throw new Error(`Breakdown request failed: ${response.status}`);
+      const data = await response.json();
+      setBreakdown(data);
+      if (!breakdownFilter.choice) setBreakdownChoices(data.questions);
+    } catch (error) {
+      console.error('Error fetching breakdown:', error);
+    }
+  };
+
+  // Themes, sentiment and keywords for open-ended answers; the backend only processes new responses
+  const fetchAnswerThemes = async () => {
+    try {
+      const { data: { session } } = await supabase.auth.getSession();
+      if (!session) return;
+      const headers = { Authorization: `Bearer ${session.access_token}` };
+      const [themesResponse, insightsResponse] = await Promise.all([
+        fetch(`/api/surveys/${id}/answer-clusters`, { headers }),
+        fetch(`/api/surveys/${id}/text-insights`, { headers })
+      ]);
+      if (!themesResponse.ok) throw new Error(`Answer themes request failed: ${themesResponse.status}`);
+      if (!insightsResponse.ok) throw new Error(`Text insights request failed: ${insightsResponse.status}`);
+      setAnswerThemes((await themesResponse.json()).questions);
+      setTextInsights((await insightsResponse.json()).questions);
+    } catch (error) {
+      console.error('Error fetching answer themes:', error);
+    }
+  };
+
   const fetchSurvey = async () => {
     try {
       setLoading(true);
@@ -452,7 +513,16 @@ const SurveyDetailPage = () => {
         .single();
 
       if (error) throw error;
-      
+
+      // New responses are stored as rows and closed surveys may have theirs
+      // archived; the backend serves archive, array and rows together
+      const { data: { session } } = await supabase.auth.getSession();
+      const response = await fetch(`/api/surveys/${id}/responses`, {
+        headers: { Authorization: `Bearer ${session?.access_token}` }
+      });
+      if (!response.ok) throw new Error(`Responses request failed: ${response.status}`);
+      data.responses = (await response.json()).responses;
+
       // Debug logging
       console.log('Fetched survey data:', {
         id: data.id,
@@ -634,8 +704,115 @@ const SurveyDetailPage = () => {
       );
     }
 
+    const choiceQuestions = survey.questions.filter(question => breakdownChoices[question.id]);
+
     return (
       <div className="space-y-6">
+        {breakdown && choiceQuestions.length > 0 && (
+          <div className="card p-6">
+            <div className="flex flex-wrap items-end gap-4 mb-4">
+              <label className="text-sm text-morandi-dark/70">
+                From
+                <input
+                  type="date"
+                  value={breakdownFilter.since}
+                  onChange={(e) => setBreakdownFilter({ ...breakdownFilter, since: e.target.value })}
+                  className="input-field block mt-1"
+                />
+              </label>
+              <label className="text-sm text-morandi-dark/70">
+                To
+                <input
+                  type="date"
+                  value={breakdownFilter.until}
+                  onChange={(e) => setBreakdownFilter({ ...breakdownFilter, until: e.target.value })}
+                  className="input-field block mt-1"
+                />
+              </label>
+              <label className="text-sm text-morandi-dark/70">
+                Respondents who chose
+                <select
+                  value={breakdownFilter.choice}
+                  onChange={(e) => setBreakdownFilter({ ...breakdownFilter, choice: e.target.value })}
+                  className="input-field block mt-1"
+                >
+                  <option value="">Anything</option>
+                  {choiceQuestions.map(question => Object.keys(breakdownChoices[question.id]).map(choice => (
+                    <option key={`${question.id}-${choice}`} value={JSON.stringify([question.id, choice])}>
+                      {question.question_text || question.text}: {choice}
+                    </option>
+                  )))}
+                </select>
+              </label>
+              <span className="text-sm text-morandi-dark/70">{breakdown.responses} responses</span>
+            </div>
+            <div className="space-y-4">
+              {choiceQuestions
+                .filter(question => breakdown.questions[question.id])
+                .map(question => (
+                  <div key={`breakdown-${question.id}`}>
+                    <h4 className="font-medium text-morandi-dark mb-2">{question.question_text || question.text}</h4>
+                    {Object.entries(breakdown.questions[question.id]).map(([choice, count]) => (
+                      <div key={choice} className="mb-2">
+                        <div className="flex justify-between mb-1">
+                          <span className="text-sm text-morandi-dark">{choice}</span>
+                          <span className="text-sm text-morandi-dark/70">{count}</span>
+                        </div>
+                        <div className="h-2 bg-background-subtle rounded-lg overflow-hidden">
+                          <div
+                            className="h-full bg-morandi-blue rounded-lg"
+                            style={{ width: `${breakdown.responses ? (count / breakdown.responses) * 100 : 0}%` }}
+                          ></div>
+                        </div>
+                      </div>
+                    ))}
+                  </div>
+                ))}
+            </div>
+          </div>
+        )}
+        {answerThemes && survey.questions
+          .filter(question => answerThemes[question.id]?.clusters?.length)
+          .map(question => (
+            <div key={`themes-${question.id}`} className="card p-6">
+              <h4 className="font-medium text-morandi-dark mb-1">{question.question_text}</h4>
+              <p className="text-sm text-morandi-dark/70 mb-4">
+                {answerThemes[question.id].total} answers grouped into {answerThemes[question.id].clusters.length} themes
+              </p>
+              {textInsights?.[question.id] && (
+                <div className="mb-4 text-sm text-morandi-dark/70">
+                  <div className="flex space-x-4 mb-1">
+                    <span className="text-morandi-green">{textInsights[question.id].sentiment.positive} positive</span>
+                    <span>{textInsights[question.id].sentiment.neutral} neutral</span>
+                    <span className="text-morandi-pink">{textInsights[question.id].sentiment.negative} negative</span>
+                  </div>
+                  <div className="flex flex-wrap gap-2">
+                    {textInsights[question.id].keywords.map(keyword => (
+                      <span key={keyword.term} className="px-2 py-0.5 bg-background-subtle rounded-lg text-xs">
+                        {keyword.term} ({keyword.count})
+                      </span>
+                    ))}
+                  </div>
+                </div>
+              )}
+              <div className="space-y-3">
+                {answerThemes[question.id].clusters.map(cluster => (
+                  <div key={cluster.id}>
+                    <div className="flex justify-between mb-1">
+                      <span className="text-sm text-morandi-dark">{cluster.label}</span>
+                      <span className="text-sm text-morandi-dark/70">{cluster.size} ({Math.round(cluster.share * 100)}%)</span>
+                    </div>
+                    <div className="h-2 bg-background-subtle rounded-lg overflow-hidden">
+                      <div className="h-full bg-morandi-blue rounded-lg" style={{ width: `${cluster.share * 100}%` }}></div>
+                    </div>
+                    {cluster.examples[0] && (
+                      <p className="text-xs italic text-morandi-dark/60 mt-1">"{cluster.examples[0]}"</p>
+                    )}
+                  </div>
+                ))}
+              </div>
+            </div>
+          ))}
         {survey.responses.map((response, index) => {
           // Handle both array responses and single response objects
           const answers = Array.isArray(response) ? response : response.answers || [];
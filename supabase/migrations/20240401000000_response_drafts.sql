@@ -0,0 +1,86 @@
+-- In-progress survey responses, autosaved by the backend as small deltas
+-- (question id -> answer). Saving appends one row; nothing is rewritten.
+CREATE TABLE public.response_draft_deltas (
+    id BIGSERIAL PRIMARY KEY,
+    token TEXT NOT NULL,
+    survey_id UUID NOT NULL REFERENCES public.surveys(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    delta JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    -- Retried saves carry the same seq and are ignored
+    UNIQUE (token, seq)
+);
+
+-- Respondent tokens that have already been submitted, so a retried submit
+-- does not append the response twice
+CREATE TABLE public.response_drafts_submitted (
+    token TEXT PRIMARY KEY,
+    survey_id UUID NOT NULL REFERENCES public.surveys(id) ON DELETE CASCADE,
+    position INTEGER,
+    submitted_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- Only the backend (service role) reads or writes drafts
+ALTER TABLE public.response_draft_deltas ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.response_drafts_submitted ENABLE ROW LEVEL SECURITY;
+
+-- Merge a respondent's deltas (later seq wins) with the final answers and
+-- append the result to surveys.responses in one transaction. The append
+-- happens inside the database instead of the client reading and writing
+-- back the whole array. Returns {position, answers}; position is the
+-- 1-based index of the response in surveys.responses.
+CREATE OR REPLACE FUNCTION public.submit_survey_response(
+    p_survey_id UUID,
+    p_token TEXT DEFAULT NULL,
+    p_answers JSONB DEFAULT '{}'::jsonb
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    merged JSONB := '{}'::jsonb;
+    answer_list JSONB;
+    pos INTEGER;
+    submitted_text TEXT := to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"');
+BEGIN
+    IF p_token IS NOT NULL THEN
+        INSERT INTO response_drafts_submitted (token, survey_id) VALUES (p_token, p_survey_id)
+        ON CONFLICT (token) DO NOTHING;
+        IF NOT FOUND THEN
+            SELECT s.position INTO pos FROM response_drafts_submitted s WHERE s.token = p_token;
+            RETURN jsonb_build_object('position', pos, 'answers', NULL, 'duplicate', true);
+        END IF;
+
+        SELECT COALESCE(jsonb_object_agg(e.key, e.value ORDER BY d.seq), '{}'::jsonb) INTO merged
+        FROM response_draft_deltas d, jsonb_each(d.delta) e
+        WHERE d.token = p_token AND d.survey_id = p_survey_id;
+    END IF;
+
+    merged := merged || COALESCE(p_answers, '{}'::jsonb);
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'question_id', e.key, 'answer', e.value, 'submitted_at', submitted_text
+    )), '[]'::jsonb) INTO answer_list
+    FROM jsonb_each(merged) e;
+
+    UPDATE surveys
+    SET responses = COALESCE(responses, '[]'::jsonb) || jsonb_build_array(jsonb_build_object(
+        'answers', answer_list, 'submitted_at', submitted_text, 'is_anonymous', true
+    ))
+    WHERE id = p_survey_id AND is_active
+    RETURNING jsonb_array_length(responses) INTO pos;
+
+    IF pos IS NULL THEN
+        RAISE EXCEPTION 'Survey % not found or not accepting responses', p_survey_id USING ERRCODE = 'P0002';
+    END IF;
+
+    IF p_token IS NOT NULL THEN
+        UPDATE response_drafts_submitted SET position = pos WHERE token = p_token;
+        DELETE FROM response_draft_deltas WHERE token = p_token;
+    END IF;
+    RETURN jsonb_build_object('position', pos, 'answers', answer_list, 'duplicate', false);
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.submit_survey_response(UUID, TEXT, JSONB) FROM PUBLIC, anon, authenticated;
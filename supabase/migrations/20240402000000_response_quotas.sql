@@ -0,0 +1,135 @@
+-- Response limits per survey by plan tier (Free 100, Professional 1,000,
+-- Business unlimited), enforced when a response is submitted.
+CREATE TABLE public.plan_limits (
+    plan TEXT PRIMARY KEY,
+    -- NULL means unlimited
+    max_responses_per_survey INTEGER
+);
+
+INSERT INTO public.plan_limits (plan, max_responses_per_survey) VALUES
+    ('free', 100),
+    ('professional', 1000),
+    ('business', NULL);
+
+-- Users without a row are on the free plan
+CREATE TABLE public.account_plans (
+    user_id UUID PRIMARY KEY REFERENCES auth.users(id) ON DELETE CASCADE,
+    plan TEXT NOT NULL DEFAULT 'free' REFERENCES public.plan_limits(plan),
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- Accepted responses per survey, maintained by submit_survey_response so
+-- the limit check never counts rows or measures the responses array
+CREATE TABLE public.survey_response_counters (
+    survey_id UUID PRIMARY KEY REFERENCES public.surveys(id) ON DELETE CASCADE,
+    response_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+INSERT INTO public.survey_response_counters (survey_id, response_count)
+SELECT id, jsonb_array_length(COALESCE(responses, '[]'::jsonb)) FROM public.surveys
+ON CONFLICT (survey_id) DO NOTHING;
+
+ALTER TABLE public.plan_limits ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.account_plans ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.survey_response_counters ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Anyone can read plan limits"
+ON public.plan_limits
+FOR SELECT
+TO anon, authenticated
+USING (true);
+
+CREATE POLICY "Users can read their own plan"
+ON public.account_plans
+FOR SELECT
+TO authenticated
+USING (auth.uid() = user_id);
+
+CREATE POLICY "Owners can read their survey counters"
+ON public.survey_response_counters
+FOR SELECT
+TO authenticated
+USING (EXISTS (SELECT 1 FROM public.surveys s WHERE s.id = survey_id AND s.created_by = auth.uid()));
+
+-- Responses are appended only through submit_survey_response, so anonymous
+-- clients can no longer rewrite surveys.responses and bypass the limit.
+-- Owners keep full access through "Allow users to manage their own surveys".
+DROP POLICY IF EXISTS "Allow anyone to update survey responses" ON public.surveys;
+
+CREATE OR REPLACE FUNCTION public.submit_survey_response(
+    p_survey_id UUID,
+    p_token TEXT DEFAULT NULL,
+    p_answers JSONB DEFAULT '{}'::jsonb
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    merged JSONB := '{}'::jsonb;
+    answer_list JSONB;
+    pos INTEGER;
+    response_limit INTEGER;
+    accepted INTEGER;
+    submitted_text TEXT := to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"');
+BEGIN
+    IF p_token IS NOT NULL THEN
+        INSERT INTO response_drafts_submitted (token, survey_id) VALUES (p_token, p_survey_id)
+        ON CONFLICT (token) DO NOTHING;
+        IF NOT FOUND THEN
+            SELECT s.position INTO pos FROM response_drafts_submitted s WHERE s.token = p_token;
+            RETURN jsonb_build_object('position', pos, 'answers', NULL, 'duplicate', true);
+        END IF;
+
+        SELECT COALESCE(jsonb_object_agg(e.key, e.value ORDER BY d.seq), '{}'::jsonb) INTO merged
+        FROM response_draft_deltas d, jsonb_each(d.delta) e
+        WHERE d.token = p_token AND d.survey_id = p_survey_id;
+    END IF;
+
+    -- Count the response against the owner's plan. The conditional upsert
+    -- locks the survey's counter row, so concurrent submits cannot both
+    -- take the last slot.
+    SELECT l.max_responses_per_survey INTO response_limit
+    FROM surveys s
+    LEFT JOIN account_plans a ON a.user_id = s.created_by
+    JOIN plan_limits l ON l.plan = COALESCE(a.plan, 'free')
+    WHERE s.id = p_survey_id;
+
+    INSERT INTO survey_response_counters AS c (survey_id, response_count) VALUES (p_survey_id, 1)
+    ON CONFLICT (survey_id) DO UPDATE SET response_count = c.response_count + 1, updated_at = now()
+    WHERE response_limit IS NULL OR c.response_count < response_limit
+    RETURNING c.response_count INTO accepted;
+
+    IF accepted IS NULL THEN
+        -- PostgREST turns SQLSTATE PTxxx into HTTP status xxx
+        RAISE EXCEPTION 'Survey % has reached its response limit', p_survey_id USING ERRCODE = 'PT402';
+    END IF;
+
+    merged := merged || COALESCE(p_answers, '{}'::jsonb);
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'question_id', e.key, 'answer', e.value, 'submitted_at', submitted_text
+    )), '[]'::jsonb) INTO answer_list
+    FROM jsonb_each(merged) e;
+
+    UPDATE surveys
+    SET responses = COALESCE(responses, '[]'::jsonb) || jsonb_build_array(jsonb_build_object(
+        'answers', answer_list, 'submitted_at', submitted_text, 'is_anonymous', true
+    ))
+    WHERE id = p_survey_id AND is_active
+    RETURNING jsonb_array_length(responses) INTO pos;
+
+    IF pos IS NULL THEN
+        RAISE EXCEPTION 'Survey % not found or not accepting responses', p_survey_id USING ERRCODE = 'P0002';
+    END IF;
+
+    IF p_token IS NOT NULL THEN
+        UPDATE response_drafts_submitted SET position = pos WHERE token = p_token;
+        DELETE FROM response_draft_deltas WHERE token = p_token;
+    END IF;
+    RETURN jsonb_build_object('position', pos, 'answers', answer_list, 'duplicate', false);
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.submit_survey_response(UUID, TEXT, JSONB) FROM PUBLIC, anon, authenticated;
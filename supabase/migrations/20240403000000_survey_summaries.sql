@@ -0,0 +1,79 @@
+-- Per-survey summaries for the dashboard list, served without reading
+-- the questions or responses JSONB of any survey.
+
+-- Question count is computed when questions are written
+ALTER TABLE public.surveys
+    ADD COLUMN question_count INTEGER GENERATED ALWAYS AS (
+        CASE WHEN jsonb_typeof(questions) = 'array' THEN jsonb_array_length(questions) ELSE 0 END
+    ) STORED;
+
+-- Keyset pagination walks (created_by, created_at, id); id breaks ties
+UPDATE public.surveys SET created_at = now() WHERE created_at IS NULL;
+ALTER TABLE public.surveys ALTER COLUMN created_at SET NOT NULL;
+CREATE INDEX idx_surveys_created_by_created_at ON public.surveys(created_by, created_at, id);
+
+-- Time of the latest accepted response, kept next to the response counter
+ALTER TABLE public.survey_response_counters ADD COLUMN last_response_at TIMESTAMPTZ;
+
+UPDATE public.survey_response_counters c
+SET last_response_at = CASE WHEN t.value ~ '^\d{4}-\d{2}-\d{2}T' THEN t.value::timestamptz END
+FROM (
+    SELECT id, COALESCE(
+        responses -> -1 ->> 'submitted_at',
+        responses -> -1 ->> 'timestamp',
+        responses -> -1 -> 0 ->> 'submitted_at'
+    ) AS value
+    FROM public.surveys
+    WHERE jsonb_typeof(responses) = 'array' AND jsonb_array_length(responses) > 0
+) t
+WHERE c.survey_id = t.id;
+
+-- submit_survey_response bumps the counter for every accepted response
+CREATE OR REPLACE FUNCTION public.touch_last_response_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.last_response_at := now();
+    RETURN NEW;
+END;
+$$;
+
+CREATE TRIGGER survey_response_counters_last_response
+BEFORE INSERT OR UPDATE OF response_count ON public.survey_response_counters
+FOR EACH ROW EXECUTE FUNCTION public.touch_last_response_at();
+
+-- One page of the caller's surveys, newest first. Pass the created_at and
+-- id of the last row of the previous page to get the next one.
+CREATE OR REPLACE FUNCTION public.list_survey_summaries(
+    p_limit INTEGER DEFAULT 20,
+    p_before_created_at TIMESTAMPTZ DEFAULT NULL,
+    p_before_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    title TEXT,
+    description TEXT,
+    is_active BOOLEAN,
+    created_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ,
+    question_count INTEGER,
+    response_count INTEGER,
+    last_response_at TIMESTAMPTZ
+)
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS $$
+    SELECT s.id, s.title, s.description, s.is_active, s.created_at, s.updated_at, s.question_count,
+           COALESCE(c.response_count, 0), c.last_response_at
+    FROM surveys s
+    LEFT JOIN survey_response_counters c ON c.survey_id = s.id
+    WHERE s.created_by = auth.uid()
+      AND (p_before_created_at IS NULL OR (s.created_at, s.id) < (p_before_created_at, p_before_id))
+    ORDER BY s.created_at DESC, s.id DESC
+    LIMIT LEAST(GREATEST(COALESCE(p_limit, 20), 1), 1000);
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.list_survey_summaries(INTEGER, TIMESTAMPTZ, UUID) FROM PUBLIC, anon;
+GRANT EXECUTE ON FUNCTION public.list_survey_summaries(INTEGER, TIMESTAMPTZ, UUID) TO authenticated;
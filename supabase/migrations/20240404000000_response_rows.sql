@@ -0,0 +1,196 @@
+-- One row per response in "680da8fd0ef55179cf75685a_responses", next to
+-- the surveys.responses arrays. Existing arrays are copied over by
+-- src/backend/backfill_responses.py (backfill_response_rows below); new
+-- and removed responses are mirrored by a trigger on surveys, so both
+-- models stay in step until readers have moved to the rows.
+ALTER TABLE public."680da8fd0ef55179cf75685a_responses"
+    -- 1-based index of the response in surveys.responses
+    ADD COLUMN position INTEGER,
+    ADD COLUMN submitted_at TIMESTAMPTZ,
+    -- The response object without its answers (is_anonymous, user_id, ...)
+    ADD COLUMN respondent JSONB;
+
+-- Rows are identified by their place in the array, so every copy is idempotent
+ALTER TABLE public."680da8fd0ef55179cf75685a_responses"
+    ADD CONSTRAINT responses_survey_position_key UNIQUE (survey_id, position);
+
+ALTER TABLE public."680da8fd0ef55179cf75685a_responses" ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Owners can read their survey response rows"
+ON public."680da8fd0ef55179cf75685a_responses"
+FOR SELECT
+TO authenticated
+USING (EXISTS (SELECT 1 FROM public.surveys s WHERE s.id = survey_id AND s.created_by = auth.uid()));
+
+-- NULL instead of an error for timestamps written by old clients
+CREATE OR REPLACE FUNCTION public.try_timestamptz(p_value TEXT)
+RETURNS TIMESTAMPTZ
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+BEGIN
+    IF p_value IS NULL OR p_value !~ '^\d{4}-\d{2}-\d{2}' THEN
+        RETURN NULL;
+    END IF;
+    RETURN p_value::timestamptz;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$;
+
+-- Copy responses p_from..p_to (1-based, inclusive) of one survey's array
+-- with a single multi-row INSERT; rows that already exist are skipped.
+-- Returns the number of rows inserted.
+CREATE OR REPLACE FUNCTION public.insert_response_rows(
+    p_survey_id UUID,
+    p_responses JSONB,
+    p_from INTEGER,
+    p_to INTEGER
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    inserted INTEGER;
+BEGIN
+    INSERT INTO "680da8fd0ef55179cf75685a_responses" (survey_id, position, answers, submitted_at, respondent, created_at)
+    SELECT p_survey_id, g.position,
+           -- Stored responses are {answers: [...], ...} or, from old clients, a bare list of answers
+           CASE WHEN jsonb_typeof(r.value) = 'object' THEN COALESCE(r.value -> 'answers', '[]'::jsonb) ELSE r.value END,
+           r.submitted_at,
+           CASE WHEN jsonb_typeof(r.value) = 'object' THEN r.value - 'answers' END,
+           COALESCE(r.submitted_at, now())
+    FROM generate_series(p_from, p_to) AS g(position)
+    CROSS JOIN LATERAL (
+        SELECT p_responses -> (g.position - 1) AS value,
+               try_timestamptz(COALESCE(
+                   p_responses -> (g.position - 1) ->> 'submitted_at',
+                   p_responses -> (g.position - 1) ->> 'timestamp',
+                   p_responses -> (g.position - 1) -> 'answers' -> 0 ->> 'submitted_at',
+                   p_responses -> (g.position - 1) -> 0 ->> 'submitted_at'
+               )) AS submitted_at
+    ) r
+    WHERE r.value IS NOT NULL AND r.value <> 'null'::jsonb
+    ON CONFLICT (survey_id, position) DO NOTHING;
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$;
+
+-- Dual write: whatever changes surveys.responses (submit_survey_response,
+-- owners editing their survey), appended responses get their rows and
+-- truncated ones lose them.
+CREATE OR REPLACE FUNCTION public.mirror_survey_responses()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    old_count INTEGER := 0;
+    new_count INTEGER := 0;
+BEGIN
+    IF TG_OP = 'UPDATE' AND jsonb_typeof(OLD.responses) = 'array' THEN
+        old_count := jsonb_array_length(OLD.responses);
+    END IF;
+    IF jsonb_typeof(NEW.responses) = 'array' THEN
+        new_count := jsonb_array_length(NEW.responses);
+    END IF;
+
+    IF new_count < old_count THEN
+        DELETE FROM "680da8fd0ef55179cf75685a_responses" WHERE survey_id = NEW.id AND position > new_count;
+    ELSIF new_count > old_count THEN
+        PERFORM insert_response_rows(NEW.id, NEW.responses, old_count + 1, new_count);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER surveys_mirror_responses
+AFTER INSERT OR UPDATE OF responses ON public.surveys
+FOR EACH ROW EXECUTE FUNCTION public.mirror_survey_responses();
+
+-- One bounded step of the backfill: copies at most p_max_rows responses,
+-- looking at most at p_max_surveys surveys, starting after the cursor
+-- (survey id, position) returned by the previous step.
+CREATE OR REPLACE FUNCTION public.backfill_response_rows(
+    p_after_survey UUID DEFAULT NULL,
+    p_after_position INTEGER DEFAULT 0,
+    p_max_rows INTEGER DEFAULT 5000,
+    p_max_surveys INTEGER DEFAULT 500
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    s RECORD;
+    budget INTEGER := GREATEST(p_max_rows, 1);
+    response_count INTEGER;
+    first_position INTEGER;
+    last_position INTEGER;
+    cursor_survey UUID := p_after_survey;
+    cursor_position INTEGER := COALESCE(p_after_position, 0);
+    scanned INTEGER := 0;
+    inserted INTEGER := 0;
+    surveys_seen INTEGER := 0;
+    done BOOLEAN := true;
+BEGIN
+    FOR s IN
+        SELECT id, responses FROM surveys
+        WHERE p_after_survey IS NULL OR id >= p_after_survey
+        ORDER BY id
+        -- The cursor survey, p_max_surveys more, and one to tell whether any are left
+        LIMIT GREATEST(p_max_surveys, 1) + 2
+    LOOP
+        IF s.id IS DISTINCT FROM p_after_survey THEN
+            -- The survey under the cursor does not count, so every step moves on
+            IF surveys_seen = GREATEST(p_max_surveys, 1) THEN
+                done := false;
+                EXIT;
+            END IF;
+            surveys_seen := surveys_seen + 1;
+        END IF;
+
+        response_count := CASE WHEN jsonb_typeof(s.responses) = 'array' THEN jsonb_array_length(s.responses) ELSE 0 END;
+        first_position := CASE WHEN s.id = p_after_survey THEN COALESCE(p_after_position, 0) ELSE 0 END;
+        last_position := LEAST(response_count, first_position + budget);
+        IF last_position > first_position THEN
+            inserted := inserted + insert_response_rows(s.id, s.responses, first_position + 1, last_position);
+            scanned := scanned + last_position - first_position;
+            budget := budget - (last_position - first_position);
+        END IF;
+        cursor_survey := s.id;
+        cursor_position := GREATEST(last_position, first_position);
+        IF last_position < response_count THEN
+            -- Out of budget in the middle of this survey
+            done := false;
+            EXIT;
+        END IF;
+    END LOOP;
+
+    RETURN jsonb_build_object(
+        'survey', cursor_survey, 'position', cursor_position,
+        'scanned', scanned, 'inserted', inserted, 'done', done
+    );
+END;
+$$;
+
+-- Responses to copy in total, for progress and ETA; reads the counters
+-- maintained by submit_survey_response instead of every array
+CREATE OR REPLACE FUNCTION public.response_backfill_total()
+RETURNS BIGINT
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    SELECT COALESCE(SUM(response_count), 0) FROM survey_response_counters;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.insert_response_rows(UUID, JSONB, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.backfill_response_rows(UUID, INTEGER, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.response_backfill_total() FROM PUBLIC, anon, authenticated;
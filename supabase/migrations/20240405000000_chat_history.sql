@@ -0,0 +1,49 @@
+-- Conversations with the survey agent, persisted by the backend
+-- (src/backend/chat_history.py) into the chats/messages tables.
+
+-- Agent conversations are keyed by the x-session-id the frontend sends;
+-- the owner is only known when the caller is signed in
+ALTER TABLE public."680da8fd0ef55179cf75685a_chats"
+    ALTER COLUMN user_id DROP NOT NULL,
+    ADD COLUMN session_id TEXT;
+
+CREATE INDEX idx_chats_session_id ON public."680da8fd0ef55179cf75685a_chats"(session_id, created_at);
+
+-- Turn order within a chat; messages of one batch share created_at
+ALTER TABLE public."680da8fd0ef55179cf75685a_messages" ADD COLUMN seq INTEGER;
+
+UPDATE public."680da8fd0ef55179cf75685a_messages" m
+SET seq = n.seq
+FROM (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY created_at, id) - 1 AS seq
+    FROM public."680da8fd0ef55179cf75685a_messages"
+) n
+WHERE m.id = n.id;
+
+ALTER TABLE public."680da8fd0ef55179cf75685a_messages" ALTER COLUMN seq SET NOT NULL;
+
+-- History pages walk this index backwards from a chat's latest message. It
+-- stands in for an index on (chat_id, created_at): seq follows created_at,
+-- but unlike created_at it is unique, so it is a stable cursor. Retried
+-- batches also insert nothing twice.
+ALTER TABLE public."680da8fd0ef55179cf75685a_messages"
+    ADD CONSTRAINT messages_chat_seq_key UNIQUE (chat_id, seq);
+
+-- Only the backend (service role) writes; signed-in owners may read their chats
+ALTER TABLE public."680da8fd0ef55179cf75685a_chats" ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public."680da8fd0ef55179cf75685a_messages" ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Owners can read their chats"
+ON public."680da8fd0ef55179cf75685a_chats"
+FOR SELECT
+TO authenticated
+USING (user_id = auth.uid());
+
+CREATE POLICY "Owners can read their chat messages"
+ON public."680da8fd0ef55179cf75685a_messages"
+FOR SELECT
+TO authenticated
+USING (EXISTS (
+    SELECT 1 FROM public."680da8fd0ef55179cf75685a_chats" c
+    WHERE c.id = chat_id AND c.user_id = auth.uid()
+));
@@ -0,0 +1,89 @@
+-- Submits the backend's screening (src/backend/response_screening.py)
+-- found suspicious: bursts from one client, repeated or near-duplicate
+-- answers, implausibly fast completion. They are held here instead of
+-- being appended to surveys.responses, and do not count against the
+-- plan's response limit until the survey owner releases them.
+CREATE TABLE public.response_quarantine (
+    id BIGSERIAL PRIMARY KEY,
+    survey_id UUID NOT NULL REFERENCES public.surveys(id) ON DELETE CASCADE,
+    -- Respondent draft token, merged with the answers on release
+    token TEXT,
+    answers JSONB NOT NULL DEFAULT '{}'::jsonb,
+    reasons TEXT[] NOT NULL,
+    fingerprint TEXT NOT NULL,
+    elapsed_ms INTEGER,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    -- A retried submit of a held draft is held once
+    UNIQUE (survey_id, token)
+);
+
+CREATE INDEX idx_response_quarantine_survey ON public.response_quarantine(survey_id, id);
+
+-- The backend (service role) writes; owners may read what is held for their surveys
+ALTER TABLE public.response_quarantine ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Owners can read quarantined responses"
+ON public.response_quarantine
+FOR SELECT
+TO authenticated
+USING (EXISTS (
+    SELECT 1 FROM public.surveys s WHERE s.id = survey_id AND s.created_by = auth.uid()
+));
+
+-- Accept a held response: submitted exactly as it was (draft merged,
+-- response limit checked), then removed from the quarantine. Returns
+-- submit_survey_response's result.
+CREATE OR REPLACE FUNCTION public.release_quarantined_response(p_survey_id UUID, p_id BIGINT)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    q response_quarantine%ROWTYPE;
+    result JSONB;
+BEGIN
+    SELECT r.* INTO q
+    FROM response_quarantine r
+    JOIN surveys s ON s.id = r.survey_id
+    WHERE r.id = p_id AND r.survey_id = p_survey_id AND s.created_by = auth.uid()
+    FOR UPDATE OF r;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Quarantined response % not found', p_id USING ERRCODE = 'P0002';
+    END IF;
+
+    result := submit_survey_response(q.survey_id, q.token, q.answers);
+    DELETE FROM response_quarantine WHERE id = p_id;
+    RETURN result;
+END;
+$$;
+
+-- Reject a held response for good
+CREATE OR REPLACE FUNCTION public.discard_quarantined_response(p_survey_id UUID, p_id BIGINT)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    q response_quarantine%ROWTYPE;
+BEGIN
+    DELETE FROM response_quarantine r
+    USING surveys s
+    WHERE r.id = p_id AND r.survey_id = p_survey_id AND s.id = r.survey_id AND s.created_by = auth.uid()
+    RETURNING r.* INTO q;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Quarantined response % not found', p_id USING ERRCODE = 'P0002';
+    END IF;
+    IF q.token IS NOT NULL THEN
+        DELETE FROM response_draft_deltas WHERE token = q.token;
+    END IF;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.release_quarantined_response(UUID, BIGINT) FROM PUBLIC, anon;
+REVOKE EXECUTE ON FUNCTION public.discard_quarantined_response(UUID, BIGINT) FROM PUBLIC, anon;
+GRANT EXECUTE ON FUNCTION public.release_quarantined_response(UUID, BIGINT) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.discard_quarantined_response(UUID, BIGINT) TO authenticated;
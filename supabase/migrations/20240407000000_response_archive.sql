@@ -0,0 +1,103 @@
+-- Responses of closed surveys move out of surveys.responses into
+-- columnar segment files written by src/backend/archive_responses.py
+-- (see src/backend/response_archive.py). The survey keeps the number of
+-- archived responses; readers put them in front of the hot array.
+ALTER TABLE public.surveys
+    ADD COLUMN responses_archived INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN responses_archived_at TIMESTAMPTZ;
+
+-- Empty the array of a closed survey once its p_count responses are
+-- safely in a segment. Fails if the survey was reopened or its responses
+-- changed since the archiver read them, so nothing unarchived is lost.
+-- The mirror trigger drops the survey's response rows with the array;
+-- responses submitted after a reopen start again at position 1 there.
+-- Returns the survey's archived response count.
+CREATE OR REPLACE FUNCTION public.archive_survey_responses(p_survey_id UUID, p_count INTEGER)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    total INTEGER;
+BEGIN
+    UPDATE surveys
+    SET responses = '[]'::jsonb,
+        responses_archived = responses_archived + p_count,
+        responses_archived_at = now()
+    WHERE id = p_survey_id
+      AND NOT is_active
+      AND p_count > 0
+      AND jsonb_typeof(responses) = 'array'
+      AND jsonb_array_length(responses) = p_count
+    RETURNING responses_archived INTO total;
+
+    IF total IS NULL THEN
+        RAISE EXCEPTION 'Survey % is open or its responses changed', p_survey_id USING ERRCODE = 'P0002';
+    END IF;
+    RETURN total;
+END;
+$$;
+
+-- What the response data costs in the hot tables, in bytes
+CREATE OR REPLACE FUNCTION public.hot_storage_sizes()
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    SELECT jsonb_build_object(
+        'surveysTable', pg_total_relation_size('public.surveys'),
+        'responsesIndex', pg_relation_size('public.idx_surveys_responses'),
+        'questionsIndex', pg_relation_size('public.idx_surveys_questions'),
+        'responseRows', pg_total_relation_size('public."680da8fd0ef55179cf75685a_responses"'),
+        'responsesColumn', (SELECT COALESCE(SUM(pg_column_size(responses)), 0) FROM surveys),
+        'hotResponses', (SELECT COALESCE(SUM(jsonb_array_length(responses)), 0) FROM surveys
+                         WHERE jsonb_typeof(responses) = 'array'),
+        'archivedResponses', (SELECT COALESCE(SUM(responses_archived), 0) FROM surveys)
+    );
+$$;
+
+-- Time p_samples appends of a small response to random open surveys,
+-- each rolled back, and return {samples, p50Ms, p95Ms}. Measures what a
+-- submit pays for the surveys row, its GIN indexes and the mirror trigger.
+CREATE OR REPLACE FUNCTION public.probe_response_append(p_samples INTEGER DEFAULT 50)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    s RECORD;
+    started TIMESTAMPTZ;
+    timings DOUBLE PRECISION[] := '{}';
+BEGIN
+    FOR s IN SELECT id FROM surveys WHERE is_active ORDER BY random() LIMIT GREATEST(p_samples, 1) LOOP
+        started := clock_timestamp();
+        BEGIN
+            UPDATE surveys
+            SET responses = COALESCE(responses, '[]'::jsonb)
+                || jsonb_build_array(jsonb_build_object('answers', '[]'::jsonb, 'is_anonymous', true))
+            WHERE id = s.id;
+            RAISE EXCEPTION 'probe' USING ERRCODE = 'P0001';
+        EXCEPTION WHEN raise_exception THEN
+            NULL;
+        END;
+        timings := timings || (EXTRACT(EPOCH FROM clock_timestamp() - started) * 1000)::double precision;
+    END LOOP;
+
+    RETURN (
+        SELECT jsonb_build_object(
+            'samples', COUNT(*),
+            'p50Ms', percentile_cont(0.5) WITHIN GROUP (ORDER BY t),
+            'p95Ms', percentile_cont(0.95) WITHIN GROUP (ORDER BY t)
+        )
+        FROM unnest(timings) AS t
+    );
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.archive_survey_responses(UUID, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.hot_storage_sizes() FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.probe_response_append(INTEGER) FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,22 @@
+-- updated_at is the version stamp of a survey's definition: every API
+-- worker caches definitions (src/backend/survey_definitions.py) and
+-- compares the cached updated_at with this one before serving an entry
+-- again, so an edit reaches all workers without a webhook. Clients do
+-- not set it themselves, so bump it whenever a definition column
+-- changes. Response submits and archiving leave it alone.
+CREATE OR REPLACE FUNCTION public.touch_survey_definition()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF (NEW.title, NEW.description, NEW.questions, NEW.is_active)
+       IS DISTINCT FROM (OLD.title, OLD.description, OLD.questions, OLD.is_active) THEN
+        NEW.updated_at := greatest(now(), OLD.updated_at + interval '1 microsecond');
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+CREATE TRIGGER surveys_touch_definition
+BEFORE UPDATE OF title, description, questions, is_active ON public.surveys
+FOR EACH ROW EXECUTE FUNCTION public.touch_survey_definition();
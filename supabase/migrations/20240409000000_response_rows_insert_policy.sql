@@ -0,0 +1,19 @@
+-- SurveyResponsePage (/s/:id/response) still inserts its responses into
+-- "680da8fd0ef55179cf75685a_responses" directly, for the surveys in
+-- "680da8fd0ef55179cf75685a_surveys". Row level security on that table
+-- (20240404000000_response_rows.sql) rejected those inserts. Allow them
+-- again for open surveys, but only as plain rows: position and
+-- respondent belong to the rows mirrored from surveys.responses, which
+-- clients must not be able to forge.
+CREATE POLICY "Anyone can answer an active survey"
+ON public."680da8fd0ef55179cf75685a_responses"
+FOR INSERT
+TO anon, authenticated
+WITH CHECK (
+    position IS NULL
+    AND respondent IS NULL
+    AND EXISTS (
+        SELECT 1 FROM public."680da8fd0ef55179cf75685a_surveys" s
+        WHERE s.id = survey_id AND s.status = 'active'
+    )
+);
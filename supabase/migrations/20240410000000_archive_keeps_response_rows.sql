@@ -0,0 +1,132 @@
+-- Archiving a survey (20240407000000_response_archive.sql) empties
+-- surveys.responses, and the mirror trigger used to drop every response
+-- row of the survey with it. The segment files are local to the host
+-- that ran the archiver, so the rows are the copy every other host can
+-- read. From here on the rows stay:
+--   * the mirror skips the delete when responses_archived grows;
+--   * row positions count the archived responses first, so responses
+--     appended after a reopen follow them instead of colliding at 1;
+--   * archive_survey_responses refuses to empty an array whose
+--     responses are not all in the rows table (run
+--     src/backend/backfill_responses.py first).
+
+-- Copy responses p_from..p_to (1-based, inclusive, in the hot array) of
+-- one survey with a single multi-row INSERT, after the survey's archived
+-- responses; rows that already exist are skipped. Returns the number of
+-- rows inserted.
+CREATE OR REPLACE FUNCTION public.insert_response_rows(
+    p_survey_id UUID,
+    p_responses JSONB,
+    p_from INTEGER,
+    p_to INTEGER
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    archived INTEGER;
+    inserted INTEGER;
+BEGIN
+    SELECT COALESCE(responses_archived, 0) INTO archived FROM surveys WHERE id = p_survey_id;
+
+    INSERT INTO "680da8fd0ef55179cf75685a_responses" (survey_id, position, answers, submitted_at, respondent, created_at)
+    SELECT p_survey_id, COALESCE(archived, 0) + g.position,
+           -- Stored responses are {answers: [...], ...} or, from old clients, a bare list of answers
+           CASE WHEN jsonb_typeof(r.value) = 'object' THEN COALESCE(r.value -> 'answers', '[]'::jsonb) ELSE r.value END,
+           r.submitted_at,
+           CASE WHEN jsonb_typeof(r.value) = 'object' THEN r.value - 'answers' END,
+           COALESCE(r.submitted_at, now())
+    FROM generate_series(p_from, p_to) AS g(position)
+    CROSS JOIN LATERAL (
+        SELECT p_responses -> (g.position - 1) AS value,
+               try_timestamptz(COALESCE(
+                   p_responses -> (g.position - 1) ->> 'submitted_at',
+                   p_responses -> (g.position - 1) ->> 'timestamp',
+                   p_responses -> (g.position - 1) -> 'answers' -> 0 ->> 'submitted_at',
+                   p_responses -> (g.position - 1) -> 0 ->> 'submitted_at'
+               )) AS submitted_at
+    ) r
+    WHERE r.value IS NOT NULL AND r.value <> 'null'::jsonb
+    ON CONFLICT (survey_id, position) DO NOTHING;
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$;
+
+-- Dual write, as before, except that archiving (responses_archived
+-- growing while the array empties) leaves the rows alone
+CREATE OR REPLACE FUNCTION public.mirror_survey_responses()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    old_count INTEGER := 0;
+    new_count INTEGER := 0;
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.responses_archived > OLD.responses_archived THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'UPDATE' AND jsonb_typeof(OLD.responses) = 'array' THEN
+        old_count := jsonb_array_length(OLD.responses);
+    END IF;
+    IF jsonb_typeof(NEW.responses) = 'array' THEN
+        new_count := jsonb_array_length(NEW.responses);
+    END IF;
+
+    IF new_count < old_count THEN
+        DELETE FROM "680da8fd0ef55179cf75685a_responses"
+        WHERE survey_id = NEW.id AND position > NEW.responses_archived + new_count;
+    ELSIF new_count > old_count THEN
+        PERFORM insert_response_rows(NEW.id, NEW.responses, old_count + 1, new_count);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- As before, and fails (SQLSTATE P0001, HTTP 400) while the rows table
+-- is missing any of the survey's responses, so the segment is never the
+-- only copy
+CREATE OR REPLACE FUNCTION public.archive_survey_responses(p_survey_id UUID, p_count INTEGER)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    archived INTEGER;
+    mirrored INTEGER;
+    total INTEGER;
+BEGIN
+    SELECT responses_archived INTO archived FROM surveys WHERE id = p_survey_id FOR UPDATE;
+    SELECT COUNT(*) INTO mirrored
+    FROM "680da8fd0ef55179cf75685a_responses"
+    WHERE survey_id = p_survey_id AND position BETWEEN 1 AND COALESCE(archived, 0) + p_count;
+
+    IF archived IS NOT NULL AND mirrored < archived + p_count THEN
+        RAISE EXCEPTION 'Survey % has % of % responses in the rows table; run backfill_responses.py first',
+            p_survey_id, mirrored, archived + p_count USING ERRCODE = 'P0001';
+    END IF;
+
+    UPDATE surveys
+    SET responses = '[]'::jsonb,
+        responses_archived = responses_archived + p_count,
+        responses_archived_at = now()
+    WHERE id = p_survey_id
+      AND NOT is_active
+      AND p_count > 0
+      AND jsonb_typeof(responses) = 'array'
+      AND jsonb_array_length(responses) = p_count
+    RETURNING responses_archived INTO total;
+
+    IF total IS NULL THEN
+        RAISE EXCEPTION 'Survey % is open or its responses changed', p_survey_id USING ERRCODE = 'P0002';
+    END IF;
+    RETURN total;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.archive_survey_responses(UUID, INTEGER) FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,91 @@
+-- submit_survey_response appended to surveys.responses, which rewrote
+-- the survey's whole array (and its GIN index entries) on every submit.
+-- It now inserts one row into "680da8fd0ef55179cf75685a_responses"
+-- instead; surveys.responses keeps what it already holds.
+--
+-- Positions are survey-wide and 1-based: archived responses first, then
+-- the array, then rows written here. The survey's response counter is
+-- bumped in the same transaction and its row lock serializes submits to
+-- one survey, so the new position is the counter, or one past the
+-- highest existing row if the rows are ahead of it. Readers
+-- (src/backend/survey_responses.py) put archived responses, the array
+-- and the rows after it together.
+CREATE OR REPLACE FUNCTION public.submit_survey_response(
+    p_survey_id UUID,
+    p_token TEXT DEFAULT NULL,
+    p_answers JSONB DEFAULT '{}'::jsonb
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    merged JSONB := '{}'::jsonb;
+    answer_list JSONB;
+    pos INTEGER;
+    accepting BOOLEAN;
+    response_limit INTEGER;
+    accepted INTEGER;
+    submitted_text TEXT := to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"');
+BEGIN
+    IF p_token IS NOT NULL THEN
+        INSERT INTO response_drafts_submitted (token, survey_id) VALUES (p_token, p_survey_id)
+        ON CONFLICT (token) DO NOTHING;
+        IF NOT FOUND THEN
+            SELECT s.position INTO pos FROM response_drafts_submitted s WHERE s.token = p_token;
+            RETURN jsonb_build_object('position', pos, 'answers', NULL, 'duplicate', true);
+        END IF;
+
+        SELECT COALESCE(jsonb_object_agg(e.key, e.value ORDER BY d.seq), '{}'::jsonb) INTO merged
+        FROM response_draft_deltas d, jsonb_each(d.delta) e
+        WHERE d.token = p_token AND d.survey_id = p_survey_id;
+    END IF;
+
+    SELECT s.is_active, l.max_responses_per_survey INTO accepting, response_limit
+    FROM surveys s
+    LEFT JOIN account_plans a ON a.user_id = s.created_by
+    JOIN plan_limits l ON l.plan = COALESCE(a.plan, 'free')
+    WHERE s.id = p_survey_id;
+
+    IF accepting IS NOT TRUE THEN
+        RAISE EXCEPTION 'Survey % not found or not accepting responses', p_survey_id USING ERRCODE = 'P0002';
+    END IF;
+
+    -- Count the response against the owner's plan. The conditional upsert
+    -- locks the survey's counter row, so concurrent submits cannot both
+    -- take the last slot (or the same position).
+    INSERT INTO survey_response_counters AS c (survey_id, response_count) VALUES (p_survey_id, 1)
+    ON CONFLICT (survey_id) DO UPDATE SET response_count = c.response_count + 1, updated_at = now()
+    WHERE response_limit IS NULL OR c.response_count < response_limit
+    RETURNING c.response_count INTO accepted;
+
+    IF accepted IS NULL THEN
+        -- PostgREST turns SQLSTATE PTxxx into HTTP status xxx
+        RAISE EXCEPTION 'Survey % has reached its response limit', p_survey_id USING ERRCODE = 'PT402';
+    END IF;
+
+    merged := merged || COALESCE(p_answers, '{}'::jsonb);
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'question_id', e.key, 'answer', e.value, 'submitted_at', submitted_text
+    )), '[]'::jsonb) INTO answer_list
+    FROM jsonb_each(merged) e;
+
+    -- One index probe on (survey_id, position)
+    SELECT GREATEST(accepted, COALESCE(MAX(r.position), 0) + 1) INTO pos
+    FROM "680da8fd0ef55179cf75685a_responses" r
+    WHERE r.survey_id = p_survey_id;
+
+    INSERT INTO "680da8fd0ef55179cf75685a_responses" (survey_id, position, answers, submitted_at, respondent)
+    VALUES (p_survey_id, pos, answer_list, now(),
+            jsonb_build_object('submitted_at', submitted_text, 'is_anonymous', true));
+
+    IF p_token IS NOT NULL THEN
+        UPDATE response_drafts_submitted SET position = pos WHERE token = p_token;
+        DELETE FROM response_draft_deltas WHERE token = p_token;
+    END IF;
+    RETURN jsonb_build_object('position', pos, 'answers', answer_list, 'duplicate', false);
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.submit_survey_response(UUID, TEXT, JSONB) FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,37 @@
+-- The mirror trigger kept rows in step with surveys.responses by
+-- position: a shrinking array only lost its rows past the new length, so
+-- removing a response from the middle left every later row one position
+-- off. Since submit_survey_response writes rows directly
+-- (20240411000000_submit_response_rows.sql), nothing appends to the
+-- array either, and an append would take positions that belong to rows.
+-- Updates may therefore no longer change the array's length, except for
+-- archiving, which empties it and leaves the rows in place.
+CREATE OR REPLACE FUNCTION public.mirror_survey_responses()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    old_count INTEGER := 0;
+    new_count INTEGER := 0;
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.responses_archived > OLD.responses_archived THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'UPDATE' AND jsonb_typeof(OLD.responses) = 'array' THEN
+        old_count := jsonb_array_length(OLD.responses);
+    END IF;
+    IF jsonb_typeof(NEW.responses) = 'array' THEN
+        new_count := jsonb_array_length(NEW.responses);
+    END IF;
+
+    IF TG_OP = 'UPDATE' AND new_count <> old_count THEN
+        RAISE EXCEPTION 'Responses of survey % cannot be added or removed by editing surveys.responses', NEW.id
+            USING ERRCODE = 'P0001', HINT = 'New responses go through submit_survey_response.';
+    ELSIF TG_OP = 'INSERT' AND new_count > 0 THEN
+        PERFORM insert_response_rows(NEW.id, NEW.responses, 1, new_count);
+    END IF;
+    RETURN NULL;
+END;
+$$;